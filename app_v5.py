@@ -20,31 +20,1132 @@
 # 3. Vá a "Configurações do Projeto" -> "Contas de Serviço" -> "Gerir todas as chaves privadas de conta de serviço".
 # 4. Crie uma nova chave privada em formato JSON.
 # 5. Guarde o ficheiro JSON na mesma pasta que este script e renomeie-o para 'firebase-service-account.json'.
+#
+# Para correr sem Firebase (desenvolvimento ou testes de carga), use um
+# armazenamento local:
+#   REQUEST_STORE=sqlite python nome_do_seu_ficheiro.py
+#   REQUEST_STORE=jsonl python nome_do_seu_ficheiro.py
+#
+# Os stores de pedidos estão em stores.py e a fila de escrita diferida em
+# write_behind.py, na mesma pasta. Testes (pip install -r requirements-dev.txt):
+#   python -m pytest -q
 
+import time
+import math
+# Início da importação do módulo, para o controlo do orçamento de tempo de arranque
+_IMPORT_STARTED = time.perf_counter()
+
+import io
+import re
 import os
+import gzip
+import zlib
+import csv
 import json
-import base64
+import logging
+import contextlib
+import cProfile
+import inspect
+import queue
+import atexit
+import uuid
+import secrets
+import hashlib
+import sqlite3
+import shutil
+import subprocess
+import tempfile
+import threading
+import mimetypes
 import webbrowser
-from datetime import datetime
-from flask import Flask, request, render_template_string, redirect, url_for, session, make_response
-import firebase_admin
-from firebase_admin import credentials, firestore
-
-# ==================== INICIALIZAÇÃO DO FIREBASE ====================
-# Certifique-se de que o ficheiro 'firebase-service-account.json' está na mesma pasta.
-cred = credentials.Certificate('firebase-service-account.json')
-firebase_admin.initialize_app(cred)
-db = firestore.client()
+from datetime import datetime, timedelta, timezone
+import click
+from flask import Flask, Blueprint, current_app, Request, request, render_template, redirect, url_for, session, make_response, send_from_directory, send_file, abort, jsonify, flash, g, stream_with_context
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from jinja2 import DictLoader
+from markupsafe import Markup
+from werkzeug.datastructures import CallbackDict
+from werkzeug.exceptions import RequestEntityTooLarge
+from stores import (FIRESTORE_BATCH_LIMIT, APP_TIMEZONE, DISPLAY_TIMESTAMP_FORMAT, COUNTED_WRITES_PER_TRANSACTION,
+                    lock_file, created_at_of, order_key, json_request, json_default, decode_cursor, RequestFilters,
+                    summary_since, dashboard_summary, RequestStore, FirestoreRequestStore, RequestIndex,
+                    SegmentArchive, SimulatedLatencyStore, create_store)
+from write_behind import WriteQueueFullError, WriteBehindQueue
+# O firebase_admin (e o gRPC) só é importado quando o store Firestore é criado,
+# o que torna a importação do módulo rápida e possível sem credenciais.
 
+# Dependências opcionais, usadas apenas no build dos recursos estáticos
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
 # ==================== INICIALIZAÇÃO DO FLASK ====================
-app = Flask(__name__)
-# A chave secreta é necessária para usar sessões (para a autenticação do admin)
-app.secret_key = os.urandom(24)
+# A aplicação é criada pela fábrica create_app (no fim do ficheiro). As rotas,
+# os templates e os comandos são registados neste blueprint.
+bp = Blueprint("main", __name__, cli_group=None)
+logger = logging.getLogger(__name__)
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
 
 # Palavra-passe simples para o admin.
 # AVISO: NÃO USE ISTO EM PRODUÇÃO. Apenas para fins de demonstração.
 ADMIN_PASSWORD = "admin"
 
+# Número de pedidos mostrados por página no painel de administração.
+# Pode ser alterado com a variável de ambiente ADMIN_PAGE_SIZE ou, por pedido,
+# com o parâmetro ?per_page= (limitado a ADMIN_MAX_PAGE_SIZE).
+ADMIN_PAGE_SIZE = int(os.environ.get("ADMIN_PAGE_SIZE", "20"))
+ADMIN_MAX_PAGE_SIZE = 100
+# Pedidos lidos do armazenamento por página na exportação
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "500"))
+
+# ==================== MÉTRICAS ====================
+# Métricas em memória, expostas em formato Prometheus em /metrics:
+# - latência, número de pedidos e erros por rota;
+# - latência, número de operações e erros por operação do store;
+# - documentos lidos em cada carregamento do painel de administração;
+# - acertos e falhas da cache de páginas renderizadas.
+# Cada worker tem as suas próprias métricas (o Prometheus agrega-as por instância).
+# Se METRICS_TOKEN estiver definido, /metrics exige "Authorization: Bearer <token>".
+# Com PROFILE_SLOW_REQUESTS_MS, cada pedido é executado com o cProfile e os
+# pedidos mais lentos do que esse limite são gravados em PROFILE_DIR (.prof).
+
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+PROFILE_SLOW_REQUESTS_MS = float(os.environ.get("PROFILE_SLOW_REQUESTS_MS", "0"))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+# Limites (em segundos) dos intervalos dos histogramas de latência
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DOCUMENT_BUCKETS = (0, 1, 5, 10, 20, 50, 100, 250, 500, 1000)
+
+
+class Metric:
+    """
+    Contador ou histograma com etiquetas (labels), seguro entre threads.
+    """
+
+    def __init__(self, name, help_text, kind="counter", buckets=None):
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind
+        self.buckets = buckets
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry["buckets"][position] += 1
+            entry["sum"] += value
+            entry["count"] += 1
+
+    @staticmethod
+    def _labels(pairs):
+        if not pairs:
+            return ""
+        return "{%s}" % ",".join('%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                                 for name, value in pairs)
+
+    def render(self):
+        lines = ["# HELP %s %s" % (self.name, self.help_text), "# TYPE %s %s" % (self.name, self.kind)]
+        with self._lock:
+            items = sorted(self._values.items())
+            for key, value in items:
+                if self.kind != "histogram":
+                    lines.append("%s%s %s" % (self.name, self._labels(key), value))
+                    continue
+                for bound, count in zip(self.buckets, value["buckets"]):
+                    lines.append("%s_bucket%s %d" % (self.name, self._labels(key + (("le", bound),)), count))
+                lines.append("%s_bucket%s %d" % (self.name, self._labels(key + (("le", "+Inf"),)), value["count"]))
+                lines.append("%s_sum%s %f" % (self.name, self._labels(key), value["sum"]))
+                lines.append("%s_count%s %d" % (self.name, self._labels(key), value["count"]))
+        return "\n".join(lines)
+
+
+HTTP_LATENCY = Metric("probuilder_http_request_duration_seconds", "Duração dos pedidos HTTP por rota.",
+                      "histogram", LATENCY_BUCKETS)
+HTTP_REQUESTS = Metric("probuilder_http_requests_total", "Pedidos HTTP por rota, método e código de estado.")
+HTTP_ERRORS = Metric("probuilder_http_request_errors_total", "Pedidos HTTP com erro (5xx ou exceção) por rota.")
+STORE_LATENCY = Metric("probuilder_store_operation_duration_seconds", "Duração das operações do store.",
+                       "histogram", LATENCY_BUCKETS)
+STORE_OPERATIONS = Metric("probuilder_store_operations_total", "Operações do store por tipo.")
+STORE_ERRORS = Metric("probuilder_store_operation_errors_total", "Operações do store que falharam.")
+ADMIN_DOCUMENTS = Metric("probuilder_admin_page_documents", "Pedidos lidos em cada carregamento do painel.",
+                         "histogram", DOCUMENT_BUCKETS)
+PAGE_CACHE = Metric("probuilder_page_cache_total", "Acertos e falhas da cache de páginas renderizadas.")
+FORM_ADMISSION = Metric("probuilder_form_admission_total",
+                        "Submissões do formulário por resultado (accepted, rate_limited, duplicate, untrusted_proxy).")
+# Métricas instantâneas (gauges) calculadas no momento da recolha
+GAUGES = []
+
+METRICS = [HTTP_LATENCY, HTTP_REQUESTS, HTTP_ERRORS, STORE_LATENCY, STORE_OPERATIONS, STORE_ERRORS,
+           ADMIN_DOCUMENTS, PAGE_CACHE, FORM_ADMISSION]
+
+
+def gauge(name, help_text):
+    """
+    Regista uma função que devolve o valor atual de uma métrica instantânea
+    (ou None, se não se aplicar).
+    """
+    def decorator(function):
+        GAUGES.append((name, help_text, function))
+        return function
+    return decorator
+
+
+def render_metrics():
+    """
+    Todas as métricas em formato de texto Prometheus.
+    """
+    blocks = [metric.render() for metric in METRICS]
+    for name, help_text, function in GAUGES:
+        value = function()
+        if value is not None:
+            blocks.append("# HELP %s %s\n# TYPE %s gauge\n%s %s" % (name, help_text, name, name, value))
+    return "\n".join(blocks) + "\n"
+
+
+class InstrumentedStore:
+    """
+    Envolve um store e mede a duração, o número e os erros de cada operação.
+    """
+
+    def __init__(self, inner):
+        self.wrapped = inner
+
+    def __getattr__(self, name):
+        attr = getattr(self.wrapped, name)
+        if not callable(attr) or name.startswith("_") or name == "new_id":
+            return attr
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = attr(*args, **kwargs)
+            except Exception:
+                STORE_ERRORS.inc(operation=name)
+                self._record(name, started)
+                raise
+            if inspect.isgenerator(result):
+                # Geradores (ex.: iter_all): mede até serem consumidos
+                return self._timed_generator(name, started, result)
+            self._record(name, started)
+            return result
+        return timed
+
+    @staticmethod
+    def _record(name, started):
+        STORE_LATENCY.observe(time.perf_counter() - started, operation=name)
+        STORE_OPERATIONS.inc(operation=name)
+
+    def _timed_generator(self, name, started, generator):
+        try:
+            yield from generator
+        except Exception:
+            STORE_ERRORS.inc(operation=name)
+            raise
+        finally:
+            self._record(name, started)
+
+
+@bp.before_app_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+    if PROFILE_SLOW_REQUESTS_MS:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            return  # Outro perfilador já está ativo (outro pedido, noutra thread)
+        g.profiler = profiler
+
+
+@bp.after_app_request
+def _record_request(response):
+    started = g.pop("request_started", None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule else "(sem rota)"
+    HTTP_LATENCY.observe(elapsed, route=route, method=request.method)
+    HTTP_REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+    if response.status_code >= 500:
+        HTTP_ERRORS.inc(route=route, method=request.method)
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+        if elapsed * 1000 >= PROFILE_SLOW_REQUESTS_MS:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            name = "%s-%s-%dms.prof" % (datetime.now().strftime("%Y%m%d-%H%M%S"),
+                                        re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root", elapsed * 1000)
+            profiler.dump_stats(os.path.join(PROFILE_DIR, name))
+    return response
+
+
+@bp.teardown_app_request
+def _record_exception(exc):
+    # Exceções não tratadas: o after_request não chega a correr
+    if exc is not None and g.pop("request_started", None) is not None:
+        route = request.url_rule.rule if request.url_rule else "(sem rota)"
+        HTTP_ERRORS.inc(route=route, method=request.method)
+        HTTP_REQUESTS.inc(route=route, method=request.method, status=500)
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+
+
+@bp.route("/metrics")
+def metrics():
+    """
+    Rota com as métricas da aplicação em formato Prometheus.
+    """
+    if METRICS_TOKEN and request.headers.get("Authorization") != "Bearer " + METRICS_TOKEN:
+        abort(401)
+    return render_metrics(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+# ==================== ARMAZENAMENTO DOS PEDIDOS ====================
+# As rotas não acedem diretamente ao Firestore: usam um "store" com uma
+# interface comum (RequestStore). Existem três implementações:
+# - firestore: a coleção 'requests' do Firebase (predefinição, produção);
+# - sqlite:    uma base de dados SQLite local, indexada por estado, serviço e data;
+# - jsonl:     um registo local só de acréscimo (append-only) em formato JSONL,
+#              com índices em memória.
+# As implementações locais permitem correr e testar a carga da aplicação sem
+# credenciais do Firebase. A escolha é feita com a variável de ambiente
+# REQUEST_STORE e o ficheiro local com REQUEST_STORE_PATH. As implementações,
+# os contadores e a paginação por cursor estão em stores.py.
+
+REQUEST_STORE = os.environ.get("REQUEST_STORE", "firestore")
+REQUEST_STORE_PATH = os.environ.get("REQUEST_STORE_PATH")
+
+REQUEST_STORE_LATENCY = float(os.environ.get("REQUEST_STORE_LATENCY_MS", "0")) / 1000
+
+# O store é criado preguiçosamente, uma vez por processo: os canais gRPC do
+# Firestore não sobrevivem ao fork, por isso cada worker do gunicorn cria o seu
+# depois do fork (mesmo com --preload), no primeiro uso.
+_store = None
+_store_pid = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """
+    Devolve o store de pedidos deste processo, criando-o no primeiro uso.
+    """
+    global _store, _store_pid
+    if _store_pid != os.getpid():
+        with _store_lock:
+            if _store_pid != os.getpid():
+                new_store = create_store(REQUEST_STORE, REQUEST_STORE_PATH)
+                if REQUEST_STORE_LATENCY and REQUEST_STORE != "firestore":
+                    new_store = SimulatedLatencyStore(new_store, REQUEST_STORE_LATENCY)
+                _store, _store_pid = InstrumentedStore(new_store), os.getpid()
+    return _store
+
+
+def _forget_store_after_fork():
+    # O processo filho nunca deve usar (nem fechar) os canais do processo pai
+    global _store, _store_pid, store_ready
+    _store, _store_pid = None, None
+    store_ready = False
+
+
+os.register_at_fork(after_in_child=_forget_store_after_fork)
+
+
+@bp.cli.command("reindex-search")
+def reindex_search_command():
+    """Reconstrói o índice de pesquisa dos pedidos já guardados."""
+    count = get_store().reindex_search()
+    print("Indexados %d pedidos" % count)
+
+
+@bp.cli.command("reconcile-counters")
+@click.option("--days", default=30, show_default=True, type=click.IntRange(min=0),
+              help="Dias recentes cujos totais diários são recalculados.")
+def reconcile_counters_command(days):
+    """
+    Recalcula os contadores do resumo do painel e corrige os desvios
+    (no Firestore, com consultas de agregação).
+    """
+    deltas = get_store().reconcile_counters(days=days)
+    for key, delta in sorted(deltas.items()):
+        print("%-30s %+d" % (":".join(key), delta))
+    print("%d contadores corrigidos" % len(deltas))
+
+
+def _save_checkpoint(path, state):
+    # Escrita atómica: um ficheiro temporário substitui o anterior
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temporary = path + ".tmp"
+    with open(temporary, "w", encoding="utf-8") as handle:
+        json.dump(state, handle)
+    os.replace(temporary, path)
+
+
+@bp.cli.command("migrate-timestamps")
+@click.option("--batch-size", default=FIRESTORE_BATCH_LIMIT, show_default=True,
+              type=click.IntRange(1, FIRESTORE_BATCH_LIMIT),
+              help="Pedidos lidos e gravados por lote (máx. 500 no Firestore).")
+@click.option("--rate", default=200.0, show_default=True, type=click.FloatRange(min=0, min_open=True),
+              help="Máximo de pedidos processados por segundo.")
+@click.option("--checkpoint", default=os.path.join("data", "migrate-timestamps.json"), show_default=True,
+              help="Ficheiro com a posição da migração, para retomar se for interrompida.")
+@click.option("--restart", is_flag=True, help="Ignora o ficheiro de posição e começa do início.")
+@click.option("--dry-run", is_flag=True, help="Conta os pedidos a migrar sem gravar nada.")
+def migrate_timestamps_command(batch_size, rate, checkpoint, restart, dry_run):
+    """
+    Acrescenta created_at (Timestamp em UTC) aos pedidos antigos, a partir do
+    texto timestamp interpretado em APP_TIMEZONE.
+    Percorre a coleção por ordem de ID, em lotes; depois de cada lote grava a
+    posição em --checkpoint, pelo que pode ser interrompida e retomada.
+    """
+    batch_size = min(batch_size, FIRESTORE_BATCH_LIMIT)
+    state = {"after_id": None, "scanned": 0, "updated": 0, "skipped": 0, "done": False}
+    if not restart and not dry_run and os.path.exists(checkpoint):
+        with open(checkpoint, encoding="utf-8") as handle:
+            state = json.load(handle)
+        if state["done"]:
+            print("A migração já foi concluída (%s). Use --restart para repetir." % checkpoint)
+            return
+        print("A retomar depois do pedido %s (%d já lidos)" % (state["after_id"], state["scanned"]))
+    store = get_store()
+    while True:
+        started = time.monotonic()
+        page = store.scan_page(state["after_id"], batch_size, fields=("created_at", "timestamp"))
+        if not page:
+            break
+        updates = {}
+        for data in page:
+            if data.get("created_at"):
+                continue  # Já migrado (ou criado depois desta versão)
+            created_at = created_at_of(data)
+            if created_at is None:
+                state["skipped"] += 1  # Sem timestamp válido: fica para correção manual
+                logger.warning("Pedido %s sem timestamp válido: %r", data["id"], data.get("timestamp"))
+            else:
+                updates[data["id"]] = {"created_at": created_at}
+        if updates and not dry_run:
+            store.update_fields(updates)
+        state["after_id"] = page[-1]["id"]
+        state["scanned"] += len(page)
+        state["updated"] += len(updates)
+        if not dry_run:
+            _save_checkpoint(checkpoint, state)
+        print("%d lidos, %d %s, %d sem timestamp" % (state["scanned"], state["updated"],
+                                                      "a migrar" if dry_run else "migrados", state["skipped"]))
+        # Limite de débito: cada lote demora pelo menos len(page) / rate segundos
+        delay = len(page) / rate - (time.monotonic() - started)
+        if delay > 0:
+            time.sleep(delay)
+    state["done"] = True
+    if not dry_run:
+        _save_checkpoint(checkpoint, state)
+    print("Migração %s: %d pedidos lidos, %d %s." % ("simulada" if dry_run else "concluída", state["scanned"],
+                                                     state["updated"], "a migrar" if dry_run else "migrados"))
+
+
+# ==================== Arquivo de Pedidos Antigos ====================
+# Para que a coleção de pedidos não cresça indefinidamente, os pedidos antigos
+# passam para um arquivo, consultado apenas a pedido (/admin/archive):
+# - pedidos aceites com mais de ARCHIVE_ACCEPTED_AFTER_DAYS dias;
+# - qualquer pedido com mais de ARCHIVE_AFTER_DAYS dias.
+# Com o Firestore, o arquivo é a coleção requests_archive (com contadores
+# próprios); com os stores locais, são segmentos JSONL comprimidos com gzip em
+# ARCHIVE_DIR, lidos a cada consulta (com um índice pequeno, index.db, para os
+# contadores), sem ficarem em memória nos workers.
+# ARCHIVE_STORE=collection/segments escolhe outro destino.
+# O arquivamento corre periodicamente fora dos workers, por exemplo no cron:
+#   30 3 * * *  cd /srv/probuilder && flask --app app_v5 archive-requests
+
+ARCHIVE_ACCEPTED_AFTER_DAYS = int(os.environ.get("ARCHIVE_ACCEPTED_AFTER_DAYS", "90"))
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", "365"))
+ARCHIVE_STORE = os.environ.get("ARCHIVE_STORE", "collection" if REQUEST_STORE == "firestore" else "segments")
+ARCHIVE_COLLECTION = "requests_archive"
+ARCHIVE_COUNTERS_COLLECTION = "request_archive_counters"
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", os.path.join("data", "archive"))
+
+
+def create_archive(kind):
+    """
+    Cria o arquivo indicado por ARCHIVE_STORE.
+    """
+    if kind == "collection":
+        if REQUEST_STORE != "firestore":
+            raise ValueError("ARCHIVE_STORE=collection precisa de REQUEST_STORE=firestore")
+        return FirestoreRequestStore(get_store().client, ARCHIVE_COLLECTION, ARCHIVE_COUNTERS_COLLECTION)
+    if kind == "segments":
+        return SegmentArchive(ARCHIVE_DIR)
+    raise ValueError("ARCHIVE_STORE desconhecido: %r (use collection ou segments)" % kind)
+
+
+_archive = None
+_archive_pid = None
+_archive_lock = threading.Lock()
+
+
+def get_archive():
+    """
+    Devolve o arquivo deste processo, criado no primeiro uso (como get_store).
+    """
+    global _archive, _archive_pid
+    if _archive_pid != os.getpid():
+        with _archive_lock:
+            if _archive_pid != os.getpid():
+                _archive, _archive_pid = create_archive(ARCHIVE_STORE), os.getpid()
+    return _archive
+
+
+def archive_rules(accepted_days=ARCHIVE_ACCEPTED_AFTER_DAYS, days=ARCHIVE_AFTER_DAYS):
+    """
+    Filtros dos pedidos a arquivar: aceites com mais de `accepted_days` dias
+    e todos com mais de `days` dias (dias em APP_TIMEZONE). 0 desativa uma regra.
+    """
+    today = datetime.now(APP_TIMEZONE).date()
+    rules = []
+    if accepted_days > 0:
+        rules.append(RequestFilters(status="Aceite",
+                                    date_to=(today - timedelta(days=accepted_days + 1)).isoformat()))
+    if days > 0:
+        rules.append(RequestFilters(date_to=(today - timedelta(days=days + 1)).isoformat()))
+    return rules
+
+
+def archive_requests(store, archive, rules, batch_size, rate=None, progress=None):
+    """
+    Move para o arquivo os pedidos que cumprem alguma das regras, por lotes:
+    cada lote é copiado para o arquivo e só depois excluído do store (o que
+    também atualiza os contadores do painel). Uma interrupção nunca perde
+    pedidos: no pior caso o último lote fica nos dois lados e volta a ser
+    copiado na execução seguinte. Devolve o número de pedidos movidos.
+    """
+    moved = 0
+    for filters in rules:
+        while True:
+            started = time.monotonic()
+            # Os pedidos já movidos deixaram de existir: cada lote é a primeira página
+            page, _, _ = store.list_page(batch_size, filters=filters)
+            if not page:
+                break
+            archived_at = datetime.now(timezone.utc)
+            items = [(data.pop("id"), dict(data, archived_at=archived_at)) for data in page]
+            archive.add_many(items)
+            if not store.bulk_delete([doc_id for doc_id, _ in items]):
+                raise RuntimeError("Nenhum pedido do lote foi excluído; arquivamento interrompido")
+            moved += len(items)
+            if progress:
+                progress(moved)
+            if rate:
+                delay = len(items) / rate - (time.monotonic() - started)
+                if delay > 0:
+                    time.sleep(delay)
+    return moved
+
+
+@bp.cli.command("archive-requests")
+@click.option("--accepted-days", default=ARCHIVE_ACCEPTED_AFTER_DAYS, show_default=True, type=click.IntRange(min=0),
+              help="Arquiva os pedidos aceites com mais de N dias (0 desativa).")
+@click.option("--days", default=ARCHIVE_AFTER_DAYS, show_default=True, type=click.IntRange(min=0),
+              help="Arquiva todos os pedidos com mais de N dias (0 desativa).")
+@click.option("--batch-size", default=COUNTED_WRITES_PER_TRANSACTION, show_default=True, type=click.IntRange(min=1),
+              help="Pedidos copiados e excluídos por lote.")
+@click.option("--rate", default=200.0, show_default=True, type=click.FloatRange(min=0, min_open=True),
+              help="Máximo de pedidos movidos por segundo.")
+@click.option("--dry-run", is_flag=True, help="Conta os pedidos a arquivar sem mover nada.")
+def archive_requests_command(accepted_days, days, batch_size, rate, dry_run):
+    """
+    Move os pedidos antigos para o arquivo (ver ARCHIVE_STORE).
+    """
+    rules = archive_rules(accepted_days, days)
+    if dry_run:
+        doc_ids = set()
+        for filters in rules:
+            doc_ids.update(data["id"] for data in get_store().iter_all(filters=filters))
+        print("%d pedidos a arquivar" % len(doc_ids))
+        return
+    moved = archive_requests(get_store(), get_archive(), rules, batch_size, rate,
+                             progress=lambda count: print("%d pedidos arquivados" % count))
+    print("Arquivamento concluído: %d pedidos movidos para %s." % (
+        moved, ARCHIVE_COLLECTION if ARCHIVE_STORE == "collection" else ARCHIVE_DIR))
+
+
+# ==================== RECURSOS ESTÁTICOS OTIMIZADOS ====================
+# O logótipo, os ícones e as imagens da galeria são servidos em versões
+# redimensionadas (PNG/JPEG e WebP) e com URLs que incluem o hash do conteúdo,
+# o que permite ao navegador guardá-los indefinidamente (Cache-Control: immutable).
+# O mesmo vale para a folha de estilos e para as fontes (ver build_stylesheet).
+# As versões são geradas por um passo de build:
+#   flask --app app_v5 build-assets
+# de preferência no deploy, ou no arranque com ASSETS_BUILD_ON_STARTUP=1: nesse
+# caso o build só é refeito se as fontes mudarem, e uma vez por servidor (com o
+# gunicorn, no processo principal, antes dos workers). O build precisa do Pillow
+# (e do brotli para as cópias .br). Sem build, os templates usam os originais
+# de static/ (incluindo static/css/app.css).
+
+ASSETS_BUILD_DIR = os.path.join(STATIC_FOLDER, "build")
+ASSETS_MANIFEST = os.path.join(ASSETS_BUILD_DIR, "manifest.json")
+ASSETS_BUILD_LOCK = os.path.join(ASSETS_BUILD_DIR, ".lock")
+ASSETS_URL_PREFIX = "/assets"
+# O logótipo é mostrado com a classe h-40 (160px de altura); 320px para ecrãs 2x
+LOGO_SOURCE = "logo_sem_fun.png"
+LOGO_HEIGHTS = (160, 320)
+# Larguras geradas para as imagens da galeria (antes/depois)
+GALLERY_DIRS = ("pintura", "remodelacoes")
+GALLERY_WIDTHS = (480, 960, 1440)
+GALLERY_EXTENSIONS = (".jpg", ".jpeg", ".jfif", ".png", ".webp")
+# Formatos que ainda ganham com compressão gzip/brotli (as imagens PNG/JPEG/WebP não)
+COMPRESSIBLE_EXTENSIONS = (".ico", ".css", ".js", ".svg", ".json", ".woff")
+# Ficheiros originais usados pelos templates enquanto o build não for feito
+ASSET_FALLBACKS = {
+    "favicon-32.png": LOGO_SOURCE,
+    "apple-touch-icon.png": LOGO_SOURCE,
+    "favicon.ico": "favicon.ico",
+}
+
+# Conteúdo do manifest.json:
+# - files:  nome lógico -> ficheiro com hash (ícones, app.css, fonts/*.woff2)
+# - images: imagem original -> {"width", "height", "variants": {formato: [[largura, ficheiro], ...]}}
+# - critical_css: template -> CSS crítico incluído no <head>
+# - preload_fonts: fontes (nomes lógicos) pré-carregadas em todas as páginas
+# - source: impressão digital das fontes do build (ver build_assets)
+asset_manifest = {"files": {}, "images": {}, "critical_css": {}, "preload_fonts": [], "source": None}
+
+
+def _write_hashed(directory, data, name, ext):
+    """
+    Grava `data` na pasta de build com o hash do conteúdo no nome e devolve o
+    caminho relativo à pasta. Os formatos compressíveis recebem também cópias
+    .gz e .br.
+    """
+    filename = "%s.%s%s" % (name, hashlib.sha256(data).hexdigest()[:12], ext)
+    path = os.path.join(directory, filename)
+    with open(path, "wb") as handle:
+        handle.write(data)
+    if ext in COMPRESSIBLE_EXTENSIONS:
+        compressed = {".gz": gzip.compress(data, compresslevel=9)}
+        if brotli is not None:
+            compressed[".br"] = brotli.compress(data, quality=11)
+        for suffix, payload in compressed.items():
+            # Só vale a pena guardar se poupar pelo menos 10%
+            if len(payload) < len(data) * 0.9:
+                with open(path + suffix, "wb") as handle:
+                    handle.write(payload)
+    return filename
+
+
+def _encode_image(image, fmt):
+    buffer = io.BytesIO()
+    if fmt == "webp":
+        image.save(buffer, "WEBP", quality=80, method=6)
+    elif fmt == "png":
+        image.save(buffer, "PNG", optimize=True)
+    else:
+        image.convert("RGB").save(buffer, "JPEG", quality=82, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def _build_variants(directory, image, name, sizes, fallback):
+    """
+    Gera versões redimensionadas (sizes = larguras) em WebP e no formato de
+    recurso (PNG ou JPEG). Nunca amplia a imagem original.
+    """
+    variants = {"webp": [], fallback: []}
+    ext = {"png": ".png", "jpeg": ".jpg"}[fallback]
+    for width in sorted(set(min(size, image.width) for size in sizes)):
+        height = round(image.height * width / image.width)
+        resized = image.resize((width, height), Image.LANCZOS) if width != image.width else image
+        variants["webp"].append([width, _write_hashed(directory, _encode_image(resized, "webp"), "%s-%d" % (name, width), ".webp")])
+        variants[fallback].append([width, _write_hashed(directory, _encode_image(resized, fallback), "%s-%d" % (name, width), ext)])
+    return {"width": image.width, "height": image.height, "variants": variants}
+
+
+# ---- Folha de estilos (Tailwind CSS) ----
+# Em vez do script do CDN do Tailwind (que gera o CSS no navegador e bloqueia a
+# renderização) e das Google Fonts, a folha de estilos é compilada pelo CLI
+# standalone do Tailwind a partir de static/src/app.css, que procura as classes
+# usadas nos templates deste módulo. O resultado (static/css/app.css) fica no
+# repositório, para que o build funcione sem o CLI (pip install -r
+# requirements-dev.txt instala-o). O build:
+# - recompila static/css/app.css, se o CLI estiver disponível;
+# - falha se um template usar uma classe sem regra na folha (classe que o
+#   Tailwind não conhece, ou folha desatualizada sem o CLI para a recompilar);
+# - grava app.<hash>.css e as fontes com hash (static/fonts, Inter, OFL 1.1);
+# - guarda o CSS crítico de cada página: as regras das classes usadas antes do
+#   marcador CRITICAL_CSS_MARKER (ou da página inteira), mais a base e só as
+#   variáveis do tema que essas regras usam, incluído num <style> no <head>.
+
+TAILWINDCSS_BIN = os.environ.get("TAILWINDCSS_BIN", "tailwindcss")
+STYLESHEET_SOURCE = os.path.join(STATIC_FOLDER, "src", "app.css")
+STYLESHEET = os.path.join(STATIC_FOLDER, "css", "app.css")
+FONTS_DIR = os.path.join(STATIC_FOLDER, "fonts")
+# Pesos usados no texto corrente e nos títulos; os restantes carregam quando necessários
+PRELOAD_FONTS = ("Inter-Regular.woff2", "Inter-Bold.woff2")
+CRITICAL_CSS_MARKER = "<!-- fim do CSS crítico -->"
+# At-rules cujo conteúdo são outras regras (as restantes são copiadas inteiras)
+CSS_GROUPING_RULES = ("@layer", "@media", "@supports", "@container")
+# Definição de uma variável num bloco de declarações (--nome: valor)
+CSS_VARIABLE_DECLARATION = re.compile(r"(?:^|(?<=[{;]))(--[\w-]+):([^;{}]*);?")
+
+
+def compile_stylesheet():
+    """
+    Recompila static/css/app.css com o CLI do Tailwind. Devolve False (e
+    mantém a versão do repositório) se o CLI não estiver instalado.
+    """
+    binary = shutil.which(TAILWINDCSS_BIN)
+    if binary is None:
+        logger.warning("CLI do Tailwind (%s) não encontrado; é usado o %s do repositório", TAILWINDCSS_BIN, STYLESHEET)
+        return False
+    temp_path = "%s.%d.tmp" % (STYLESHEET, os.getpid())
+    result = subprocess.run([binary, "-i", STYLESHEET_SOURCE, "-o", temp_path, "--minify"],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(temp_path)
+        raise RuntimeError("O Tailwind falhou a compilar %s:\n%s" % (STYLESHEET_SOURCE, result.stderr))
+    os.replace(temp_path, STYLESHEET)
+    return True
+
+
+def stylesheet_classes(css):
+    """
+    Classes com regra numa folha de estilos (nomes sem os escapes do CSS,
+    ex.: 'md:p-12' para .md\\:p-12).
+    """
+    return {re.sub(r"\\(.)", r"\1", name) for name in re.findall(r"\.((?:\\.|[\w-])+)", css)}
+
+
+def template_classes(source):
+    """
+    Classes usadas num template: as dos atributos class="..." (incluindo os
+    resultados das expressões Jinja, ex.: {{ 'text-green-600' if ... else
+    'text-yellow-600' }}), a classe passada a responsive_image() e os
+    argumentos de classList.add/replace/... no JavaScript. As classes montadas dinamicamente ('text-' + cor) não são
+    encontradas: os templates usam sempre nomes completos.
+    """
+    names = set()
+    for value in re.findall(r'class="([^"]*)"', source):
+        for expression in re.findall(r"{{(.*?)}}", value):
+            for literal in re.findall(r"(?:^|\belse)\s*'([^']*)'", expression.strip()):
+                names.update(literal.split())
+        names.update(re.sub(r"{{.*?}}|{%.*?%}", " ", value).split())
+    for literal in re.findall(r"responsive_image\('[^']*', '[^']*', '([^']*)'", source):
+        names.update(literal.split())
+    for arguments in re.findall(r"classList\.\w+\(([^)]*)\)", source):
+        for literal in re.findall(r"'([^']*)'", arguments):
+            names.update(literal.split())
+    return names
+
+
+def missing_classes(css):
+    """
+    Classes usadas nos templates sem regra na folha de estilos nem definição
+    num <style> do próprio template, por template.
+    """
+    defined = stylesheet_classes(css)
+    missing = {}
+    for page, source in TEMPLATES.items():
+        styles = " ".join(re.findall(r"<style>(.*?)</style>", source, re.S))
+        names = template_classes(source) - defined - stylesheet_classes(styles)
+        if names:
+            missing[page] = sorted(names)
+    return missing
+
+
+def _css_blocks(css):
+    """
+    Divide CSS minificado nos blocos de nível superior: (prelúdio, corpo), ou
+    (instrução, None) para at-rules sem bloco (ex.: @layer a,b;).
+    """
+    blocks = []
+    depth = start = prelude_end = 0
+    quote = None
+    for index, char in enumerate(css):
+        if quote:
+            if char == quote and css[index - 1] != "\\":
+                quote = None
+        elif char in "\"'":
+            quote = char
+        elif char == "{":
+            if depth == 0:
+                prelude_end = index
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                blocks.append((css[start:prelude_end].strip(), css[prelude_end + 1:index]))
+                start = index + 1
+        elif char == ";" and depth == 0:
+            blocks.append((css[start:index + 1].strip(), None))
+            start = index + 1
+    return blocks
+
+
+def _critical_rules(css, classes):
+    """
+    Regras de `css` sem classes (base, variáveis do tema, @font-face,
+    @property, @keyframes) e regras cujas classes estão todas em `classes`.
+    """
+    parts = []
+    for prelude, body in _css_blocks(css):
+        if body is None:
+            parts.append(prelude)
+        elif prelude.startswith(CSS_GROUPING_RULES):
+            inner = _critical_rules(body, classes)
+            if inner:
+                parts.append("%s{%s}" % (prelude, inner))
+        elif prelude.startswith("@") or stylesheet_classes(prelude) <= classes:
+            parts.append("%s{%s}" % (prelude, body))
+    return "".join(parts)
+
+
+def _used_variables(css):
+    """
+    Variáveis CSS usadas em `css`: as referidas com var() fora das definições
+    (--x: ...), mais as referidas nas definições dessas, recursivamente.
+    """
+    definitions = {}
+    for name, value in CSS_VARIABLE_DECLARATION.findall(css):
+        definitions.setdefault(name, []).append(value)
+    pending = re.findall(r"var\((--[\w-]+)", CSS_VARIABLE_DECLARATION.sub("", css))
+    used = set()
+    while pending:
+        name = pending.pop()
+        if name not in used:
+            used.add(name)
+            for value in definitions.get(name, ()):
+                pending.extend(re.findall(r"var\((--[\w-]+)", value))
+    return used
+
+
+def _without_variables(css, used):
+    """
+    `css` sem as definições e os @property das variáveis que não estão em
+    `used`, nem as regras e at-rules que ficam vazias.
+    """
+    parts = []
+    for prelude, body in _css_blocks(css):
+        if body is None:
+            parts.append(prelude)
+        elif prelude.startswith(CSS_GROUPING_RULES):
+            inner = _without_variables(body, used)
+            if inner:
+                parts.append("%s{%s}" % (prelude, inner))
+        elif prelude.startswith("@property"):
+            if prelude.split()[1] in used:
+                parts.append("%s{%s}" % (prelude, body))
+        elif prelude.startswith("@"):
+            parts.append("%s{%s}" % (prelude, body))
+        else:
+            body = CSS_VARIABLE_DECLARATION.sub(lambda match: match.group(0) if match.group(1) in used else "", body)
+            if body.strip(";"):
+                parts.append("%s{%s}" % (prelude, body.rstrip(";")))
+    return "".join(parts)
+
+
+def critical_stylesheet(css, classes):
+    """
+    Subconjunto de `css` necessário para a primeira renderização: as regras
+    sem classes e as regras cujas classes estão todas em `classes`, com as
+    camadas theme e properties (e os @property) reduzidas às variáveis que
+    essas regras usam.
+    """
+    critical = _critical_rules(re.sub(r"/\*.*?\*/", "", css, flags=re.S), classes)
+    return _without_variables(critical, _used_variables(critical))
+
+
+def build_stylesheet(directory, manifest):
+    """
+    Compila a folha de estilos, verifica as classes dos templates e grava no
+    build a folha completa, as fontes e o CSS crítico de cada página.
+    """
+    compile_stylesheet()
+    with open(STYLESHEET, encoding="utf-8") as handle:
+        css = handle.read()
+    missing = missing_classes(css)
+    if missing:
+        raise RuntimeError("Classes sem regra em %s (recompile com o CLI do Tailwind ou corrija o nome): %s" % (
+            STYLESHEET, "; ".join("%s: %s" % (page, ", ".join(names)) for page, names in missing.items())))
+
+    # Fontes com hash; os url() relativos da folha passam a apontar para o build
+    for filename in sorted(os.listdir(FONTS_DIR)):
+        if not filename.endswith(".woff2"):
+            continue
+        with open(os.path.join(FONTS_DIR, filename), "rb") as handle:
+            hashed = _write_hashed(directory, handle.read(), os.path.splitext(filename)[0], ".woff2")
+        manifest["files"]["fonts/" + filename] = hashed
+        css = css.replace("url(../fonts/%s)" % filename, "url(%s/%s)" % (ASSETS_URL_PREFIX, hashed))
+    manifest["preload_fonts"] = ["fonts/" + name for name in PRELOAD_FONTS if "fonts/" + name in manifest["files"]]
+
+    manifest["files"]["app.css"] = _write_hashed(directory, css.encode("utf-8"), "app", ".css")
+    for page, source in TEMPLATES.items():
+        critical = source.split(CRITICAL_CSS_MARKER)[0]
+        manifest["critical_css"][page] = critical_stylesheet(css, template_classes(critical))
+
+
+def _build_assets(directory):
+    """
+    Gera todas as versões otimizadas em `directory` e devolve o manifest.
+    """
+    manifest = {"files": {}, "images": {}, "critical_css": {}, "preload_fonts": [], "source": None}
+
+    # Logótipo: larguras correspondentes às alturas em que é mostrado
+    logo = Image.open(os.path.join(STATIC_FOLDER, LOGO_SOURCE))
+    logo.load()
+    logo_widths = [round(logo.width * height / logo.height) for height in LOGO_HEIGHTS]
+    manifest["images"][LOGO_SOURCE] = _build_variants(directory, logo, "logo", logo_widths, "png")
+
+    # Ícones: o logótipo centrado num quadrado transparente
+    side = max(logo.size)
+    square = Image.new("RGBA", (side, side), (0, 0, 0, 0))
+    square.paste(logo, ((side - logo.width) // 2, (side - logo.height) // 2))
+    for name, size in (("favicon-32", 32), ("apple-touch-icon", 180)):
+        icon = _encode_image(square.resize((size, size), Image.LANCZOS), "png")
+        manifest["files"][name + ".png"] = _write_hashed(directory, icon, name, ".png")
+    buffer = io.BytesIO()
+    square.save(buffer, "ICO", sizes=[(16, 16), (32, 32)])
+    manifest["files"]["favicon.ico"] = _write_hashed(directory, buffer.getvalue(), "favicon", ".ico")
+
+    # Galeria de imagens antes/depois
+    for folder in GALLERY_DIRS:
+        for root, _, files in os.walk(os.path.join(STATIC_FOLDER, folder)):
+            for filename in sorted(files):
+                if not filename.lower().endswith(GALLERY_EXTENSIONS):
+                    continue
+                path = os.path.join(root, filename)
+                source = os.path.relpath(path, STATIC_FOLDER).replace(os.sep, "/")
+                image = Image.open(path)
+                image.load()
+                fallback = "png" if image.mode in ("RGBA", "LA", "P") else "jpeg"
+                name = os.path.splitext(source)[0].replace("/", "-")
+                manifest["images"][source] = _build_variants(directory, image, name, GALLERY_WIDTHS, fallback)
+
+    # Folha de estilos, CSS crítico e fontes
+    build_stylesheet(directory, manifest)
+    return manifest
+
+
+def _source_fingerprint():
+    """
+    Impressão digital das fontes do build (este módulo, com os templates, e
+    os ficheiros de static/ fora do próprio build): muda quando alguma muda.
+    """
+    digest = hashlib.sha256()
+    paths = [os.path.abspath(__file__)]
+    for root, dirs, files in os.walk(STATIC_FOLDER):
+        # Fora: o build, as pastas temporárias (.build-*) e os ficheiros ocultos
+        dirs[:] = sorted(name for name in dirs
+                         if not name.startswith(".") and os.path.join(root, name) != ASSETS_BUILD_DIR)
+        paths.extend(os.path.join(root, name) for name in sorted(files) if not name.startswith("."))
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(("%s %d %d\n" % (path, stat.st_size, stat.st_mtime_ns)).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _manifest_files(manifest):
+    """
+    Ficheiros de static/build referidos por um manifest.
+    """
+    names = set(manifest.get("files", {}).values())
+    for entry in manifest.get("images", {}).values():
+        for variants in entry["variants"].values():
+            names.update(path for _, path in variants)
+    return names
+
+
+def _publish_build(directory, manifest):
+    """
+    Passa o build de `directory` para static/build. Os nomes incluem o hash do
+    conteúdo, por isso cada ficheiro entra com os.replace (atómico, e um
+    ficheiro com o mesmo nome tem o mesmo conteúdo) e o manifest é substituído
+    por último: quem estiver a servir nunca vê um ficheiro a meio nem um
+    manifest para ficheiros que ainda não existem. Os ficheiros do build
+    anterior ficam (processos e páginas em cache que ainda os usam); os mais
+    antigos são apagados.
+    """
+    try:
+        with open(ASSETS_MANIFEST, encoding="utf-8") as handle:
+            previous = json.load(handle)
+    except (FileNotFoundError, ValueError):
+        previous = {}
+    for filename in os.listdir(directory):
+        os.replace(os.path.join(directory, filename), os.path.join(ASSETS_BUILD_DIR, filename))
+    temp_path = os.path.join(directory, "manifest.json")
+    with open(temp_path, "w", encoding="utf-8") as handle:
+        json.dump(manifest, handle, indent=2)
+    os.replace(temp_path, ASSETS_MANIFEST)
+    keep = _manifest_files(manifest) | _manifest_files(previous)
+    for filename in os.listdir(ASSETS_BUILD_DIR):
+        if filename.startswith(".") or filename == "manifest.json":
+            continue
+        if re.sub(r"\.(gz|br)$", "", filename) not in keep:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(ASSETS_BUILD_DIR, filename))
+
+
+def build_assets(force=True):
+    """
+    Gera as versões otimizadas numa pasta temporária e publica-as em
+    static/build (ver _publish_build); um build que falhe não altera o
+    anterior. Um processo de cada vez: com force=False (build no arranque),
+    os processos que arrancam ao mesmo tempo (workers do uvicorn, o
+    recarregamento do servidor de desenvolvimento) esperam pelo primeiro e
+    usam o build dele, se as fontes não tiverem mudado entretanto.
+    """
+    if Image is None:
+        raise RuntimeError("O build dos recursos estáticos precisa do Pillow: pip install Pillow")
+    os.makedirs(ASSETS_BUILD_DIR, exist_ok=True)
+    with open(ASSETS_BUILD_LOCK, "a+b") as lock:
+        lock_file(lock)
+        if not force:
+            load_asset_manifest()
+            if asset_manifest.get("source") == _source_fingerprint():
+                return asset_manifest
+        directory = tempfile.mkdtemp(prefix=".build-", dir=STATIC_FOLDER)
+        try:
+            manifest = _build_assets(directory)
+            # Depois de compile_stylesheet, que pode ter reescrito static/css/app.css
+            manifest["source"] = _source_fingerprint()
+            _publish_build(directory, manifest)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+    asset_manifest.update(manifest)
+    return manifest
+
+
+def load_asset_manifest():
+    """
+    Carrega o manifest gerado pelo build, se existir.
+    """
+    try:
+        with open(ASSETS_MANIFEST, encoding="utf-8") as handle:
+            asset_manifest.update(json.load(handle))
+    except FileNotFoundError:
+        pass
+
+
+@bp.app_template_global()
+def asset_url(name):
+    """
+    URL de um recurso com hash (ex.: 'favicon-32.png'), ou do original em
+    static/ se o build ainda não tiver sido feito.
+    """
+    hashed = asset_manifest["files"].get(name)
+    if hashed:
+        return "%s/%s" % (ASSETS_URL_PREFIX, hashed)
+    return url_for("static", filename=ASSET_FALLBACKS.get(name, name))
+
+
+@bp.app_template_global()
+def stylesheet_tags(page):
+    """
+    Estilos de uma página (nome do template), sem pedidos a terceiros:
+    - com build: fontes pré-carregadas, o CSS crítico inline e a folha
+      completa carregada sem bloquear a renderização (com <noscript> para
+      quem não tem JavaScript);
+    - sem build: a folha de static/css, carregada normalmente.
+    """
+    stylesheet = asset_manifest["files"].get("app.css")
+    if not stylesheet or page not in asset_manifest["critical_css"]:
+        return Markup('<link rel="stylesheet" href="%s">') % url_for("static", filename="css/app.css")
+    href = "%s/%s" % (ASSETS_URL_PREFIX, stylesheet)
+    tags = [Markup('<link rel="preload" href="%s/%s" as="font" type="font/woff2" crossorigin>') % (
+        ASSETS_URL_PREFIX, asset_manifest["files"][name]) for name in asset_manifest["preload_fonts"]]
+    tags.append(Markup("<style>%s</style>" % asset_manifest["critical_css"].get(page, "")))
+    tags.append(Markup('<link rel="preload" href="%s" as="style" onload="this.onload=null;this.rel=\'stylesheet\'">'
+                       '<noscript><link rel="stylesheet" href="%s"></noscript>') % (href, href))
+    return Markup("\n    ").join(tags)
+
+
+@bp.app_template_global()
+def responsive_image(src, alt, class_="", height=None, sizes="(min-width: 768px) 50vw, 100vw", lazy=True):
+    """
+    Gera um elemento <picture> com srcset em WebP e no formato original.
+    - src: caminho da imagem original dentro de static/.
+    - height: altura (px) com que a imagem é mostrada; define o atributo sizes.
+    Sem build, devolve um <img> simples para o original.
+    """
+    entry = asset_manifest["images"].get(src)
+    loading = ' loading="lazy" decoding="async"' if lazy else ''
+    if entry is None:
+        return Markup('<img src="%s" alt="%s" class="%s"%s>') % (
+            url_for("static", filename=src), alt, class_, Markup(loading))
+    width, img_height = entry["width"], entry["height"]
+    if height:
+        width, img_height = round(entry["width"] * height / entry["height"]), height
+        sizes = "%dpx" % width
+    sources = []
+    fallback = None
+    for fmt, variants in entry["variants"].items():
+        srcset = ", ".join("%s/%s %dw" % (ASSETS_URL_PREFIX, path, width) for width, path in variants)
+        if fmt == "webp":
+            sources.append(Markup('<source type="image/webp" srcset="%s" sizes="%s">') % (srcset, sizes))
+        else:
+            fallback = (srcset, "%s/%s" % (ASSETS_URL_PREFIX, variants[0][1]))
+    img = Markup('<img src="%s" srcset="%s" sizes="%s" alt="%s" class="%s" width="%d" height="%d"%s>') % (
+        fallback[1], fallback[0], sizes, alt, class_, width, img_height, Markup(loading))
+    return Markup("<picture>%s%s</picture>") % (Markup("").join(sources), img)
+
+
+@bp.route(ASSETS_URL_PREFIX + "/<path:filename>")
+def serve_asset(filename):
+    """
+    Serve os recursos gerados pelo build. Como o nome inclui o hash do
+    conteúdo, podem ficar em cache para sempre. Se o cliente aceitar brotli ou
+    gzip e existir uma cópia pré-comprimida, é essa que é enviada.
+    """
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    encoding = None
+    for candidate, suffix in (("br", ".br"), ("gzip", ".gz")):
+        if request.accept_encodings[candidate] and os.path.isfile(os.path.join(ASSETS_BUILD_DIR, filename + suffix)):
+            encoding = candidate
+            filename += suffix
+            break
+    response = send_from_directory(ASSETS_BUILD_DIR, filename, mimetype=mimetype, max_age=31536000)
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    response.vary.add("Accept-Encoding")
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+
+@bp.route("/favicon.ico")
+def favicon():
+    """
+    Os navegadores pedem /favicon.ico diretamente: serve a versão otimizada
+    de 32x32, ou o ficheiro original se o build ainda não tiver sido feito.
+    """
+    hashed = asset_manifest["files"].get("favicon.ico")
+    if hashed:
+        return redirect("%s/%s" % (ASSETS_URL_PREFIX, hashed))
+    return send_from_directory(STATIC_FOLDER, "favicon.ico", max_age=86400)
+
+
+@bp.cli.command("build-assets")
+def build_assets_command():
+    """Gera as versões otimizadas dos recursos estáticos."""
+    manifest = build_assets()
+    print("Gerados %d ficheiros e %d imagens em %s" % (len(manifest["files"]), len(manifest["images"]), ASSETS_BUILD_DIR))
+    print("Folha de estilos: %s (CSS crítico: %s)" % (
+        manifest["files"]["app.css"],
+        ", ".join("%s %d bytes" % (page, len(css)) for page, css in manifest["critical_css"].items())))
+
+
+
 
 # ==================== Templates HTML ====================
 # Os templates são definidos como strings para manter o código num único ficheiro.
@@ -58,11 +1159,10 @@ INDEX_TEMPLATE = """
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>PROBUILDER</title>
     <!-- Favicon para a aba do navegador, idealmente uma imagem quadrada de 32x32 pixels para evitar distorção -->
-    <link rel="icon" href="{{ url_for('static', filename='logo_sem_fun.png') }}" type="image/png">
+    <link rel="icon" href="{{ asset_url('favicon-32.png') }}" type="image/png" sizes="32x32">
     <!-- Ícone para dispositivos móveis (Apple touch icon) -->
-    <link rel="apple-touch-icon" href="{{ url_for('static', filename='logo_sem_fun.png') }}">
-    <script src="https://cdn.tailwindcss.com"></script>
-    <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;700&display=swap" rel="stylesheet">
+    <link rel="apple-touch-icon" href="{{ asset_url('apple-touch-icon.png') }}" sizes="180x180">
+    {{ stylesheet_tags('index.html') }}
     <style>
         body {
             font-family: 'Inter', sans-serif;
@@ -80,7 +1180,7 @@ INDEX_TEMPLATE = """
         <div class="container mx-auto p-4 flex justify-center items-center">
             <!-- Logo centralizado -->
             <a href="/" class="rounded-lg px-2 py-1">
-                <img src="/static/logo_sem_fun.png" alt="Logo PROBUILDER" class="h-40">
+                {{ responsive_image('logo_sem_fun.png', 'Logo PROBUILDER', 'h-40', height=160, lazy=False) }}
             </a>
         </div>
     </header>
@@ -89,8 +1189,8 @@ INDEX_TEMPLATE = """
     <main class="w-full">
         <section class="bg-indigo-600 text-white py-24 text-center shadow-inner">
             <div class="container mx-auto px-4">
-                <h1 class="text-5xl md:text-6xl font-extrabold mb-4 animate-pulse">Transforme a Sua Casa</h1>
-                <p class="text-xl md:text-2xl font-light mb-8">Serviços de remodelação e pintura de alta qualidade.</p>
+                <h1 class="text-5xl md:text-6xl font-bold mb-4 animate-pulse">Transforme a Sua Casa</h1>
+                <p class="text-xl md:text-2xl font-normal mb-8">Serviços de remodelação e pintura de alta qualidade.</p>
                 <a href="#solicitar" class="bg-yellow-400 text-indigo-900 font-bold py-3 px-8 rounded-full text-lg shadow-xl hover:bg-yellow-300 transition-all duration-300 transform hover:scale-105">
                     Comece Já!
                 </a>
@@ -113,6 +1213,7 @@ INDEX_TEMPLATE = """
                 </div>
             </div>
         </section>
+        <!-- fim do CSS crítico -->
 
         <!-- Quote Request Section -->
         <section id="solicitar" class="py-20 bg-white">
@@ -120,14 +1221,19 @@ INDEX_TEMPLATE = """
                 <h2 class="text-4xl font-bold text-center text-gray-800 mb-10">Solicite um Orçamento</h2>
                 <div class="bg-white p-8 md:p-12 rounded-3xl shadow-2xl border border-gray-200 max-w-2xl mx-auto">
                     {% if message %}
-                        <div class="mb-4 p-4 rounded-xl bg-green-100 text-green-700 border border-green-200 fade-in">
+                        <div class="mb-4 p-4 rounded-xl bg-green-100 text-green-700 border border-green-200">
                             <p class="font-semibold">{{ message }}</p>
                         </div>
                     {% endif %}
-                    <form action="/" method="post" class="space-y-6">
+                    {% if error %}
+                        <div class="mb-4 p-4 rounded-xl bg-red-100 text-red-700 border border-red-200">
+                            <p class="font-semibold">{{ error }}</p>
+                        </div>
+                    {% endif %}
+                    <form action="/" method="post" enctype="multipart/form-data" class="space-y-6">
                         <div>
                             <label for="service" class="block text-sm font-medium text-gray-700">Tipo de Serviço</label>
-                            <select id="service" name="service" required class="mt-1 block w-full rounded-md border-gray-300 shadow-sm focus:border-indigo-500 focus:ring-indigo-500 p-3">
+                            <select id="service" name="service" required class="mt-1 block w-full rounded-md border-gray-300 shadow-xs focus:border-indigo-500 focus:ring-indigo-500 p-3">
                                 <option value="pintura">Pintura</option>
                                 <option value="remodelacao">Remodelação</option>
                                 <option value="ambos">Ambos</option>
@@ -135,15 +1241,19 @@ INDEX_TEMPLATE = """
                         </div>
                         <div>
                             <label for="description" class="block text-sm font-medium text-gray-700">Detalhes do Projeto</label>
-                            <textarea id="description" name="description" rows="4" required placeholder="Descreva o seu projeto em detalhe: número de divisões, área em m², estado atual, etc." class="mt-1 block w-full rounded-md border-gray-300 shadow-sm focus:border-indigo-500 focus:ring-indigo-500 p-3"></textarea>
+                            <textarea id="description" name="description" rows="4" required placeholder="Descreva o seu projeto em detalhe: número de divisões, área em m², estado atual, etc." class="mt-1 block w-full rounded-md border-gray-300 shadow-xs focus:border-indigo-500 focus:ring-indigo-500 p-3"></textarea>
                         </div>
                         <div>
                             <label for="contact_name" class="block text-sm font-medium text-gray-700">Nome</label>
-                            <input type="text" id="contact_name" name="contact_name" required placeholder="O seu nome" class="mt-1 block w-full rounded-md border-gray-300 shadow-sm focus:border-indigo-500 focus:ring-indigo-500 p-3">
+                            <input type="text" id="contact_name" name="contact_name" required placeholder="O seu nome" class="mt-1 block w-full rounded-md border-gray-300 shadow-xs focus:border-indigo-500 focus:ring-indigo-500 p-3">
                         </div>
                         <div>
                             <label for="contact_email" class="block text-sm font-medium text-gray-700">Email</label>
-                            <input type="email" id="contact_email" name="contact_email" required placeholder="o-seu-email@exemplo.com" class="mt-1 block w-full rounded-md border-gray-300 shadow-sm focus:border-indigo-500 focus:ring-indigo-500 p-3">
+                            <input type="email" id="contact_email" name="contact_email" required placeholder="o-seu-email@exemplo.com" class="mt-1 block w-full rounded-md border-gray-300 shadow-xs focus:border-indigo-500 focus:ring-indigo-500 p-3">
+                        </div>
+                        <div>
+                            <label for="project_images" class="block text-sm font-medium text-gray-700">Fotografias do Espaço (opcional)</label>
+                            <input type="file" id="project_images" name="project_images" multiple accept="image/jpeg,image/png,image/webp,image/gif" class="mt-1 block w-full text-gray-700 p-3">
                         </div>
                         
                         <div class="flex justify-center">
@@ -175,11 +1285,10 @@ REMODELACAO_TEMPLATE = """
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>PROBUILDER</title>
     <!-- Favicon para a aba do navegador, idealmente uma imagem quadrada de 32x32 pixels para evitar distorção -->
-    <link rel="icon" href="{{ url_for('static', filename='logo_sem_fun.png') }}" type="image/png">
+    <link rel="icon" href="{{ asset_url('favicon-32.png') }}" type="image/png" sizes="32x32">
     <!-- Ícone para dispositivos móveis (Apple touch icon) -->
-    <link rel="apple-touch-icon" href="{{ url_for('static', filename='logo_sem_fun.png') }}">
-    <script src="https://cdn.tailwindcss.com"></script>
-    <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;700&display=swap" rel="stylesheet">
+    <link rel="apple-touch-icon" href="{{ asset_url('apple-touch-icon.png') }}" sizes="180x180">
+    {{ stylesheet_tags('remodelacao.html') }}
     <style>
         body {
             font-family: 'Inter', sans-serif;
@@ -196,7 +1305,7 @@ REMODELACAO_TEMPLATE = """
     <header class="w-full bg-white text-indigo-900 shadow-lg">
         <div class="container mx-auto p-4 flex justify-between items-center">
             <a href="/" class="rounded-lg px-2 py-1">
-                <img src="/static/logo_sem_fun.png" alt="Logo PROBUILDER" class="h-40">
+                {{ responsive_image('logo_sem_fun.png', 'Logo PROBUILDER', 'h-40', height=160, lazy=False) }}
             </a>
             <nav>
                 <a href="/" class="text-lg font-medium text-indigo-900 hover:text-indigo-600 transition-colors">Voltar</a>
@@ -218,15 +1327,15 @@ REMODELACAO_TEMPLATE = """
             <div class="grid md:grid-cols-2 gap-8">
                 <div class="flex flex-col items-center">
                     <h3 class="text-xl font-semibold text-gray-800 mb-4">Antes</h3>
-                    <!-- Exemplo de como usar a função url_for para ir buscar imagens de uma pasta -->
+                    <!-- Imagem servida em várias larguras e em WebP (ver responsive_image) -->
                     <!-- Basta alterar 'imagem1.jpg' para o nome da sua foto real -->
-                    <img src="{{ url_for('static', filename='remodelacoes/antes/imagem1.jpg') }}" alt="Imagem Antes da Remodelação" class="rounded-xl shadow-md" />
+                    {{ responsive_image('remodelacoes/antes/imagem1.jpg', 'Imagem Antes da Remodelação', 'rounded-xl shadow-md') }}
                 </div>
                 <div class="flex flex-col items-center">
                     <h3 class="text-xl font-semibold text-gray-800 mb-4">Depois</h3>
-                    <!-- Exemplo de como usar a função url_for para ir buscar imagens de uma pasta -->
+                    <!-- Imagem servida em várias larguras e em WebP (ver responsive_image) -->
                     <!-- Basta alterar 'imagem2.jpg' para o nome da sua foto real -->
-                    <img src="{{ url_for('static', filename='remodelacoes/depois/imagem2.jpg') }}" alt="Imagem Depois da Remodelação" class="rounded-xl shadow-md" />
+                    {{ responsive_image('remodelacoes/depois/imagem2.jpg', 'Imagem Depois da Remodelação', 'rounded-xl shadow-md') }}
                 </div>
             </div>
         </div>
@@ -250,11 +1359,10 @@ PINTURA_TEMPLATE = """
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>PROBUILDER</title>
     <!-- Favicon para a aba do navegador, idealmente uma imagem quadrada de 32x32 pixels para evitar distorção -->
-    <link rel="icon" href="{{ url_for('static', filename='logo_sem_fun.png') }}" type="image/png">
+    <link rel="icon" href="{{ asset_url('favicon-32.png') }}" type="image/png" sizes="32x32">
     <!-- Ícone para dispositivos móveis (Apple touch icon) -->
-    <link rel="apple-touch-icon" href="{{ url_for('static', filename='logo_sem_fun.png') }}">
-    <script src="https://cdn.tailwindcss.com"></script>
-    <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;700&display=swap" rel="stylesheet">
+    <link rel="apple-touch-icon" href="{{ asset_url('apple-touch-icon.png') }}" sizes="180x180">
+    {{ stylesheet_tags('pintura.html') }}
     <style>
         body {
             font-family: 'Inter', sans-serif;
@@ -271,7 +1379,7 @@ PINTURA_TEMPLATE = """
     <header class="w-full bg-white text-indigo-900 shadow-lg">
         <div class="container mx-auto p-4 flex justify-between items-center">
             <a href="/" class="rounded-lg px-2 py-1">
-                <img src="/static/logo_sem_fun.png" alt="Logo PROBUILDER" class="h-40">
+                {{ responsive_image('logo_sem_fun.png', 'Logo PROBUILDER', 'h-40', height=160, lazy=False) }}
             </a>
             <nav>
                 <a href="/" class="text-lg font-medium text-indigo-900 hover:text-indigo-600 transition-colors">Voltar</a>
@@ -293,15 +1401,15 @@ PINTURA_TEMPLATE = """
             <div class="grid md:grid-cols-2 gap-8">
                 <div class="flex flex-col items-center">
                     <h3 class="text-xl font-semibold text-gray-800 mb-4">Antes</h3>
-                    <!-- Exemplo de como usar a função url_for para ir buscar imagens de uma pasta -->
+                    <!-- Imagem servida em várias larguras e em WebP (ver responsive_image) -->
                     <!-- Basta alterar 'imagem3.jpg' para o nome da sua foto real -->
-                    <img src="{{ url_for('static', filename='pintura/antes/imagem3.jpg') }}" alt="Imagem Antes da Pintura" class="rounded-xl shadow-md" />
+                    {{ responsive_image('pintura/antes/imagem3.jpg', 'Imagem Antes da Pintura', 'rounded-xl shadow-md') }}
                 </div>
                 <div class="flex flex-col items-center">
                     <h3 class="text-xl font-semibold text-gray-800 mb-4">Depois</h3>
-                    <!-- Exemplo de como usar a função url_for para ir buscar imagens de uma pasta -->
+                    <!-- Imagem servida em várias larguras e em WebP (ver responsive_image) -->
                     <!-- Basta alterar 'imagem4.jpg' para o nome da sua foto real -->
-                    <img src="{{ url_for('static', filename='pintura/depois/imagem4.jpg') }}" alt="Imagem Depois da Pintura" class="rounded-xl shadow-md" />
+                    {{ responsive_image('pintura/depois/imagem4.jpg', 'Imagem Depois da Pintura', 'rounded-xl shadow-md') }}
                 </div>
             </div>
         </div>
@@ -325,11 +1433,10 @@ ADMIN_TEMPLATE = """
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>PROBUILDER - Admin</title>
     <!-- Favicon para a aba do navegador, idealmente uma imagem quadrada de 32x32 pixels para evitar distorção -->
-    <link rel="icon" href="{{ url_for('static', filename='logo_sem_fun.png') }}" type="image/png">
+    <link rel="icon" href="{{ asset_url('favicon-32.png') }}" type="image/png" sizes="32x32">
     <!-- Ícone para dispositivos móveis (Apple touch icon) -->
-    <link rel="apple-touch-icon" href="{{ url_for('static', filename='logo_sem_fun.png') }}">
-    <script src="https://cdn.tailwindcss.com"></script>
-    <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;700&display=swap" rel="stylesheet">
+    <link rel="apple-touch-icon" href="{{ asset_url('apple-touch-icon.png') }}" sizes="180x180">
+    {{ stylesheet_tags('admin.html') }}
     <style>
         body {
             font-family: 'Inter', sans-serif;
@@ -355,7 +1462,7 @@ ADMIN_TEMPLATE = """
         <div class="container mx-auto p-4 flex justify-between items-center">
             <!-- Logo centralizado -->
             <a href="/" class="rounded-lg px-2 py-1">
-                <img src="/static/logo_sem_fun.png" alt="Logo PROBUILDER" class="h-40">
+                {{ responsive_image('logo_sem_fun.png', 'Logo PROBUILDER', 'h-40', height=160, lazy=False) }}
             </a>
             <nav>
                 <a href="/" class="text-lg font-medium hover:text-indigo-600 transition-colors">Home</a>
@@ -372,7 +1479,7 @@ ADMIN_TEMPLATE = """
                 <form action="/admin" method="post" class="space-y-4">
                     <div class="text-center">
                         <label for="password" class="block text-lg font-medium text-gray-700">Palavra-passe de Admin</label>
-                        <input type="password" id="password" name="password" required class="mt-1 block w-full rounded-md border-gray-300 shadow-sm focus:border-indigo-500 focus:ring-indigo-500 p-3">
+                        <input type="password" id="password" name="password" required class="mt-1 block w-full rounded-md border-gray-300 shadow-xs focus:border-indigo-500 focus:ring-indigo-500 p-3">
                         {% if error %}
                             <p class="mt-2 text-sm text-red-600">{{ error }}</p>
                         {% endif %}
@@ -385,41 +1492,180 @@ ADMIN_TEMPLATE = """
                 </form>
             </div>
         {% else %}
+            {% set list_endpoint = 'main.archived_requests' if archived else 'main.admin_panel' %}
             <div class="bg-white p-8 rounded-3xl shadow-2xl">
-                <h2 class="text-2xl font-bold text-gray-800 mb-4">Pedidos de Orçamento</h2>
+                {% if archived %}
+                <div class="flex justify-between items-center mb-4">
+                    <h2 class="text-2xl font-bold text-gray-800">Pedidos Arquivados</h2>
+                    <a href="{{ url_for('main.admin_panel') }}" class="text-indigo-600 font-medium hover:underline">&larr; Pedidos ativos</a>
+                </div>
+                <p class="text-gray-600 mb-6">{{ archived_total }} pedido(s) no arquivo. Os pedidos arquivados só podem ser consultados.</p>
+                {% else %}
+                <div class="flex justify-between items-center mb-4">
+                    <h2 class="text-2xl font-bold text-gray-800">Pedidos de Orçamento</h2>
+                    <a href="{{ url_for('main.archived_requests') }}" class="text-indigo-600 font-medium hover:underline">Arquivo &rarr;</a>
+                </div>
+                <!-- Resumo: contadores mantidos a cada escrita -->
+                <div class="flex flex-wrap gap-4 mb-4">
+                    <div class="p-4 bg-indigo-50 rounded-xl">
+                        <p class="text-sm text-gray-600">Total</p>
+                        <p class="text-2xl font-bold text-indigo-700" data-counter="total">{{ summary.total }}</p>
+                    </div>
+                    {% for name, count in summary.status %}
+                        <a href="{{ url_for('main.admin_panel', status=name) }}" class="p-4 bg-gray-50 rounded-xl hover:bg-gray-100">
+                            <p class="text-sm text-gray-600">{{ name }}</p>
+                            <p class="text-2xl font-bold {{ 'text-green-600' if name == 'Aceite' else 'text-yellow-600' }}" data-counter="status:{{ name }}">{{ count }}</p>
+                        </a>
+                    {% endfor %}
+                    {% for name, count in summary.service %}
+                        <a href="{{ url_for('main.admin_panel', service=name) }}" class="p-4 bg-gray-50 rounded-xl hover:bg-gray-100">
+                            <p class="text-sm text-gray-600 capitalize">{{ name }}</p>
+                            <p class="text-2xl font-bold text-gray-800" data-counter="service:{{ name }}">{{ count }}</p>
+                        </a>
+                    {% endfor %}
+                </div>
+                <div class="mb-6">
+                    <p class="text-sm text-gray-600 mb-2">Pedidos submetidos nos últimos {{ summary.days|length }} dias</p>
+                    <div class="flex items-end gap-1 h-16">
+                        {% set busiest = summary.days|map(attribute=1)|max %}
+                        {% for day, count in summary.days %}
+                            <a href="{{ url_for('main.admin_panel', date_from=day, date_to=day) }}" title="{{ day }}: {{ count }}" class="flex-1 bg-indigo-300 hover:bg-indigo-500 rounded-t" style="height: {{ (count / busiest * 100) if busiest else 0 }}%; min-height: 2px;"></a>
+                        {% endfor %}
+                    </div>
+                </div>
+                {% endif %}
+                {% for summary in get_flashed_messages() %}
+                    <div class="mb-4 p-4 rounded-xl bg-green-100 text-green-700 border border-green-200">
+                        <p class="font-semibold">{{ summary }}</p>
+                    </div>
+                {% endfor %}
+                <!-- Filtros e pesquisa (aplicados no servidor) -->
+                <form action="{{ url_for(list_endpoint) }}" method="get" class="flex flex-wrap items-end gap-4 mb-6 pb-6 border-b border-gray-200">
+                    <input type="search" name="q" value="{{ filters.search or '' }}" placeholder="Pesquisar nome, email ou descrição" class="flex-1 min-w-[200px] rounded-md border-gray-300 p-2">
+                    <select name="status" class="rounded-md border-gray-300 p-2">
+                        <option value="">Qualquer estado</option>
+                        {% for value in ['Pendente', 'Aceite'] %}
+                            <option value="{{ value }}" {% if filters.status == value %}selected{% endif %}>{{ value }}</option>
+                        {% endfor %}
+                    </select>
+                    <select name="service" class="rounded-md border-gray-300 p-2">
+                        <option value="">Qualquer serviço</option>
+                        {% for value, label in [('pintura', 'Pintura'), ('remodelacao', 'Remodelação'), ('ambos', 'Ambos')] %}
+                            <option value="{{ value }}" {% if filters.service == value %}selected{% endif %}>{{ label }}</option>
+                        {% endfor %}
+                    </select>
+                    <label class="text-gray-600 text-sm">De <input type="date" name="date_from" value="{{ filters.date_from or '' }}" class="rounded-md border-gray-300 p-2"></label>
+                    <label class="text-gray-600 text-sm">Até <input type="date" name="date_to" value="{{ filters.date_to or '' }}" class="rounded-md border-gray-300 p-2"></label>
+                    <input type="hidden" name="per_page" value="{{ per_page }}">
+                    <button type="submit" class="bg-indigo-600 text-white font-bold py-2 px-4 rounded-full shadow-lg hover:bg-indigo-700 transition-colors duration-300">Filtrar</button>
+                    {% if filters %}
+                        <a href="{{ url_for(list_endpoint, per_page=per_page) }}" class="text-indigo-600 font-medium hover:underline">Limpar filtros</a>
+                    {% endif %}
+                    {% if not archived %}
+                    <span class="ml-auto text-gray-600">Exportar:
+                        <a href="{{ url_for('main.export_requests', format='csv', **filters.args()) }}" class="text-indigo-600 font-medium hover:underline">CSV</a> |
+                        <a href="{{ url_for('main.export_requests', format='jsonl', **filters.args()) }}" class="text-indigo-600 font-medium hover:underline">JSONL</a>
+                    </span>
+                    {% endif %}
+                </form>
                 {% if requests %}
+                    {% if not archived %}
+                    <!-- Ações em massa sobre os pedidos selecionados -->
+                    <form id="bulk-form" action="{{ url_for('main.bulk_action') }}" method="post" class="flex flex-wrap items-center gap-4 mb-6">
+                        <input type="hidden" name="csrf_token" value="{{ csrf_token() }}">
+                        <label class="text-gray-600"><input type="checkbox" onclick="document.querySelectorAll('[data-bulk-select]').forEach(function (box) { box.checked = this.checked; }, this)"> Selecionar todos</label>
+                        <button type="submit" name="action" value="accept" class="bg-green-500 text-white font-bold py-2 px-4 rounded-full shadow-lg hover:bg-green-600 transition-colors duration-300">
+                            Aceitar Selecionados
+                        </button>
+                        <button type="submit" name="action" value="delete" onclick="return confirm('Excluir os pedidos selecionados?')" class="bg-red-500 text-white font-bold py-2 px-4 rounded-full shadow-lg hover:bg-red-600 transition-colors duration-300">
+                            Excluir Selecionados
+                        </button>
+                    </form>
+                    {% endif %}
                     <div class="space-y-6">
                     {% for req in requests %}
-                        <div class="p-6 bg-gray-50 rounded-xl shadow-inner border border-gray-200">
+                        <div class="p-6 bg-gray-50 rounded-xl shadow-inner border border-gray-200" data-request data-status="{{ req.status }}" data-service="{{ req.service }}">
+                            {% if not archived %}
+                            <input type="checkbox" name="doc_ids" value="{{ req.id }}" form="bulk-form" class="float-right" data-bulk-select aria-label="Selecionar pedido">
+                            {% endif %}
                             <h3 class="text-xl font-semibold text-indigo-700">Pedido #{{ loop.index }}</h3>
                             <p class="text-gray-600 mt-2"><strong>Nome:</strong> {{ req.contact_name }}</p>
                             <p class="text-gray-600"><strong>Email:</strong> {{ req.contact_email }}</p>
                             <p class="text-gray-600"><strong>Serviço:</strong> {{ req.service }}</p>
                             <p class="text-gray-600"><strong>Descrição:</strong> {{ req.description }}</p>
-                            {% if req.project_image_data %}
-                                <p class="text-gray-600"><strong>Imagem:</strong> <a href="{{ url_for('serve_image', image_id=loop.index0) }}" target="_blank" class="text-indigo-500 hover:underline">Ver Imagem</a></p>
+                            {% if req.project_images %}
+                                <p class="text-gray-600"><strong>Imagens:</strong></p>
+                                <div class="flex flex-wrap gap-4">
+                                    {% for image in req.project_images %}
+                                        <a href="{{ url_for('main.serve_image', image_id=image.id) }}" target="_blank">
+                                            <img src="{{ url_for('main.serve_image', image_id=image.id, size='thumb') }}" alt="Imagem do projeto" class="preview-image" loading="lazy">
+                                        </a>
+                                    {% endfor %}
+                                </div>
                             {% endif %}
-                            <p class="text-gray-600"><strong>Estado:</strong> <span class="font-bold text-{{ 'green' if req.status == 'Aceite' else 'yellow' }}-600">{{ req.status }}</span></p>
+                            <p class="text-gray-600"><strong>Estado:</strong> <span class="font-bold {{ 'text-green-600' if req.status == 'Aceite' else 'text-yellow-600' }}" data-status-label>{{ req.status }}</span></p>
                             <p class="text-gray-600 text-sm mt-2"><strong>Submetido em:</strong> {{ req.timestamp }}</p>
-                            
+                            {% if not archived %}
                             <!-- Botões de Ação -->
                             <div class="flex space-x-4 mt-4">
-                                <form action="{{ url_for('accept_request', doc_id=req.id) }}" method="post">
+                                <form action="{{ url_for('main.accept_request', doc_id=req.id) }}" method="post" data-api="{{ url_for('main.api_accept_request', doc_id=req.id) }}" data-method="POST">
+                                    <input type="hidden" name="csrf_token" value="{{ csrf_token() }}">
                                     <button type="submit" class="bg-green-500 text-white font-bold py-2 px-4 rounded-full shadow-lg hover:bg-green-600 transition-colors duration-300">
                                         Aceitar Pedido
                                     </button>
                                 </form>
-                                <form action="{{ url_for('delete_request', doc_id=req.id) }}" method="post">
+                                <form action="{{ url_for('main.delete_request', doc_id=req.id) }}" method="post" data-api="{{ url_for('main.api_delete_request', doc_id=req.id) }}" data-method="DELETE">
+                                    <input type="hidden" name="csrf_token" value="{{ csrf_token() }}">
                                     <button type="submit" class="bg-red-500 text-white font-bold py-2 px-4 rounded-full shadow-lg hover:bg-red-600 transition-colors duration-300">
                                         Excluir Pedido
                                     </button>
                                 </form>
                             </div>
+                            {% endif %}
                         </div>
                     {% endfor %}
                     </div>
+                    <!-- Paginação por cursor -->
+                    <div class="flex justify-between items-center mt-8">
+                        {% if prev_cursor %}
+                            <a href="{{ url_for(list_endpoint, before=prev_cursor, per_page=per_page, **filters.args()) }}" class="text-indigo-600 font-medium hover:underline">&larr; Pedidos anteriores</a>
+                        {% else %}
+                            <span></span>
+                        {% endif %}
+                        {% if next_cursor %}
+                            <a href="{{ url_for(list_endpoint, after=next_cursor, per_page=per_page, **filters.args()) }}" class="text-indigo-600 font-medium hover:underline">Pedidos seguintes &rarr;</a>
+                        {% endif %}
+                    </div>
                 {% else %}
-                    <p class="text-gray-500">Nenhum pedido de orçamento submetido ainda.</p>
+                    {% if filters %}
+                        <p class="text-gray-500">Nenhum pedido corresponde aos filtros.</p>
+                    {% elif archived %}
+                        <p class="text-gray-500">Nenhum pedido arquivado.</p>
+                    {% else %}
+                        <p class="text-gray-500">Nenhum pedido de orçamento submetido ainda.</p>
+                    {% endif %}
+                {% endif %}
+
+                {% if not archived %}
+                <!-- Excluir todos os pedidos que correspondem a um filtro -->
+                <form action="{{ url_for('main.bulk_action') }}" method="post" onsubmit="return confirm('Excluir todos os pedidos que correspondem ao filtro?')" class="flex flex-wrap items-center gap-4 mt-8 pt-6 border-t border-gray-200">
+                    <input type="hidden" name="csrf_token" value="{{ csrf_token() }}">
+                    <input type="hidden" name="action" value="delete_matching">
+                    <select name="status" class="rounded-md border-gray-300 p-2">
+                        <option value="">Qualquer estado</option>
+                        <option value="Pendente">Pendente</option>
+                        <option value="Aceite">Aceite</option>
+                    </select>
+                    <select name="service" class="rounded-md border-gray-300 p-2">
+                        <option value="">Qualquer serviço</option>
+                        <option value="pintura">Pintura</option>
+                        <option value="remodelacao">Remodelação</option>
+                        <option value="ambos">Ambos</option>
+                    </select>
+                    <button type="submit" class="bg-red-500 text-white font-bold py-2 px-4 rounded-full shadow-lg hover:bg-red-600 transition-colors duration-300">
+                        Excluir Todos os Correspondentes
+                    </button>
+                </form>
                 {% endif %}
             </div>
         {% endif %}
@@ -431,128 +1677,1507 @@ ADMIN_TEMPLATE = """
             <p>&copy; 2025 PROBUILDER. Todos os direitos reservados.</p>
         </div>
     </footer>
+    {% if authenticated and not archived %}
+    <script>
+        // Aceitar/excluir sem recarregar a página: a ação é enviada à API JSON e
+        // só o cartão do pedido e os contadores do resumo são atualizados. Se o
+        // pedido à API falhar, o formulário é enviado da forma habitual.
+        function bumpCounter(name, delta) {
+            var counter = document.querySelector('[data-counter="' + name + '"]');
+            if (counter) {
+                counter.textContent = Math.max(parseInt(counter.textContent, 10) + delta, 0);
+            }
+        }
+
+        function removeCard(card) {
+            card.remove();
+            if (!document.querySelector('[data-request]')) {
+                window.location.reload();  // Página vazia: carrega os pedidos seguintes
+            }
+        }
+
+        document.addEventListener('submit', function (event) {
+            var form = event.target;
+            if (!form.dataset.api || !window.fetch) {
+                return;
+            }
+            event.preventDefault();
+            var card = form.closest('[data-request]');
+            var buttons = card.querySelectorAll('button');
+            buttons.forEach(function (button) { button.disabled = true; });
+            fetch(form.dataset.api, {
+                method: form.dataset.method,
+                credentials: 'same-origin',
+                headers: {'Accept': 'application/json', 'X-Requested-With': 'fetch',
+                          'X-CSRF-Token': form.elements.csrf_token.value}
+            }).then(function (response) {
+                if (!response.ok) {
+                    throw new Error(response.status);
+                }
+                return response.json();
+            }).then(function (result) {
+                var status = card.dataset.status;
+                if ('deleted' in result) {
+                    if (result.deleted) {
+                        bumpCounter('total', -1);
+                        bumpCounter('status:' + status, -1);
+                        bumpCounter('service:' + card.dataset.service, -1);
+                    }
+                    removeCard(card);
+                } else if (result.missing.length) {
+                    removeCard(card);  // Excluído entretanto (ex.: noutro separador)
+                } else if (status === result.status) {
+                    buttons.forEach(function (button) { button.disabled = false; });
+                } else {
+                    // Em "unchanged", o pedido já tinha sido aceite (ex.: noutro
+                    // separador) e os contadores do servidor já o refletem
+                    if (result.updated) {
+                        bumpCounter('status:' + status, -1);
+                        bumpCounter('status:' + result.status, 1);
+                    }
+                    card.dataset.status = result.status;
+                    var label = card.querySelector('[data-status-label]');
+                    label.textContent = result.status;
+                    label.classList.replace('text-yellow-600', 'text-green-600');
+                    buttons.forEach(function (button) { button.disabled = false; });
+                }
+            }).catch(function () {
+                form.submit();
+            });
+        });
+    </script>
+    {% endif %}
 </body>
 </html>
 """
 
+# ==================== Templates Pré-compilados e Cache de Páginas ====================
+# Os templates são registados no blueprint e compilados uma única vez, no
+# arranque (create_app), ficando na cache do Jinja em vez de serem
+# recompilados a cada pedido.
+# As páginas públicas sem conteúdo dinâmico (GET de '/', '/remodelacao' e
+# '/pintura') são renderizadas uma vez por processo e servidas a partir da
+# memória, com um ETag forte: os pedidos com If-None-Match recebem 304.
+
+TEMPLATES = {
+    "index.html": INDEX_TEMPLATE,
+    "remodelacao.html": REMODELACAO_TEMPLATE,
+    "pintura.html": PINTURA_TEMPLATE,
+    "admin.html": ADMIN_TEMPLATE,
+}
+bp.jinja_loader = DictLoader(TEMPLATES)
+
+_page_cache = {}
+
+
+def cached_page(name):
+    """
+    Devolve a página pública `name` a partir da cache, renderizando-a apenas
+    na primeira vez. Responde 304 se o ETag do cliente ainda for válido.
+    """
+    # O prefixo da aplicação (script_root) altera os URLs gerados por url_for
+    key = (name, request.script_root)
+    entry = _page_cache.get(key)
+    PAGE_CACHE.inc(page=name, result="hit" if entry else "miss")
+    if entry is None:
+        body = render_template(name).encode("utf-8")
+        entry = _page_cache[key] = (body, hashlib.sha256(body).hexdigest())
+    body, etag = entry
+    response = make_response(body)
+    response.set_etag(etag)
+    # O navegador pode guardar a página, mas deve revalidá-la sempre (barato, via 304)
+    response.headers["Cache-Control"] = "public, no-cache"
+    return response.make_conditional(request)
+
+# ==================== Vista Materializada dos Pedidos ====================
+# Opcionalmente (REQUESTS_VIEW=1), cada processo mantém em memória uma cópia
+# da coleção de pedidos, indexada por estado, serviço e data. O painel de
+# administração lê desta vista, sem qualquer leitura ao armazenamento.
+# - Com o Firestore, a vista é alimentada por um listener on_snapshot e é
+#   atualizada incrementalmente à medida que os documentos mudam.
+# - Com os stores locais, a vista é reconstruída por polling a cada
+#   REQUESTS_VIEW_POLL_INTERVAL segundos.
+# As escritas feitas pelo próprio processo são aplicadas de imediato (write-through).
+# Se a coleção ultrapassar REQUESTS_VIEW_MAX_DOCS, a vista desliga-se para
+# limitar a memória e o painel volta a ler diretamente do armazenamento.
+
+REQUESTS_VIEW_ENABLED = os.environ.get("REQUESTS_VIEW") == "1"
+REQUESTS_VIEW_MAX_DOCS = int(os.environ.get("REQUESTS_VIEW_MAX_DOCS", "50000"))
+REQUESTS_VIEW_POLL_INTERVAL = float(os.environ.get("REQUESTS_VIEW_POLL_INTERVAL", "5"))
+
+
+class RequestsView(RequestStore):
+    """
+    Vista em memória, só de leitura, de um RequestStore.
+    Implementa a mesma paginação por cursor que os stores.
+    """
+
+    def __init__(self, get_source, max_docs, poll_interval):
+        self.get_source = get_source
+        self.max_docs = max_docs
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Estado por processo: listeners e threads não sobrevivem ao fork
+            self._index = RequestIndex()
+            self._ready = False
+            self._overflowed = False
+            self._mode = "listener"
+            self._last_sync = None
+            self._events = 0
+            self._resyncs = 0
+            self._stopped = threading.Event()
+            # Registado com o lock adquirido, para que duas threads não criem
+            # dois listeners; o primeiro snapshot espera pelo fim do registo
+            self._unsubscribe = self.get_source().listen(self._on_changes)
+            if self._unsubscribe is None:
+                self._mode = "polling"
+                threading.Thread(target=self._poll, name="requests-view", daemon=True).start()
+            self._pid = os.getpid()
+
+    @property
+    def ready(self):
+        """Indica se a vista está carregada e pode substituir o armazenamento."""
+        self._ensure_started()
+        return self._ready and not self._overflowed
+
+    def _overflow(self):
+        # Chamado com o lock adquirido. O listener é cancelado, porque a stream
+        # do Firestore guarda a sua própria cópia de cada documento, e o
+        # polling termina.
+        self._overflowed = True
+        self._index = RequestIndex()
+        self._stopped.set()
+        if self._unsubscribe is not None:
+            # Numa thread à parte: o callback corre na thread da stream, que
+            # não pode esperar por si própria ao fechá-la
+            threading.Thread(target=self._unsubscribe, name="requests-view-unsubscribe", daemon=True).start()
+            self._unsubscribe = None
+        logger.warning("Vista de pedidos desligada: mais de %d documentos", self.max_docs)
+
+    def _on_changes(self, changes):
+        with self._lock:
+            if self._overflowed:
+                return
+            for kind, doc_id, data in changes:
+                if kind == "REMOVED":
+                    self._index.remove(doc_id)
+                else:
+                    self._index.put(doc_id, data)
+            self._events += len(changes)
+            self._last_sync = time.time()
+            # O primeiro snapshot traz a coleção inteira
+            self._ready = True
+            if len(self._index) > self.max_docs:
+                self._overflow()
+
+    def _poll(self):
+        while not self._stopped.is_set():
+            index = RequestIndex()
+            try:
+                for data in self.get_source().iter_all():
+                    doc_id = data.pop("id")
+                    index.put(doc_id, data)
+                    if len(index) > self.max_docs:
+                        break
+            except Exception:
+                logger.exception("Falha ao atualizar a vista de pedidos")
+            else:
+                with self._lock:
+                    if len(index) > self.max_docs:
+                        self._overflow()
+                    else:
+                        self._index = index
+                        self._ready = True
+                        self._last_sync = time.time()
+                        self._resyncs += 1
+            self._stopped.wait(self.poll_interval)
+
+    # Escritas feitas por este processo (write-through)
+
+    def put_many(self, items):
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            for doc_id, data in items:
+                self._index.put(doc_id, dict(data))
+
+    def set_status(self, doc_ids, status):
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            for doc_id in doc_ids:
+                self._index.set_status(doc_id, status)
+
+    def remove(self, doc_ids):
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            for doc_id in doc_ids:
+                self._index.remove(doc_id)
+
+    # Leitura
+
+    def get(self, doc_id):
+        with self._lock:
+            return self._index.get(doc_id)
+
+    def _query_page(self, descending, start_after, limit, filters=None):
+        with self._lock:
+            return self._index.page(descending, start_after, limit, filters)
+
+    def stats(self):
+        """Métricas da vista: tamanho, atraso desde a última sincronização, etc."""
+        if self._pid != os.getpid():
+            return {"enabled": REQUESTS_VIEW_ENABLED, "started": False}
+        with self._lock:
+            return {
+                "enabled": REQUESTS_VIEW_ENABLED,
+                "started": True,
+                "mode": self._mode,
+                "ready": self._ready,
+                "overflowed": self._overflowed,
+                "documents": len(self._index),
+                "max_documents": self.max_docs,
+                "events_applied": self._events,
+                "resyncs": self._resyncs,
+                "staleness_seconds": round(time.time() - self._last_sync, 3) if self._last_sync else None,
+            }
+
+
+requests_view = RequestsView(get_store, REQUESTS_VIEW_MAX_DOCS, REQUESTS_VIEW_POLL_INTERVAL)
+
+
+@gauge("probuilder_requests_view_documents", "Pedidos na vista materializada deste processo.")
+def _requests_view_documents():
+    return requests_view.stats().get("documents")
+
+
+@gauge("probuilder_requests_view_staleness_seconds", "Segundos desde a última sincronização da vista.")
+def _requests_view_staleness():
+    return requests_view.stats().get("staleness_seconds")
+
+
+def commit_new_requests(items):
+    """
+    Grava os pedidos da fila de escrita e reflete-os na vista em memória.
+    """
+    get_store().add_many(items)
+    if REQUESTS_VIEW_ENABLED:
+        requests_view.put_many(items)
+
+# ==================== Fila de Escrita Diferida (write-behind) ====================
+# Os pedidos submetidos no formulário não são escritos no Firestore durante o
+# pedido HTTP. São primeiro registados num diário local (journal) em disco e
+# colocados numa fila limitada; uma thread em segundo plano agrupa-os em
+# commits de WriteBatch por tamanho ou por janela de tempo.
+# - Cada processo (worker do gunicorn) tem o seu próprio diário, com um nome
+#   único e bloqueado (flock) enquanto o processo está vivo. Diários órfãos (de
+#   processos que terminaram sem esvaziar a fila) são reenviados logo que outro
+#   processo inicia a fila (depois do fork de cada worker, ou no primeiro pedido).
+# - Um lote que esgote as tentativas fica em memória e no diário, e volta a ser
+#   tentado com um intervalo crescente; o diário é compactado para não crescer
+#   sem limite enquanto a falha durar.
+# A fila (WriteBehindQueue) está em write_behind.py; aqui fica a configuração.
+# - Os IDs dos documentos são gerados no cliente, pelo que reenviar um pedido
+#   é idempotente (batch.set com o mesmo ID).
+# - Se a fila estiver cheia, o pedido espera até WRITE_BEHIND_ENQUEUE_TIMEOUT
+#   segundos e depois é rejeitado (backpressure).
+
+WRITE_BEHIND_QUEUE_SIZE = int(os.environ.get("WRITE_BEHIND_QUEUE_SIZE", "1000"))
+# O Firestore aceita no máximo 500 operações por WriteBatch.
+WRITE_BEHIND_BATCH_SIZE = min(int(os.environ.get("WRITE_BEHIND_BATCH_SIZE", "100")), 500)
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.environ.get("WRITE_BEHIND_FLUSH_INTERVAL", "0.5"))
+WRITE_BEHIND_ENQUEUE_TIMEOUT = float(os.environ.get("WRITE_BEHIND_ENQUEUE_TIMEOUT", "2"))
+WRITE_BEHIND_MAX_RETRIES = int(os.environ.get("WRITE_BEHIND_MAX_RETRIES", "5"))
+WRITE_BEHIND_JOURNAL_DIR = os.environ.get("WRITE_BEHIND_JOURNAL_DIR", "write_behind_journal")
+
+
+write_queue = WriteBehindQueue(
+    commit_new_requests,
+    WRITE_BEHIND_JOURNAL_DIR,
+    max_size=WRITE_BEHIND_QUEUE_SIZE,
+    batch_size=WRITE_BEHIND_BATCH_SIZE,
+    flush_interval=WRITE_BEHIND_FLUSH_INTERVAL,
+    enqueue_timeout=WRITE_BEHIND_ENQUEUE_TIMEOUT,
+    max_retries=WRITE_BEHIND_MAX_RETRIES,
+)
+# Inicia a fila em cada processo filho (reenvia os diários órfãos logo após o
+# fork) e garante que os pedidos em fila são gravados quando o worker termina
+os.register_at_fork(after_in_child=write_queue.start)
+atexit.register(write_queue.close)
+
+
+@bp.before_app_request
+def _start_write_queue():
+    # Servidores sem fork (flask run, uvicorn com um processo): a fila arranca
+    # no primeiro pedido, qualquer que seja a rota
+    write_queue.start()
+
+
+@gauge("probuilder_write_queue_depth", "Pedidos na fila de escrita diferida à espera de gravação.")
+def _write_queue_depth():
+    return write_queue.depth()
+
+# ==================== Imagens dos Projetos ====================
+# O formulário aceita fotografias do projeto. O corpo multipart é gravado
+# diretamente em ficheiros temporários na pasta de uploads, à medida que chega
+# (sem passar por memória nem por base64), e no fim o ficheiro é movido para o
+# seu lugar definitivo. O pedido guarda apenas referências às imagens
+# (ID, tipo e tamanho), o que mantém pequenos os documentos lidos pelo admin.
+# As miniaturas são geradas numa thread em segundo plano, fora do pedido HTTP.
+# O armazenamento é um disco local; a pasta pode ser um volume partilhado.
+
+UPLOAD_DIR = os.path.abspath(os.environ.get("UPLOAD_DIR", "uploads"))
+MAX_IMAGE_BYTES = int(os.environ.get("MAX_IMAGE_BYTES", str(10 * 1024 * 1024)))
+MAX_IMAGES_PER_REQUEST = int(os.environ.get("MAX_IMAGES_PER_REQUEST", "5"))
+THUMBNAIL_SIZE = (320, 320)
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Tipos aceites e respetiva extensão no disco
+IMAGE_TYPES = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+}
+IMAGE_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+# O Werkzeug rejeita logo com 413 os pedidos maiores do que isto
+MAX_CONTENT_LENGTH = MAX_IMAGES_PER_REQUEST * MAX_IMAGE_BYTES + 1024 * 1024
+
+
+class _UploadFile:
+    """
+    Ficheiro temporário onde o Werkzeug escreve uma imagem enviada.
+    Interrompe o upload com 413 quando o tamanho ultrapassa MAX_IMAGE_BYTES e
+    apaga o ficheiro ao fechar, a menos que tenha sido guardado no blob store.
+    """
+
+    def __init__(self, handle, max_bytes):
+        self._handle = handle
+        self._max_bytes = max_bytes
+        self.size = 0
+        self.committed = False
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self._max_bytes:
+            # O upload é interrompido e o ficheiro nunca chega à aplicação
+            self.close()
+            raise RequestEntityTooLarge("A imagem excede o tamanho máximo permitido.")
+        return self._handle.write(data)
+
+    def close(self):
+        self._handle.close()
+        if not self.committed:
+            try:
+                os.remove(self._handle.name)
+            except FileNotFoundError:
+                pass
+
+    def __getattr__(self, name):
+        return getattr(self._handle, name)
+
+
+class LocalBlobStore:
+    """
+    Armazenamento das imagens em disco, uma pasta por imagem:
+        <raiz>/<2 primeiros caracteres do ID>/<ID>/original.<ext>
+        <raiz>/<2 primeiros caracteres do ID>/<ID>/thumb.webp
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.tmp_dir = os.path.join(root, "tmp")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def open_upload(self, max_bytes):
+        """Cria o ficheiro temporário para receber um upload."""
+        handle = tempfile.NamedTemporaryFile(dir=self.tmp_dir, delete=False)
+        return _UploadFile(handle, max_bytes)
+
+    def _dir(self, image_id):
+        return os.path.join(self.root, image_id[:2], image_id)
+
+    def commit(self, upload, content_type):
+        """Move um upload recebido para o seu lugar definitivo e devolve o ID da imagem."""
+        image_id = uuid.uuid4().hex
+        os.makedirs(self._dir(image_id))
+        upload.flush()
+        os.replace(upload.name, os.path.join(self._dir(image_id), "original" + IMAGE_TYPES[content_type]))
+        upload.committed = True
+        return image_id
+
+    def delete(self, image_id):
+        """Apaga uma imagem (original e miniatura)."""
+        shutil.rmtree(self._dir(image_id), ignore_errors=True)
+
+    def path(self, image_id, variant="original"):
+        """Caminho do ficheiro da imagem (variant: 'original' ou 'thumb'), ou None."""
+        if not IMAGE_ID_PATTERN.match(image_id):
+            return None
+        try:
+            names = os.listdir(self._dir(image_id))
+        except FileNotFoundError:
+            return None
+        for name in names:
+            # Os .tmp são ficheiros ainda a ser gravados (ex.: a miniatura)
+            if name.split(".")[0] == variant and not name.endswith(".tmp"):
+                return os.path.join(self._dir(image_id), name)
+        return None
+
+
+class UploadRequest(Request):
+    """
+    Pedido Flask que escreve os ficheiros enviados diretamente no blob store.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return blob_store.open_upload(MAX_IMAGE_BYTES)
+
+
+class ThumbnailWorker:
+    """
+    Gera as miniaturas das imagens numa thread em segundo plano.
+    Tal como a fila de escrita, a thread é criada no primeiro uso em cada processo.
+    """
+
+    def __init__(self, blobs, size):
+        self.blobs = blobs
+        self.size = size
+        self._start_lock = threading.Lock()
+        self._pid = None
+
+    def submit(self, image_id):
+        if Image is None:
+            return  # Sem Pillow não há miniaturas; o admin mostra o original
+        if self._pid != os.getpid():
+            with self._start_lock:
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue()
+                    threading.Thread(target=self._run, name="thumbnails", daemon=True).start()
+                    self._pid = os.getpid()
+        self._queue.put(image_id)
+
+    def _run(self):
+        while True:
+            image_id = self._queue.get()
+            path = self.blobs.path(image_id)
+            if path is None:
+                # Imagem já apagada (pedido excluído) ou sem ficheiro local: o
+                # admin mostra o original, ou 404, como em serve_image
+                logger.warning("Imagem %s não encontrada: miniatura não gerada", image_id)
+                continue
+            target = os.path.join(os.path.dirname(path), "thumb.webp")
+            try:
+                with Image.open(path) as image:
+                    image.thumbnail(self.size)
+                    image.save(target + ".tmp", "WEBP", quality=75)
+                os.replace(target + ".tmp", target)
+            except FileNotFoundError:
+                logger.warning("Imagem %s apagada durante a miniatura", image_id)
+            except Exception:
+                logger.exception("Falha ao gerar a miniatura da imagem %s", image_id)
+
+
+def save_project_images(files):
+    """
+    Guarda as imagens enviadas no formulário e devolve as suas referências.
+    Lança ValueError com uma mensagem para o utilizador se alguma for inválida.
+    Se o pedido não chegar a ser gravado, as imagens têm de ser apagadas com
+    discard_project_images; as miniaturas só são geradas depois, com
+    make_thumbnails.
+    """
+    files = [f for f in files if f and f.filename]
+    if len(files) > MAX_IMAGES_PER_REQUEST:
+        raise ValueError("Pode enviar no máximo %d imagens." % MAX_IMAGES_PER_REQUEST)
+    for f in files:
+        if f.mimetype not in IMAGE_TYPES:
+            raise ValueError("Formato de imagem não suportado: %s" % f.filename)
+    images = []
+    try:
+        for f in files:
+            size = f.stream.size
+            images.append({"id": blob_store.commit(f.stream, f.mimetype), "content_type": f.mimetype, "size": size})
+    except Exception:
+        discard_project_images(images)
+        raise
+    return images
+
+
+def discard_project_images(images):
+    """
+    Apaga as imagens de um pedido que não foi gravado (fila cheia, erro ao
+    gravar), para que não fiquem órfãs na pasta de uploads.
+    """
+    for image in images:
+        blob_store.delete(image["id"])
+
+
+def make_thumbnails(images):
+    """Gera em segundo plano as miniaturas das imagens de um pedido aceite."""
+    for image in images:
+        thumbnail_worker.submit(image["id"])
+
+
+blob_store = LocalBlobStore(UPLOAD_DIR)
+thumbnail_worker = ThumbnailWorker(blob_store, THUMBNAIL_SIZE)
+
+# ==================== Controlo de Admissão do Formulário ====================
+# Filtra as submissões do formulário antes de chegarem à fila de escrita (e
+# ao Firestore):
+# - Limite por cliente (token bucket): cada endereço tem um balde de
+#   FORM_RATE_LIMIT_BURST fichas, reposto a FORM_RATE_LIMIT_PER_MINUTE fichas
+#   por minuto, e cada submissão gasta uma ficha. Sem fichas, a resposta é um
+#   429 pequeno com Retry-After, dado antes de ler o formulário e as imagens.
+# - Submissões repetidas (duplo clique, reenvio, robôs): o mesmo conteúdo
+#   (nome, email, serviço e descrição) recebido há menos de FORM_DEDUPE_WINDOW
+#   segundos não é gravado outra vez; o cliente recebe a mensagem de sucesso.
+# O estado fica em memória, em cada processo (FORM_ADMISSION_STORE=memory), ou
+# numa base de dados SQLite partilhada pelos workers da mesma máquina
+# (FORM_ADMISSION_STORE=sqlite). Em memória, com N workers, o limite efetivo
+# pode ser até N vezes maior.
+# FORM_RATE_LIMIT_PER_MINUTE=0 ou FORM_DEDUPE_WINDOW=0 desativam cada filtro.
+# Atrás de proxies, FORM_TRUSTED_PROXIES indica quantos endereços no fim de
+# X-Forwarded-For foram acrescentados por proxies de confiança. Sem essa
+# indicação, o endereço da ligação é o do proxy (o mesmo para todos os
+# visitantes), por isso o limite por cliente vem desativado por omissão:
+# - com FORM_TRUSTED_PROXIES, o limite predefinido é de 6 por minuto;
+# - ligado diretamente aos clientes, sem proxy, ative-o com
+#   FORM_RATE_LIMIT_PER_MINUTE. Se chegar um X-Forwarded-For sem proxies de
+#   confiança configurados, é registado um erro e o pedido não é limitado.
+
+FORM_TRUSTED_PROXIES = int(os.environ.get("FORM_TRUSTED_PROXIES", "0"))
+FORM_RATE_LIMIT_PER_MINUTE = float(os.environ.get("FORM_RATE_LIMIT_PER_MINUTE",
+                                                  "6" if FORM_TRUSTED_PROXIES else "0"))
+FORM_RATE_LIMIT_BURST = int(os.environ.get("FORM_RATE_LIMIT_BURST", "5"))
+FORM_DEDUPE_WINDOW = float(os.environ.get("FORM_DEDUPE_WINDOW", "600"))
+FORM_ADMISSION_STORE = os.environ.get("FORM_ADMISSION_STORE", "memory")
+FORM_ADMISSION_STORE_PATH = os.environ.get("FORM_ADMISSION_STORE_PATH", os.path.join("data", "form_admission.db"))
+# Número máximo de clientes e de submissões recentes guardados em memória
+FORM_ADMISSION_MAX_KEYS = int(os.environ.get("FORM_ADMISSION_MAX_KEYS", "100000"))
+DEDUPE_FIELDS = ("contact_name", "contact_email", "service", "description")
+
+
+class MemoryAdmissionStore:
+    """
+    Baldes de fichas e submissões recentes em memória, no processo atual.
+    Os registos mais antigos são descartados acima de max_keys entradas.
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = {}  # chave -> (fichas, instante da última atualização)
+        self._seen = {}  # resumo -> instante em que expira
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, now):
+        """
+        Gasta uma ficha do balde `key` (rate fichas por segundo, no máximo
+        burst). Devolve 0 se havia ficha, senão os segundos até à próxima.
+        """
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            if not wait:
+                tokens -= 1
+            # Reinserido no fim: os primeiros são os que há mais tempo não são usados
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                del self._buckets[next(iter(self._buckets))]
+            return wait
+
+    def seen(self, digest, window, now):
+        """
+        Regista uma submissão. Devolve True se o mesmo resumo já tinha sido
+        registado nos últimos `window` segundos.
+        """
+        with self._lock:
+            expires = self._seen.get(digest)
+            if expires is not None and expires > now:
+                return True
+            self._seen.pop(digest, None)
+            self._seen[digest] = now + window
+            # A janela é fixa, por isso a ordem de inserção é a ordem de expiração
+            while True:
+                oldest = next(iter(self._seen))
+                if self._seen[oldest] > now and len(self._seen) <= self.max_keys:
+                    return False
+                del self._seen[oldest]
+
+    def forget(self, digest):
+        """Esquece uma submissão que acabou por não ser aceite."""
+        with self._lock:
+            self._seen.pop(digest, None)
+
+
+class SQLiteAdmissionStore:
+    """
+    Baldes de fichas e submissões recentes numa base de dados SQLite,
+    partilhada por todos os processos que usem o mesmo ficheiro. Cada
+    operação é uma transação BEGIN IMMEDIATE (uma escrita de cada vez).
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS rate_buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL);
+        CREATE INDEX IF NOT EXISTS idx_rate_buckets_updated ON rate_buckets (updated);
+        CREATE TABLE IF NOT EXISTS recent_submissions (digest TEXT PRIMARY KEY, expires REAL);
+        CREATE INDEX IF NOT EXISTS idx_recent_submissions_expires ON recent_submissions (expires);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self):
+        # Uma ligação por thread (e por processo), criada no primeiro uso
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(self.SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _transaction(self, work):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = work(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    def take(self, key, rate, burst, now):
+        def work(conn):
+            # Um balde sem uso há burst / rate segundos está cheio: é o mesmo que não existir
+            conn.execute("DELETE FROM rate_buckets WHERE updated < ?", (now - burst / rate,))
+            row = conn.execute("SELECT tokens, updated FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row or (burst, now)
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            if not wait:
+                tokens -= 1
+            conn.execute("INSERT OR REPLACE INTO rate_buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                         (key, tokens, now))
+            return wait
+        return self._transaction(work)
+
+    def seen(self, digest, window, now):
+        def work(conn):
+            conn.execute("DELETE FROM recent_submissions WHERE expires <= ?", (now,))
+            if conn.execute("SELECT 1 FROM recent_submissions WHERE digest = ?", (digest,)).fetchone():
+                return True
+            conn.execute("INSERT INTO recent_submissions (digest, expires) VALUES (?, ?)", (digest, now + window))
+            return False
+        return self._transaction(work)
+
+    def forget(self, digest):
+        self._connect().execute("DELETE FROM recent_submissions WHERE digest = ?", (digest,))
+
+
+def create_admission_store(kind, path=None):
+    """
+    Cria o estado do controlo de admissão indicado por FORM_ADMISSION_STORE.
+    """
+    if kind == "memory":
+        return MemoryAdmissionStore(FORM_ADMISSION_MAX_KEYS)
+    if kind == "sqlite":
+        return SQLiteAdmissionStore(path)
+    raise ValueError("FORM_ADMISSION_STORE desconhecido: %r (use memory ou sqlite)" % kind)
+
+
+admission_store = create_admission_store(FORM_ADMISSION_STORE, FORM_ADMISSION_STORE_PATH)
+
+
+def client_address():
+    """
+    Endereço do cliente: o último endereço de X-Forwarded-For que não foi
+    acrescentado por um dos FORM_TRUSTED_PROXIES proxies, ou o da ligação.
+    """
+    if FORM_TRUSTED_PROXIES:
+        forwarded = [address.strip() for address in request.headers.get("X-Forwarded-For", "").split(",")
+                     if address.strip()]
+        if len(forwarded) >= FORM_TRUSTED_PROXIES:
+            return forwarded[-FORM_TRUSTED_PROXIES]
+    return request.remote_addr or ""
+
+_untrusted_proxy_logged = False
+
+
+def rate_limit_wait():
+    """
+    Gasta uma ficha do cliente atual. Devolve 0 se a submissão pode
+    continuar, senão os segundos que o cliente tem de esperar.
+    """
+    global _untrusted_proxy_logged
+    if FORM_RATE_LIMIT_PER_MINUTE <= 0:
+        return 0
+    if not FORM_TRUSTED_PROXIES and "X-Forwarded-For" in request.headers:
+        # Atrás de um proxy não declarado, todos os visitantes partilhariam o
+        # balde do endereço do proxy: mais vale não limitar do que bloquear todos
+        if not _untrusted_proxy_logged:
+            logger.error("Pedido com X-Forwarded-For mas FORM_TRUSTED_PROXIES=0: o limite por cliente "
+                         "fica desativado até FORM_TRUSTED_PROXIES indicar o número de proxies")
+            _untrusted_proxy_logged = True
+        FORM_ADMISSION.inc(result="untrusted_proxy")
+        return 0
+    return admission_store.take(client_address(), FORM_RATE_LIMIT_PER_MINUTE / 60, FORM_RATE_LIMIT_BURST,
+                                time.time())
+
+def submission_digest(form):
+    """
+    Resumo do conteúdo de uma submissão, sem diferenças de maiúsculas e de
+    espaços. As imagens não entram no resumo.
+    """
+    values = [" ".join((form.get(field) or "").split()).casefold() for field in DEDUPE_FIELDS]
+    return hashlib.sha256(json.dumps(values).encode("utf-8")).hexdigest()
+
+def too_many_requests(wait):
+    """Resposta 429 mínima, sem renderizar templates."""
+    seconds = max(int(math.ceil(wait)), 1)
+    response = current_app.response_class(
+        "Demasiados pedidos. Por favor, tente novamente dentro de %d segundos.\n" % seconds,
+        status=429, mimetype="text/plain")
+    response.headers["Retry-After"] = str(seconds)
+    return response
+
+# ==================== Proteção CSRF ====================
+# As rotas do painel que alteram pedidos exigem um token secreto, guardado na
+# sessão do administrador: os formulários enviam-no no campo csrf_token e o
+# JavaScript do painel no cabeçalho X-CSRF-Token. Um site de terceiros pode
+# levar o navegador a submeter um formulário com o cookie da sessão, mas não
+# consegue ler o token (ex.: excluir todos os pedidos com /admin/bulk).
+
+CSRF_SESSION_KEY = "csrf_token"
+CSRF_PROTECTED_ENDPOINTS = {
+    "main.bulk_action",
+    "main.accept_request",
+    "main.delete_request",
+    "main.api_accept_request",
+    "main.api_delete_request",
+}
+
+
+@bp.app_template_global()
+def csrf_token():
+    """Token CSRF da sessão atual, criado no primeiro uso."""
+    token = session.get(CSRF_SESSION_KEY)
+    if token is None:
+        token = session[CSRF_SESSION_KEY] = secrets.token_urlsafe(32)
+    return token
+
+
+@bp.before_app_request
+def _check_csrf_token():
+    if request.endpoint not in CSRF_PROTECTED_ENDPOINTS:
+        return None
+    expected = session.get(CSRF_SESSION_KEY)
+    supplied = request.headers.get("X-CSRF-Token") or request.form.get("csrf_token")
+    if expected and supplied and secrets.compare_digest(expected, supplied):
+        return None
+    if request.endpoint.startswith("main.api_"):
+        return jsonify({"error": "Token CSRF inválido ou em falta."}), 403
+    abort(400, "Token CSRF inválido ou em falta. Recarregue o painel e tente novamente.")
+
 # ==================== Rotas da Aplicação ====================
 
-@app.route("/", methods=["GET", "POST"])
+@bp.route("/", methods=["GET", "POST"])
 def index():
     """
     Rota principal da aplicação.
     - Método GET: Mostra o formulário para submeter um pedido.
-    - Método POST: Processa os dados do formulário e guarda o pedido no Firestore.
+    - Método POST: Processa os dados do formulário e coloca o pedido na fila de escrita.
     """
-    message = None
     if request.method == "POST":
+        message = "Obrigado! O seu pedido de orçamento foi enviado com sucesso. Entraremos em contacto brevemente."
+        # Limite por cliente: verificado antes de ler o corpo do pedido
+        wait = rate_limit_wait()
+        if wait:
+            FORM_ADMISSION.inc(result="rate_limited")
+            return too_many_requests(wait)
+
         # Processa a submissão do formulário
         contact_name = request.form.get("contact_name")
         contact_email = request.form.get("contact_email")
         service = request.form.get("service")
         description = request.form.get("description")
-        
+
+        # Submissão repetida: não é gravada outra vez
+        digest = submission_digest(request.form)
+        if FORM_DEDUPE_WINDOW > 0 and admission_store.seen(digest, FORM_DEDUPE_WINDOW, time.time()):
+            FORM_ADMISSION.inc(result="duplicate")
+            return render_template("index.html", message=message, error=None)
+
+        try:
+            project_images = save_project_images(request.files.getlist("project_images"))
+        except ValueError as exc:
+            if FORM_DEDUPE_WINDOW > 0:
+                admission_store.forget(digest)
+            return render_template("index.html", message=None, error=str(exc)), 400
+
         # Cria um dicionário com os dados do pedido
+        created_at = datetime.now(timezone.utc)
         new_request = {
             "contact_name": contact_name,
             "contact_email": contact_email,
             "service": service,
             "description": description,
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "status": "Pendente"
+            # Instante em UTC (ordenação e filtros) e texto na hora local (apenas para mostrar)
+            "created_at": created_at,
+            "timestamp": created_at.astimezone(APP_TIMEZONE).strftime(DISPLAY_TIMESTAMP_FORMAT),
+            "status": "Pendente",
+            # Apenas referências: os ficheiros estão no blob store
+            "project_images": project_images,
         }
         
-        # Adiciona o pedido à coleção 'requests' no Firestore
-        db.collection('requests').add(new_request)
-        message = "Obrigado! O seu pedido de orçamento foi enviado com sucesso. Entraremos em contacto brevemente."
+        # Coloca o pedido na fila de escrita diferida; o ID do documento é gerado
+        # localmente, sem ida ao armazenamento.
+        doc_id = get_store().new_id()
+        try:
+            write_queue.submit(doc_id, new_request)
+        except Exception as exc:
+            # O pedido não foi aceite: as imagens já guardadas ficariam órfãs
+            discard_project_images(project_images)
+            if FORM_DEDUPE_WINDOW > 0:
+                admission_store.forget(digest)
+            if not isinstance(exc, WriteQueueFullError):
+                raise
+            error = "De momento estamos a receber muitos pedidos. Por favor, tente novamente dentro de instantes."
+            return render_template("index.html", message=None, error=error), 503
+        make_thumbnails(project_images)
+        FORM_ADMISSION.inc(result="accepted")
+        return render_template("index.html", message=message, error=None)
 
-    return render_template_string(INDEX_TEMPLATE, message=message)
+    # O GET é igual para todos os visitantes: é servido a partir da cache
+    return cached_page("index.html")
 
-@app.route("/remodelacao")
+@bp.route("/remodelacao")
 def remodelacao():
     """
     Rota para a página de detalhes do serviço de remodelação.
     """
-    return render_template_string(REMODELACAO_TEMPLATE)
+    return cached_page("remodelacao.html")
 
-@app.route("/pintura")
+@bp.route("/pintura")
 def pintura():
     """
     Rota para a página de detalhes do serviço de pintura.
     """
-    return render_template_string(PINTURA_TEMPLATE)
+    return cached_page("pintura.html")
+
 
+def page_size_arg(args):
+    """Tamanho de página pedido (per_page), limitado a ADMIN_MAX_PAGE_SIZE."""
+    return min(max(args.get("per_page", ADMIN_PAGE_SIZE, type=int), 1), ADMIN_MAX_PAGE_SIZE)
+
+def requests_page(per_page, filters, args):
+    """
+    Uma página de pedidos do painel (cursores after/before em `args`), a
+    partir da vista em memória quando esta está ativa e carregada.
+    Devolve (pedidos, next_cursor, prev_cursor).
+    """
+    source = requests_view if REQUESTS_VIEW_ENABLED and requests_view.ready else get_store()
+    after = decode_cursor(args.get("after"))
+    before = decode_cursor(args.get("before"))
+    requests_list, next_cursor, prev_cursor = source.list_page(per_page, after=after, before=before, filters=filters)
+    ADMIN_DOCUMENTS.observe(len(requests_list), source="view" if source is requests_view else "store")
+    return requests_list, next_cursor, prev_cursor
 
-@app.route("/admin", methods=["GET", "POST"])
+@bp.route("/admin", methods=["GET", "POST"])
 def admin_panel():
     """
     Rota para o painel de administração.
     - Requer uma palavra-passe para aceder.
-    - Uma vez autenticado, mostra a lista de pedidos do Firestore.
+    - Uma vez autenticado, mostra uma página da lista de pedidos, filtrada
+      por estado, serviço, datas (date_from/date_to) e palavras-chave (q).
     """
     authenticated = session.get("authenticated", False)
     error = None
     requests_list = []
+    next_cursor = prev_cursor = None
+    per_page = page_size_arg(request.args)
+    filters = RequestFilters.from_args(request.args)
 
     if request.method == "POST":
         password = request.form.get("password")
         if password == ADMIN_PASSWORD:
             session["authenticated"] = True
+            # Novo token CSRF a cada autenticação
+            session.pop(CSRF_SESSION_KEY, None)
             authenticated = True
             # Redireciona para evitar re-submissão do formulário
-            return redirect(url_for("admin_panel"))
+            return redirect(url_for("main.admin_panel"))
         else:
             error = "Palavra-passe incorreta."
             authenticated = False
 
+    summary = None
     if authenticated:
-        # Se autenticado, obtém os pedidos do Firestore e adiciona o ID do documento
-        requests_ref = db.collection('requests').stream()
-        for doc in requests_ref:
-            request_data = doc.to_dict()
-            request_data['id'] = doc.id
-            requests_list.append(request_data)
-        
-    return render_template_string(ADMIN_TEMPLATE, authenticated=authenticated, requests=requests_list, error=error)
+        # Resumo a partir dos contadores (número fixo de leituras)
+        summary = dashboard_summary(get_store().counters(since=summary_since()))
+        # Se autenticado, obtém apenas uma página de pedidos
+        requests_list, next_cursor, prev_cursor = requests_page(per_page, filters, request.args)
+
+    return render_template("admin.html", authenticated=authenticated, requests=requests_list, error=error,
+                                  next_cursor=next_cursor, prev_cursor=prev_cursor, per_page=per_page,
+                                  filters=filters, summary=summary)
+
+@bp.route("/admin/archive")
+def archived_requests():
+    """
+    Rota para consultar os pedidos arquivados (apenas leitura).
+    - Apenas funciona se o admin estiver autenticado.
+    - Aceita a mesma paginação e os mesmos filtros que o painel.
+    - O arquivo só é lido quando esta página é pedida.
+    """
+    if not session.get("authenticated"):
+        return redirect(url_for("main.admin_panel"))
+    per_page = page_size_arg(request.args)
+    filters = RequestFilters.from_args(request.args)
+    archive = get_archive()
+    requests_list, next_cursor, prev_cursor = archive.list_page(per_page, after=decode_cursor(request.args.get("after")),
+                                                                before=decode_cursor(request.args.get("before")),
+                                                                filters=filters)
+    return render_template("admin.html", authenticated=True, archived=True, archived_total=archive.counters()["total"],
+                           requests=requests_list, error=None, next_cursor=next_cursor, prev_cursor=prev_cursor,
+                           per_page=per_page, filters=filters, summary=None)
+
+@bp.route("/images/<string:image_id>")
+def serve_image(image_id):
+    """
+    Rota para ver uma imagem enviada com um pedido.
+    - Apenas funciona se o admin estiver autenticado.
+    - ?size=thumb devolve a miniatura (ou o original, se ainda não existir).
+    - Suporta ETag (If-None-Match) e pedidos parciais (Range).
+    """
+    if not session.get("authenticated"):
+        return redirect(url_for("main.admin_panel"))
+    path = None
+    if request.args.get("size") == "thumb":
+        path = blob_store.path(image_id, "thumb")
+    path = path or blob_store.path(image_id)
+    if path is None:
+        abort(404)
+    # O conteúdo de uma imagem nunca muda, por isso o ETag pode ser o próprio nome
+    response = send_file(path, conditional=True, etag="%s-%s" % (image_id, os.path.basename(path)),
+                         max_age=31536000)
+    response.cache_control.private = True
+    response.cache_control.public = False
+    return response
 
-@app.route("/logout")
+@bp.route("/admin/bulk", methods=["POST"])
+def bulk_action():
+    """
+    Rota para ações em massa no painel de administração.
+    - Apenas funciona se o admin estiver autenticado.
+    - action=accept / delete: aceita ou exclui os pedidos selecionados (doc_ids).
+    - action=delete_matching: exclui todos os pedidos com o estado e/ou serviço indicados.
+    As escritas são agrupadas em WriteBatch e o resultado é mostrado numa única mensagem.
+    """
+    if not session.get("authenticated"):
+        return redirect(url_for("main.admin_panel"))
+    action = request.form.get("action")
+    doc_ids = request.form.getlist("doc_ids")
+    if action == "accept":
+        count = get_store().bulk_update_status(doc_ids, 'Aceite')
+        if REQUESTS_VIEW_ENABLED:
+            requests_view.set_status(doc_ids, 'Aceite')
+        flash("%d pedido(s) aceite(s)." % count)
+    elif action == "delete":
+        count = get_store().bulk_delete(doc_ids)
+        if REQUESTS_VIEW_ENABLED:
+            requests_view.remove(doc_ids)
+        flash("%d pedido(s) excluído(s)." % count)
+    elif action == "delete_matching":
+        status = request.form.get("status") or None
+        service = request.form.get("service") or None
+        if status is None and service is None:
+            flash("Escolha um estado ou um serviço para excluir pedidos em massa.")
+        else:
+            count = get_store().delete_matching(status=status, service=service,
+                                                on_deleted=requests_view.remove if REQUESTS_VIEW_ENABLED else None)
+            flash("%d pedido(s) excluído(s)." % count)
+    else:
+        abort(400)
+    return redirect(url_for("main.admin_panel"))
+
+EXPORT_FIELDS = ("id", "created_at", "timestamp", "status", "service", "contact_name", "contact_email", "description",
+                 "project_images")
+# Tamanho aproximado de cada bloco enviado ao cliente
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+def _csv_value(value):
+    # Evita que o Excel interprete um valor como fórmula (injeção de CSV)
+    if isinstance(value, str) and value[:1] in ("=", "+", "-", "@", "\t", "\r"):
+        return "'" + value
+    return value
+
+def export_rows(requests_iter, export_format):
+    """
+    Converte os pedidos em texto CSV ou JSONL, em blocos de ~64 KB.
+    """
+    buffer = io.StringIO()
+    if export_format == "csv":
+        writer = csv.writer(buffer)
+        buffer.write("\ufeff")  # BOM: o Excel abre o ficheiro como UTF-8
+        writer.writerow(EXPORT_FIELDS)
+    for data in requests_iter:
+        if export_format == "csv":
+            row = dict(data, created_at=order_key(data),
+                       project_images=" ".join(image["id"] for image in data.get("project_images") or []))
+            writer.writerow([_csv_value(row.get(field)) for field in EXPORT_FIELDS])
+        else:
+            buffer.write(json.dumps(data, ensure_ascii=False, default=json_default) + "\n")
+        if buffer.tell() >= EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+def gzip_stream(chunks):
+    """
+    Comprime um gerador de blocos em gzip, bloco a bloco.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31: cabeçalho gzip
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+@bp.route("/admin/export")
+def export_requests():
+    """
+    Rota para exportar os pedidos em CSV (format=csv) ou JSONL (format=jsonl).
+    - Apenas funciona se o admin estiver autenticado.
+    - Aceita os mesmos filtros que o painel (status, service, date_from, date_to, q).
+    - A resposta é gerada à medida que os pedidos são lidos, por páginas de
+      EXPORT_BATCH_SIZE: a memória usada não depende do número de pedidos.
+    - Comprimida com gzip se o cliente o aceitar (Accept-Encoding).
+    """
+    if not session.get("authenticated"):
+        return redirect(url_for("main.admin_panel"))
+    export_format = request.args.get("format", "csv")
+    if export_format not in ("csv", "jsonl"):
+        abort(400)
+    filters = RequestFilters.from_args(request.args)
+    chunks = export_rows(get_store().iter_all(batch_size=EXPORT_BATCH_SIZE, filters=filters), export_format)
+    headers = {
+        "Content-Disposition": "attachment; filename=pedidos-%s.%s" % (datetime.now().strftime("%Y%m%d-%H%M%S"),
+                                                                      export_format),
+        "Cache-Control": "no-store",
+        "Vary": "Accept-Encoding",
+    }
+    if "gzip" in request.accept_encodings:
+        chunks = gzip_stream(chunks)
+        headers["Content-Encoding"] = "gzip"
+    mimetype = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    return current_app.response_class(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+
+@bp.route("/admin/view_stats")
+def view_stats():
+    """
+    Rota com as métricas da vista materializada de pedidos (JSON).
+    - Apenas funciona se o admin estiver autenticado.
+    """
+    if not session.get("authenticated"):
+        abort(403)
+    return jsonify(requests_view.stats())
+
+@bp.route("/logout")
 def logout():
     """
     Rota para terminar a sessão do administrador.
     """
     session.pop("authenticated", None)
-    return redirect(url_for("admin_panel"))
+    return redirect(url_for("main.admin_panel"))
 
-@app.route("/accept_request/<string:doc_id>", methods=["POST"])
+@bp.route("/accept_request/<string:doc_id>", methods=["POST"])
 def accept_request(doc_id):
     """
     Rota para aceitar um pedido.
     - Apenas funciona se o admin estiver autenticado.
-    - Altera o estado do pedido no Firestore para 'Aceite'.
+    - Altera o estado do pedido para 'Aceite'.
     """
     if session.get("authenticated"):
-        doc_ref = db.collection('requests').document(doc_id)
-        doc_ref.update({'status': 'Aceite'})
-    return redirect(url_for("admin_panel"))
+        get_store().update_status(doc_id, 'Aceite')
+        if REQUESTS_VIEW_ENABLED:
+            requests_view.set_status([doc_id], 'Aceite')
+    return redirect(url_for("main.admin_panel"))
 
-@app.route("/delete_request/<string:doc_id>", methods=["POST"])
+@bp.route("/delete_request/<string:doc_id>", methods=["POST"])
 def delete_request(doc_id):
     """
     Rota para excluir um pedido.
     - Apenas funciona se o admin estiver autenticado.
-    - Remove o pedido do Firestore.
+    - Remove o pedido do armazenamento.
     """
     if session.get("authenticated"):
-        db.collection('requests').document(doc_id).delete()
-    return redirect(url_for("admin_panel"))
+        get_store().delete(doc_id)
+        if REQUESTS_VIEW_ENABLED:
+            requests_view.remove([doc_id])
+    return redirect(url_for("main.admin_panel"))
+
+
+# ==================== API JSON do Painel ====================
+# O painel aceita e exclui pedidos através destas rotas, sem recarregar a
+# página: cada ação custa uma escrita no armazenamento e uma resposta JSON
+# pequena, e o navegador atualiza apenas o cartão do pedido e os contadores
+# do resumo. Sem JavaScript, os formulários continuam a usar as rotas
+# accept_request e delete_request.
+# As ações exigem o cabeçalho "X-Requested-With: fetch": um formulário de
+# outro site não o consegue enviar (o navegador exigiria autorização CORS).
+# Exigem também o token CSRF da sessão (ver Proteção CSRF).
+
+def status_change_result(doc_id, status, updated, exists):
+    """
+    Resposta da API a uma alteração de estado. Distingue os pedidos que já
+    não existem (o cartão deve desaparecer) dos que já tinham o estado.
+    """
+    return {"id": doc_id, "status": status, "updated": updated,
+            "unchanged": [doc_id] if not updated and exists else [],
+            "missing": [doc_id] if not updated and not exists else []}
+
+def api_auth_error(write=False):
+    """Resposta de erro (JSON) se o pedido à API não for permitido, senão None."""
+    if not session.get("authenticated"):
+        return jsonify({"error": "Sessão de administrador necessária."}), 401
+    if write and request.headers.get("X-Requested-With") != "fetch":
+        return jsonify({"error": "Cabeçalho X-Requested-With em falta."}), 403
+    return None
+
+@bp.route("/api/requests")
+def api_list_requests():
+    """
+    Rota com uma página de pedidos em JSON.
+    - Aceita os mesmos argumentos que o painel (per_page, after, before,
+      status, service, date_from, date_to, q).
+    - Devolve {"requests": [...], "next_cursor": ..., "prev_cursor": ...}.
+    """
+    error = api_auth_error()
+    if error:
+        return error
+    requests_list, next_cursor, prev_cursor = requests_page(page_size_arg(request.args),
+                                                            RequestFilters.from_args(request.args), request.args)
+    return jsonify({"requests": [json_request(data) for data in requests_list],
+                    "next_cursor": next_cursor, "prev_cursor": prev_cursor})
+
+@bp.route("/api/requests/<string:doc_id>/accept", methods=["POST"])
+def api_accept_request(doc_id):
+    """
+    Rota para aceitar um pedido (JSON).
+    - Devolve {"id": ..., "status": "Aceite", "updated": n, "unchanged": [...],
+      "missing": [...]}; se n for 0, o ID aparece em "unchanged" (já estava
+      aceite) ou em "missing" (já não existe).
+    """
+    error = api_auth_error(write=True)
+    if error:
+        return error
+    store = get_store()
+    updated = store.update_status(doc_id, 'Aceite')
+    if REQUESTS_VIEW_ENABLED:
+        requests_view.set_status([doc_id], 'Aceite')
+    exists = bool(updated) or store.get(doc_id) is not None
+    return jsonify(status_change_result(doc_id, 'Aceite', updated, exists))
+
+@bp.route("/api/requests/<string:doc_id>", methods=["DELETE"])
+def api_delete_request(doc_id):
+    """
+    Rota para excluir um pedido (JSON).
+    - Devolve {"id": ..., "deleted": n, "missing": [...]}; se n for 0, o
+      pedido já não existia e o ID aparece em "missing".
+    """
+    error = api_auth_error(write=True)
+    if error:
+        return error
+    deleted = get_store().delete(doc_id)
+    if REQUESTS_VIEW_ENABLED:
+        requests_view.remove([doc_id])
+    return jsonify({"id": doc_id, "deleted": deleted, "missing": [] if deleted else [doc_id]})
+
+
+# ==================== Saúde e Prontidão ====================
+# Sondas para o balanceador de carga / orquestrador:
+# - /healthz: o processo responde (liveness). Não faz I/O.
+# - /readyz: este worker pode receber tráfego (readiness): o store do processo
+#   foi criado e preparado (warm_up) e a fila de escrita diferida não está
+#   quase cheia. Caso contrário devolve 503.
+
+READY_MAX_QUEUE_FILL = 0.9
+
+
+@bp.route("/healthz")
+def healthz():
+    """
+    Rota de liveness: responde sempre 200 enquanto o processo atende pedidos.
+    """
+    return jsonify({"status": "ok"})
+
+@bp.route("/readyz")
+def readyz():
+    """
+    Rota de readiness: 200 se o worker está pronto, 503 se ainda está a
+    arrancar ou se a fila de escrita está quase cheia.
+    """
+    if not store_ready:
+        warm_up()  # Primeira sonda antes do aquecimento em segundo plano terminar
+    depth = write_queue.depth() or 0
+    if not store_ready:
+        status = "starting"
+    elif depth >= write_queue.max_size * READY_MAX_QUEUE_FILL:
+        status = "overloaded"
+    else:
+        status = "ok"
+    return jsonify({"status": status, "store": REQUEST_STORE, "write_queue": depth}), 200 if status == "ok" else 503
+
+
+# ==================== Sessões ====================
+# A sessão do administrador tem de ser válida em qualquer worker e sobreviver
+# aos reinícios, por isso a chave que a assina é fixa:
+# - SECRET_KEY: chave usada para assinar (igual em todos os workers e máquinas).
+#   Sem SECRET_KEY, a chave é lida de SECRET_KEY_FILE, que é criado com uma
+#   chave aleatória na primeira vez (serve para os workers de uma só máquina).
+# - SECRET_KEY_FALLBACKS: chaves anteriores, separadas por vírgulas, ainda
+#   aceites na leitura. Para trocar a chave sem terminar as sessões, passe a
+#   chave atual para SECRET_KEY_FALLBACKS e defina a nova em SECRET_KEY.
+# Por omissão a sessão fica no próprio cookie, assinado. Com SESSION_STORE=sqlite
+# o cookie leva apenas um identificador aleatório e os dados ficam numa base de
+# dados SQLite (SESSION_STORE_PATH), partilhada pelos workers; as sessões sem
+# uso há mais de SESSION_TTL segundos expiram e são removidas.
+
+SECRET_KEY = os.environ.get("SECRET_KEY")
+SECRET_KEY_FILE = os.environ.get("SECRET_KEY_FILE", os.path.join("data", "secret_key"))
+SECRET_KEY_FALLBACKS = [key.strip() for key in os.environ.get("SECRET_KEY_FALLBACKS", "").split(",") if key.strip()]
+SESSION_STORE = os.environ.get("SESSION_STORE", "cookie")
+SESSION_STORE_PATH = os.environ.get("SESSION_STORE_PATH", os.path.join("data", "sessions.db"))
+SESSION_TTL = int(os.environ.get("SESSION_TTL", str(8 * 3600)))
+
+
+def load_secret_key(path):
+    """
+    Lê a chave secreta do ficheiro `path`, criando-o com uma chave aleatória
+    se não existir. Vários workers a arrancar ao mesmo tempo ficam com a
+    mesma chave: o ficheiro é escrito à parte e ligado com os.link, que
+    falha se outro processo o tiver criado primeiro.
+    """
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        temp_path = "%s.%d.tmp" % (path, os.getpid())
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            with os.fdopen(fd, "w") as handle:
+                handle.write(secrets.token_hex(32))
+            os.link(temp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(temp_path)
+    with open(path, encoding="utf-8") as handle:
+        return handle.read().strip()
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """
+    Sessão guardada no servidor; o cookie contém apenas o seu identificador.
+    """
+
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(session):
+            session.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.refresh = False  # Validade a renovar, mesmo sem alterações
+
+
+class SQLiteSessionInterface(SessionInterface):
+    """
+    Sessões numa base de dados SQLite. Na base de dados fica o resumo
+    (SHA-256) do identificador, e não o próprio identificador.
+    A validade é renovada quando passa metade de SESSION_TTL, para não
+    escrever na base de dados a cada pedido.
+    """
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+
+    def _connect(self):
+        # Uma ligação por thread (e por processo), criada no primeiro uso
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data TEXT, expires REAL);
+                CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires);
+            """)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _key(sid):
+        return hashlib.sha256(sid.encode("utf-8")).hexdigest()
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            row = self._connect().execute("SELECT data, expires FROM sessions WHERE id = ? AND expires > ?",
+                                          (self._key(sid), time.time())).fetchone()
+            if row:
+                session = ServerSideSession(self.serializer.loads(row[0]), sid=sid)
+                # Renova a validade quando já passou metade do tempo
+                session.refresh = row[1] - time.time() < self.ttl / 2
+                return session
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session or not session.new:
+            response.vary.add("Cookie")
+        if not session:
+            if not session.new:
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM sessions WHERE id = ?", (self._key(session.sid),))
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        if not (session.modified or session.new or session.refresh):
+            return
+        expires = time.time() + self.ttl
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO sessions (id, data, expires) VALUES (?, ?, ?)",
+                         (self._key(session.sid), self.serializer.dumps(dict(session)), expires))
+            if session.new:
+                # As sessões novas são raras (início de sessão): é quando as expiradas são removidas
+                conn.execute("DELETE FROM sessions WHERE expires <= ?", (time.time(),))
+        response.set_cookie(name, session.sid, expires=datetime.fromtimestamp(expires, timezone.utc),
+                            httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                            secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+
+
+# ==================== Fábrica da Aplicação ====================
+# create_app cria e configura a aplicação Flask. É barata: não importa o
+# Firebase nem abre ligações; o store é criado no primeiro uso, em cada worker
+# (ver get_store), o que permite usar o gunicorn com --preload em segurança.
+# - STORE_WARMUP=1: em cada processo filho, logo a seguir ao fork, abre as
+#   ligações ao armazenamento em segundo plano, para que o primeiro pedido não
+#   pague o arranque do gRPC e da autenticação. O gunicorn.conf.py já chama
+#   start_warm_up() no arranque de cada worker (post_fork, ou post_worker_init
+#   com o gevent).
+# - IMPORT_TIME_BUDGET_MS: tempo máximo para importar este módulo; se for
+#   ultrapassado é registado um aviso (ou um erro, com IMPORT_TIME_BUDGET_STRICT=1).
+
+STORE_WARMUP = os.environ.get("STORE_WARMUP") == "1"
+IMPORT_TIME_BUDGET_MS = float(os.environ.get("IMPORT_TIME_BUDGET_MS", "0"))
+IMPORT_TIME_BUDGET_STRICT = os.environ.get("IMPORT_TIME_BUDGET_STRICT") == "1"
+
+_warm_up_registered = False
+# Indica se warm_up já correu com sucesso neste processo (ver /readyz)
+store_ready = False
+
+
+def warm_up():
+    """
+    Cria o store deste processo e abre as suas ligações.
+    """
+    global store_ready
+    started = time.perf_counter()
+    try:
+        get_store().warm_up()
+    except Exception:
+        logger.exception("Falha ao preparar o armazenamento")
+    else:
+        store_ready = True
+        logger.info("Armazenamento pronto em %.0f ms", (time.perf_counter() - started) * 1000)
+
+
+def start_warm_up():
+    """
+    Executa warm_up numa thread em segundo plano.
+    """
+    threading.Thread(target=warm_up, name="store-warm-up", daemon=True).start()
+
+
+def create_app(config=None):
+    """
+    Cria a aplicação Flask.
+    - config: dicionário opcional com valores para app.config.
+    """
+    global _warm_up_registered
+    app = Flask(__name__)
+    # A chave secreta é necessária para usar sessões (para a autenticação do admin)
+    app.secret_key = SECRET_KEY or load_secret_key(SECRET_KEY_FILE)
+    app.config["SECRET_KEY_FALLBACKS"] = SECRET_KEY_FALLBACKS
+    if SESSION_STORE == "sqlite":
+        app.session_interface = SQLiteSessionInterface(SESSION_STORE_PATH, SESSION_TTL)
+    elif SESSION_STORE != "cookie":
+        raise ValueError("SESSION_STORE desconhecido: %r (use cookie ou sqlite)" % SESSION_STORE)
+    app.config["MAX_CONTENT_LENGTH"] = MAX_CONTENT_LENGTH
+    if config:
+        app.config.update(config)
+    # Os ficheiros enviados são escritos diretamente no blob store
+    app.request_class = UploadRequest
+    app.register_blueprint(bp)
+
+    if os.environ.get("ASSETS_BUILD_ON_STARTUP") == "1":
+        build_assets(force=False)
+    else:
+        load_asset_manifest()
+
+    # Compila os templates agora, e não no primeiro pedido de cada página
+    for name in TEMPLATES:
+        app.jinja_env.get_template(name)
+
+    if STORE_WARMUP and not _warm_up_registered:
+        os.register_at_fork(after_in_child=start_warm_up)
+        _warm_up_registered = True
+    return app
+
+
+# Aplicação predefinida (ex.: gunicorn app_v5:app ou flask --app app_v5)
+app = create_app()
+
+_import_time_ms = (time.perf_counter() - _IMPORT_STARTED) * 1000
+if IMPORT_TIME_BUDGET_MS and _import_time_ms > IMPORT_TIME_BUDGET_MS:
+    _message = "A importação de %s demorou %.0f ms (orçamento: %.0f ms)" % (
+        __name__, _import_time_ms, IMPORT_TIME_BUDGET_MS)
+    if IMPORT_TIME_BUDGET_STRICT:
+        raise RuntimeError(_message)
+    logger.warning(_message)
 
 
 if __name__ == "__main__":
+    # Servidor de desenvolvimento. Em produção use o gunicorn (ver gunicorn.conf.py):
+    #   gunicorn -c gunicorn.conf.py app_v5:app
     # URL da sua aplicação
     url = "http://127.0.0.1:5000"
     
     # Abrir o URL no navegador padrão automaticamente
     webbrowser.open(url)
     
-    # Inicia a aplicação Flask
-    app.run(debug=True)
+    # Inicia a aplicação Flask (o depurador só com FLASK_DEBUG=1: permite executar código)
+    app.run(debug=os.environ.get("FLASK_DEBUG") == "1")
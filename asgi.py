@@ -0,0 +1,428 @@
+# -*- coding: utf-8 -*-
+# Remodelações e Pinturas - Modo de serviço assíncrono (ASGI)
+#
+# No modo habitual (gunicorn + Flask), cada pedido ao Firestore ocupa uma
+# thread ou um processo do worker enquanto espera pela resposta. Este módulo
+# expõe a mesma aplicação como uma aplicação ASGI: as rotas que esperam pelo
+# armazenamento (listar pedidos no painel, aceitar e excluir pedidos, e as
+# mesmas operações na API JSON) são executadas de forma assíncrona com o
+# firestore.AsyncClient, o que permite a um único worker manter centenas de
+# pedidos em curso ao mesmo tempo.
+# As restantes rotas (páginas públicas em cache, submissão do formulário, que
+# já usa a fila de escrita diferida, imagens, login, ações em massa) são
+# entregues à aplicação Flask original através de um adaptador WSGI.
+# As rotas, os templates e a sessão são os mesmos nos dois modos.
+# As rotas protegidas por CSRF (app_v5.CSRF_PROTECTED_ENDPOINTS) só seguem o
+# caminho assíncrono quando o pedido traz o cabeçalho X-CSRF-Token, como os do
+# JavaScript do painel. Os formulários sem JavaScript enviam o token no corpo,
+# que este módulo não lê, e por isso são entregues à aplicação Flask, que o
+# verifica como no modo habitual.
+#
+# Para executar:
+#   pip install uvicorn asgiref
+#   uvicorn asgi:application --workers 4
+#
+# Com um armazenamento local (REQUEST_STORE=sqlite ou jsonl), as operações
+# correm numa thread (asyncio.to_thread), para não bloquear o ciclo de eventos
+# com o I/O em disco; a latência simulada com REQUEST_STORE_LATENCY_MS é
+# esperada com asyncio.sleep, o que permite comparar os dois modos sem Firebase
+# (ver benchmarks/async_vs_sync.py). Em ambos os casos, as operações contam nas
+# mesmas métricas do armazenamento que no modo síncrono.
+
+import io
+import sys
+import time
+import asyncio
+import inspect
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import request, request_started, session, render_template, redirect, url_for, jsonify
+
+import app_v5
+from app_v5 import app, get_store, InstrumentedStore, page_size_arg, api_auth_error, status_change_result
+from stores import (SimulatedLatencyStore, COUNTERS_COLLECTION, paginate, decode_cursor, firestore_cursor,
+                    firestore_filtered_query, firestore_document, order_key, json_request, RequestFilters,
+                    stage_counted_change, stage_counter_increments, sum_counter_shards, counter_shard_refs,
+                    dashboard_summary, summary_since)
+
+
+class AsyncFirestoreRequestStore:
+    """
+    Versão assíncrona das operações do RequestStore usadas pelas rotas
+    assíncronas, com o firestore.AsyncClient.
+    """
+
+    def __init__(self, client, collection='requests'):
+        from google.cloud import firestore
+        self.firestore = firestore
+        self.client = client
+        self.collection = client.collection(collection)
+        self.counters_collection = client.collection(COUNTERS_COLLECTION)
+
+    async def _query_page(self, descending, start_after, limit, filters=None):
+        # Mesma consulta que FirestoreRequestStore._query_page
+        query, needs_matching = firestore_filtered_query(self.firestore, self.collection, filters, descending)
+        requests_list = []
+        while True:
+            page_query = query.start_after(firestore_cursor(start_after)) if start_after else query
+            page = [firestore_document(doc) async for doc in page_query.limit(limit).stream()]
+            requests_list.extend(data for data in page if not needs_matching or filters.matches(data))
+            if not needs_matching or len(requests_list) >= limit or len(page) < limit:
+                return requests_list[:limit]
+            start_after = [order_key(page[-1]), page[-1]["id"]]
+
+    async def list_page(self, page_size, after=None, before=None, filters=None):
+        if before:
+            requests_list = await self._query_page(False, before, page_size + 1, filters)
+        else:
+            requests_list = await self._query_page(True, after, page_size + 1, filters)
+        return paginate(requests_list, page_size, after, before)
+
+    async def get(self, doc_id):
+        snapshot = await self.collection.document(doc_id).get()
+        return firestore_document(snapshot) if snapshot.exists else None
+
+    async def _counted_write(self, doc_id, op, value=None):
+        # Mesma transação que FirestoreRequestStore._counted_writes, para um pedido
+        @self.firestore.async_transactional
+        async def run(transaction):
+            ref = self.collection.document(doc_id)
+            snapshot = await ref.get(transaction=transaction)
+            deltas = stage_counted_change(transaction, ref, snapshot.to_dict() if snapshot.exists else None, op, value)
+            stage_counter_increments(self.firestore, transaction, self.counters_collection, deltas)
+            return 0 if deltas is None else 1
+        return await run(self.client.transaction())
+
+    async def update_status(self, doc_id, status):
+        return await self._counted_write(doc_id, "status", status)
+
+    async def delete(self, doc_id):
+        return await self._counted_write(doc_id, "delete")
+
+    async def counters(self, since=None):
+        refs = counter_shard_refs(self.counters_collection)
+        return sum_counter_shards([snapshot.to_dict() async for snapshot in self.client.get_all(refs)
+                                   if snapshot.exists])
+
+
+class AsyncLocalRequestStore:
+    """
+    Adaptador assíncrono para os stores locais (SQLite/JSONL). As operações
+    fazem I/O em disco (e esperam pelos bloqueios do SQLite e do ficheiro
+    JSONL), por isso correm numa thread; a latência simulada, se existir, é
+    esperada sem bloquear o ciclo de eventos.
+    """
+
+    def __init__(self, store, latency=0.0):
+        self.store = store
+        self.latency = latency
+
+    async def _call(self, method, *args, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return await asyncio.to_thread(method, *args, **kwargs)
+
+    async def list_page(self, page_size, after=None, before=None, filters=None):
+        return await self._call(self.store.list_page, page_size, after=after, before=before, filters=filters)
+
+    async def get(self, doc_id):
+        return await self._call(self.store.get, doc_id)
+
+    async def update_status(self, doc_id, status):
+        return await self._call(self.store.update_status, doc_id, status)
+
+    async def delete(self, doc_id):
+        return await self._call(self.store.delete, doc_id)
+
+    async def counters(self, since=None):
+        return await self._call(self.store.counters, since=since)
+
+
+class AsyncInstrumentedStore:
+    """
+    Equivalente assíncrono de app_v5.InstrumentedStore: mede as operações do
+    store assíncrono nas mesmas métricas (duração, número e erros por
+    operação) que as do store síncrono.
+    """
+
+    def __init__(self, inner):
+        self.wrapped = inner
+
+    def __getattr__(self, name):
+        attr = getattr(self.wrapped, name)
+        if not inspect.iscoroutinefunction(attr) or name.startswith("_"):
+            return attr
+
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await attr(*args, **kwargs)
+            except Exception:
+                app_v5.STORE_ERRORS.inc(operation=name)
+                raise
+            finally:
+                InstrumentedStore._record(name, started)
+        return timed
+
+
+def create_async_store():
+    """
+    Cria o store assíncrono correspondente ao REQUEST_STORE configurado,
+    com as mesmas métricas que o store síncrono.
+    """
+    store = get_store().wrapped
+    if app_v5.REQUEST_STORE == "firestore":
+        from google.cloud import firestore
+        # Mesmas credenciais que o cliente síncrono, já inicializadas por get_store
+        return AsyncInstrumentedStore(AsyncFirestoreRequestStore(
+            firestore.AsyncClient(credentials=store.client._credentials, project=store.client.project)))
+    if isinstance(store, SimulatedLatencyStore):
+        # A latência simulada é esperada com asyncio.sleep, e não com time.sleep numa thread
+        store = store.inner
+    return AsyncInstrumentedStore(AsyncLocalRequestStore(store, app_v5.REQUEST_STORE_LATENCY))
+
+
+_async_store = None
+
+
+def get_async_store():
+    """
+    Devolve o store assíncrono, criado no primeiro pedido (já dentro do worker).
+    """
+    global _async_store
+    if _async_store is None:
+        _async_store = create_async_store()
+    return _async_store
+
+
+# ==================== Rotas Assíncronas ====================
+# Cada rota corre dentro do contexto de pedido do Flask (sessão, url_for,
+# templates) e devolve uma resposta, ou None para entregar o pedido à
+# aplicação Flask síncrona.
+
+async def requests_page(per_page, filters):
+    """
+    Equivalente assíncrono de app_v5.requests_page.
+    """
+    after = decode_cursor(request.args.get("after"))
+    before = decode_cursor(request.args.get("before"))
+    if app_v5.REQUESTS_VIEW_ENABLED and app_v5.requests_view.ready:
+        # A vista em memória não faz I/O
+        requests_list, next_cursor, prev_cursor = app_v5.requests_view.list_page(per_page, after=after, before=before,
+                                                                                  filters=filters)
+        app_v5.ADMIN_DOCUMENTS.observe(len(requests_list), source="view")
+    else:
+        requests_list, next_cursor, prev_cursor = await get_async_store().list_page(per_page, after=after, before=before,
+                                                                                     filters=filters)
+        app_v5.ADMIN_DOCUMENTS.observe(len(requests_list), source="store")
+    return requests_list, next_cursor, prev_cursor
+
+
+async def admin_panel():
+    """
+    Lista de pedidos do painel de administração (apenas GET autenticado).
+    """
+    if request.method != "GET" or not session.get("authenticated"):
+        return None  # Login e ecrã de login: tratados pela rota síncrona
+    if "_flashes" in session:
+        return None  # As mensagens têm de ser consumidas e gravadas na sessão
+    per_page = page_size_arg(request.args)
+    filters = RequestFilters.from_args(request.args)
+    summary = dashboard_summary(await get_async_store().counters(since=summary_since()))
+    requests_list, next_cursor, prev_cursor = await requests_page(per_page, filters)
+    return render_template("admin.html", authenticated=True, requests=requests_list, error=None,
+                           next_cursor=next_cursor, prev_cursor=prev_cursor, per_page=per_page, filters=filters,
+                           summary=summary)
+
+
+async def accept_request(doc_id):
+    """
+    Aceita um pedido (equivalente assíncrono de app_v5.accept_request).
+    """
+    if session.get("authenticated"):
+        await get_async_store().update_status(doc_id, 'Aceite')
+        if app_v5.REQUESTS_VIEW_ENABLED:
+            app_v5.requests_view.set_status([doc_id], 'Aceite')
+    return redirect(url_for("main.admin_panel"))
+
+
+async def delete_request(doc_id):
+    """
+    Exclui um pedido (equivalente assíncrono de app_v5.delete_request).
+    """
+    if session.get("authenticated"):
+        await get_async_store().delete(doc_id)
+        if app_v5.REQUESTS_VIEW_ENABLED:
+            app_v5.requests_view.remove([doc_id])
+    return redirect(url_for("main.admin_panel"))
+
+
+async def api_list_requests():
+    """
+    Página de pedidos em JSON (equivalente assíncrono de app_v5.api_list_requests).
+    """
+    error = api_auth_error()
+    if error:
+        return error
+    requests_list, next_cursor, prev_cursor = await requests_page(page_size_arg(request.args),
+                                                                  RequestFilters.from_args(request.args))
+    return jsonify({"requests": [json_request(data) for data in requests_list],
+                    "next_cursor": next_cursor, "prev_cursor": prev_cursor})
+
+
+async def api_accept_request(doc_id):
+    """
+    Aceita um pedido (equivalente assíncrono de app_v5.api_accept_request).
+    """
+    error = api_auth_error(write=True)
+    if error:
+        return error
+    store = get_async_store()
+    updated = await store.update_status(doc_id, 'Aceite')
+    if app_v5.REQUESTS_VIEW_ENABLED:
+        app_v5.requests_view.set_status([doc_id], 'Aceite')
+    exists = bool(updated) or await store.get(doc_id) is not None
+    return jsonify(status_change_result(doc_id, 'Aceite', updated, exists))
+
+
+async def api_delete_request(doc_id):
+    """
+    Exclui um pedido (equivalente assíncrono de app_v5.api_delete_request).
+    """
+    error = api_auth_error(write=True)
+    if error:
+        return error
+    deleted = await get_async_store().delete(doc_id)
+    if app_v5.REQUESTS_VIEW_ENABLED:
+        app_v5.requests_view.remove([doc_id])
+    return jsonify({"id": doc_id, "deleted": deleted, "missing": [] if deleted else [doc_id]})
+
+
+ASYNC_VIEWS = {
+    "main.admin_panel": admin_panel,
+    "main.accept_request": accept_request,
+    "main.delete_request": delete_request,
+    "main.api_list_requests": api_list_requests,
+    "main.api_accept_request": api_accept_request,
+    "main.api_delete_request": api_delete_request,
+}
+
+
+# ==================== Aplicação ASGI ====================
+
+wsgi_application = WsgiToAsgi(app)
+
+
+def build_environ(scope):
+    """
+    Constrói um environ WSGI (sem corpo) a partir do scope ASGI, para criar o
+    contexto de pedido do Flask.
+    """
+    root_path = scope.get("root_path", "")
+    path = scope["path"]
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": root_path,
+        "PATH_INFO": path,
+        "QUERY_STRING": scope["query_string"].decode("latin1"),
+        "SERVER_PROTOCOL": "HTTP/%s" % scope["http_version"],
+        "SERVER_NAME": (scope.get("server") or ("localhost", 80))[0],
+        "SERVER_PORT": str((scope.get("server") or ("localhost", 80))[1]),
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin1").upper().replace("-", "_")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = "HTTP_" + name
+        value = value.decode("latin1")
+        environ[name] = environ[name] + "," + value if name in environ else value
+    return environ
+
+
+async def dispatch(scope):
+    """
+    Executa a rota assíncrona correspondente ao pedido. Devolve a resposta
+    Flask, ou None se o pedido deve ser tratado pela aplicação síncrona.
+    """
+    ctx = app.request_context(build_environ(scope))
+    # A rota é resolvida antes de ativar o contexto: os pedidos entregues à
+    # aplicação síncrona só passam pelos hooks (before/after/teardown) uma vez
+    ctx.match_request()
+    rule = ctx.request.url_rule
+    view = ASYNC_VIEWS.get(rule.endpoint) if rule is not None else None
+    if view is None:
+        return None
+    if rule.endpoint in app_v5.CSRF_PROTECTED_ENDPOINTS and "X-CSRF-Token" not in ctx.request.headers:
+        return None  # Formulário sem JavaScript: o token vem no corpo, que só a aplicação síncrona lê
+
+    # Mesmo ciclo que Flask.wsgi_app e Flask.full_dispatch_request, com a
+    # vista aguardada: after_request corre também nas respostas de erro e o
+    # teardown recebe a exceção não tratada
+    error = None
+    ctx.push()
+    try:
+        try:
+            try:
+                request_started.send(app, _async_wrapper=app.ensure_sync)
+                response = app.preprocess_request()
+                if response is None:
+                    response = await view(**request.view_args)
+                    if response is None:
+                        return None
+            except Exception as exc:
+                response = app.handle_user_exception(exc)
+            response = app.finalize_request(response)
+        except Exception as exc:
+            error = exc
+            response = app.handle_exception(exc)
+        # O corpo é lido ainda dentro do contexto de pedido
+        response.get_data()
+        return response
+    except BaseException as exc:
+        error = exc
+        raise
+    finally:
+        if error is not None and app.should_ignore_error(error):
+            error = None
+        ctx.pop(error)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            # Grava os pedidos que ainda estão na fila de escrita diferida
+            await asyncio.to_thread(app_v5.write_queue.close)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    """
+    Ponto de entrada ASGI (ex.: uvicorn asgi:application).
+    """
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] == "http":
+        response = await dispatch(scope)
+        if response is not None:
+            await send({
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": [(name.lower().encode("latin1"), value.encode("latin1"))
+                            for name, value in response.headers.items()],
+            })
+            await send({"type": "http.response.body", "body": response.get_data()})
+            return
+    await wsgi_application(scope, receive, send)
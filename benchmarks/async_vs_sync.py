@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# Benchmark: modo síncrono (gunicorn + Flask) vs. modo assíncrono (uvicorn + asgi.py).
+#
+# Os dois servidores usam o mesmo store SQLite local, pré-carregado com
+# pedidos sintéticos, e uma latência simulada por operação
+# (REQUEST_STORE_LATENCY_MS) que imita as idas e voltas ao Firestore.
+# Para cada modo mede pedidos/s e latências p50/p99 de:
+#   - GET /admin autenticado (uma página de pedidos)
+#   - POST /accept_request/<id>
+#
+# Para executar (a partir da raiz do repositório):
+#   python benchmarks/async_vs_sync.py --latency-ms 50 --concurrency 200
+#
+# Os servidores recebem uma SECRET_KEY fixa, para que a sessão do admin seja
+# válida em todos os workers (--workers N). Com --session-store sqlite, a
+# sessão fica no servidor (SESSION_STORE=sqlite) em vez de no cookie.
+
+import os
+import sys
+import json
+import random
+import argparse
+import tempfile
+import subprocess
+
+from httpload import run_load, http_request, start_server, stop_server, admin_session
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def preload(env, docs):
+    """
+    Cria o store local com `docs` pedidos sintéticos e devolve os seus IDs.
+    """
+    script = (
+        "import json, sys, app_v5\n"
+        "items = [('bench%06d' % i, {'contact_name': 'Cliente %d' % i, 'contact_email': 'c%d@exemplo.pt' % i,"
+        " 'service': ('pintura', 'remodelacao', 'ambos')[i % 3], 'description': 'Pedido sintético %d' % i,"
+        " 'timestamp': '2025-%02d-%02d 12:00:00' % (i % 12 + 1, i % 28 + 1), 'status': 'Pendente'})"
+        " for i in range(int(sys.argv[1]))]\n"
+        "store = app_v5.get_store()\n"
+        "getattr(store, 'inner', store).add_many(items)\n"
+        "print(json.dumps([doc_id for doc_id, _ in items]))\n"
+    )
+    output = subprocess.check_output([sys.executable, "-c", script, str(docs)], env=env, cwd=ROOT)
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara o modo síncrono e o modo assíncrono.")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--docs", type=int, default=1000)
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--session-store", default="cookie", choices=("cookie", "sqlite"))
+    parser.add_argument("--output", help="Ficheiro JSON onde gravar os resultados")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="probuilder-bench-")
+    env = dict(os.environ,
+               REQUEST_STORE="sqlite",
+               REQUEST_STORE_PATH=os.path.join(workdir, "requests.db"),
+               REQUEST_STORE_LATENCY_MS=str(args.latency_ms),
+               WRITE_BEHIND_JOURNAL_DIR=os.path.join(workdir, "journal"),
+               UPLOAD_DIR=os.path.join(workdir, "uploads"),
+               SECRET_KEY="benchmark-%d" % random.randrange(1 << 30),
+               SESSION_STORE=args.session_store,
+               SESSION_STORE_PATH=os.path.join(workdir, "sessions.db"),
+               PYTHONPATH=ROOT)
+    doc_ids = preload(env, args.docs)
+    bind = "127.0.0.1:%d" % args.port
+    modes = {
+        "sync": [sys.executable, "-m", "gunicorn", "--bind", bind, "--workers", str(args.workers),
+                 "--worker-class", "sync", "app_v5:app"],
+        "async": [sys.executable, "-m", "uvicorn", "--host", "127.0.0.1", "--port", str(args.port),
+                  "--workers", str(args.workers), "--log-level", "warning", "asgi:application"],
+    }
+
+    results = {"config": vars(args), "modes": {}}
+    for mode, command in modes.items():
+        server = start_server(command, args.port, env, ROOT)
+        try:
+            cookie, token = admin_session(args.port)
+            results["modes"][mode] = {
+                "GET /admin": run_load("127.0.0.1", args.port,
+                                       lambda: http_request("GET", "/admin", cookie=cookie),
+                                       args.concurrency, args.duration),
+                "POST /accept_request": run_load("127.0.0.1", args.port,
+                                                 lambda: http_request("POST", "/accept_request/%s" % random.choice(doc_ids),
+                                                                      cookie=cookie, headers={"X-CSRF-Token": token}),
+                                                 args.concurrency, args.duration),
+            }
+        finally:
+            stop_server(server)
+
+    print("%-6s %-22s %10s %10s %10s %8s" % ("modo", "rota", "pedidos/s", "p50 (ms)", "p99 (ms)", "erros"))
+    for mode, routes in results["modes"].items():
+        for route, stats in routes.items():
+            print("%-6s %-22s %10s %10s %10s %8d" % (mode, route, stats["requests_per_second"],
+                                                   stats["p50_ms"], stats["p99_ms"], stats["errors"]))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(results, handle, indent=2)
+
+
+if __name__ == "__main__":
+    main()
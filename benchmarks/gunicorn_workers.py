@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+# Benchmark: gunicorn com a configuração por omissão (um worker síncrono) vs.
+# gunicorn.conf.py (workers gthread dimensionados pelo número de CPUs).
+#
+# Os dois servidores usam o mesmo store SQLite local, pré-carregado com
+# pedidos sintéticos, e uma latência simulada por operação
+# (REQUEST_STORE_LATENCY_MS) que imita as idas e voltas ao Firestore.
+# Para cada configuração mede pedidos/s e latências p50/p99 de:
+#   - GET /                      (página em cache, sem I/O)
+#   - GET /admin                 (autenticado, uma página de pedidos)
+#   - POST /accept_request/<id>
+#
+# Para executar (a partir da raiz do repositório):
+#   python benchmarks/gunicorn_workers.py --latency-ms 50 --concurrency 100
+
+import os
+import sys
+import json
+import random
+import argparse
+import tempfile
+
+from httpload import run_load, http_request, start_server, stop_server, admin_session
+from async_vs_sync import preload
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara o gunicorn por omissão com gunicorn.conf.py.")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--docs", type=int, default=1000)
+    parser.add_argument("--port", type=int, default=5098)
+    parser.add_argument("--output", help="Ficheiro JSON onde gravar os resultados")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="probuilder-bench-")
+    env = dict(os.environ,
+               REQUEST_STORE="sqlite",
+               REQUEST_STORE_PATH=os.path.join(workdir, "requests.db"),
+               REQUEST_STORE_LATENCY_MS=str(args.latency_ms),
+               WRITE_BEHIND_JOURNAL_DIR=os.path.join(workdir, "journal"),
+               UPLOAD_DIR=os.path.join(workdir, "uploads"),
+               SECRET_KEY="benchmark-%d" % random.randrange(1 << 30),
+               PORT=str(args.port),
+               PYTHONPATH=ROOT)
+    doc_ids = preload(env, args.docs)
+    # Sem -c, o gunicorn leria o gunicorn.conf.py da pasta atual
+    empty_config = os.path.join(workdir, "empty.conf.py")
+    open(empty_config, "w").close()
+    configs = {
+        "default": [sys.executable, "-m", "gunicorn", "-c", empty_config, "--bind", "127.0.0.1:%d" % args.port,
+                    "app_v5:app"],
+        "tuned": [sys.executable, "-m", "gunicorn", "-c", os.path.join(ROOT, "gunicorn.conf.py"),
+                  "--bind", "127.0.0.1:%d" % args.port, "app_v5:app"],
+    }
+
+    results = {"config": vars(args), "cpu_count": os.cpu_count(), "servers": {}}
+    for name, command in configs.items():
+        server = start_server(command, args.port, env, ROOT)
+        try:
+            cookie, token = admin_session(args.port)
+            results["servers"][name] = {
+                "GET /": run_load("127.0.0.1", args.port, lambda: http_request("GET", "/"),
+                                  args.concurrency, args.duration),
+                "GET /admin": run_load("127.0.0.1", args.port,
+                                       lambda: http_request("GET", "/admin", cookie=cookie),
+                                       args.concurrency, args.duration),
+                "POST /accept_request": run_load("127.0.0.1", args.port,
+                                                 lambda: http_request("POST", "/accept_request/%s" % random.choice(doc_ids),
+                                                                      cookie=cookie, headers={"X-CSRF-Token": token}),
+                                                 args.concurrency, args.duration),
+            }
+        finally:
+            stop_server(server)
+
+    print("%-8s %-22s %10s %10s %10s %8s" % ("config", "rota", "pedidos/s", "p50 (ms)", "p99 (ms)", "erros"))
+    for name, routes in results["servers"].items():
+        for route, stats in routes.items():
+            print("%-8s %-22s %10s %10s %10s %8d" % (name, route, stats["requests_per_second"],
+                                                   stats["p50_ms"], stats["p99_ms"], stats["errors"]))
+    default, tuned = results["servers"]["default"], results["servers"]["tuned"]
+    for route in default:
+        if default[route]["requests_per_second"]:
+            print("%-22s %.1fx" % (route, tuned[route]["requests_per_second"] / default[route]["requests_per_second"]))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(results, handle, indent=2)
+
+
+if __name__ == "__main__":
+    main()
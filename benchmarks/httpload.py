@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+# Gerador de carga HTTP/1.1 mínimo, usado pelos benchmarks que comparam
+# servidores reais (gunicorn, uvicorn). Usa apenas a biblioteca padrão:
+# cada "cliente" é uma corrotina com uma ligação keep-alive própria que envia
+# pedidos em ciclo durante o tempo indicado.
+
+import re
+import time
+import asyncio
+import subprocess
+import urllib.error
+import urllib.request
+
+
+def percentile(values, fraction):
+    """
+    Percentil (0 < fraction < 1) de uma lista de valores, por ordenação.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def summarize(latencies, errors, elapsed):
+    """
+    Resume uma execução: pedidos/s e latências p50/p99 em milissegundos.
+    """
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+    }
+
+
+async def _read_response(reader):
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Ligação fechada pelo servidor")
+    status = int(status_line.split()[1])
+    length = 0
+    close = False
+    chunked = False
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin1").partition(":")
+        name = name.strip().lower()
+        if name == "content-length":
+            length = int(value)
+        elif name == "connection" and value.strip().lower() == "close":
+            close = True
+        elif name == "transfer-encoding" and "chunked" in value.lower():
+            chunked = True
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif length:
+        await reader.readexactly(length)
+    return status, close
+
+
+async def _client(host, port, make_request, deadline, latencies, counters):
+    reader = writer = None
+    while time.monotonic() < deadline:
+        if writer is None:
+            reader, writer = await asyncio.open_connection(host, port)
+        started = time.perf_counter()
+        try:
+            writer.write(make_request())
+            await writer.drain()
+            status, close = await _read_response(reader)
+        except (ConnectionError, asyncio.IncompleteReadError, OSError):
+            counters["errors"] += 1
+            writer.close()
+            writer = None
+            continue
+        if status >= 400:
+            counters["errors"] += 1
+        else:
+            latencies.append(time.perf_counter() - started)
+        if close:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def _run(host, port, make_request, concurrency, duration):
+    latencies = []
+    counters = {"errors": 0}
+    started = time.monotonic()
+    deadline = started + duration
+    await asyncio.gather(*[_client(host, port, make_request, deadline, latencies, counters)
+                           for _ in range(concurrency)])
+    return summarize(latencies, counters["errors"], time.monotonic() - started)
+
+
+def run_load(host, port, make_request, concurrency=50, duration=10.0):
+    """
+    Envia pedidos durante `duration` segundos com `concurrency` ligações em
+    paralelo. make_request() devolve os bytes de um pedido HTTP completo.
+    """
+    return asyncio.run(_run(host, port, make_request, concurrency, duration))
+
+
+def http_request(method, path, host="127.0.0.1", cookie=None, body=b"", content_type=None, headers=None):
+    """
+    Bytes de um pedido HTTP/1.1 keep-alive.
+    """
+    lines = ["%s %s HTTP/1.1" % (method, path), "Host: %s" % host, "Connection: keep-alive"]
+    if cookie:
+        lines.append("Cookie: %s" % cookie)
+    for name, value in (headers or {}).items():
+        lines.append("%s: %s" % (name, value))
+    if body or method == "POST":
+        lines.append("Content-Length: %d" % len(body))
+        if content_type:
+            lines.append("Content-Type: %s" % content_type)
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin1") + body
+
+
+def start_server(command, port, env, cwd, timeout=30):
+    """
+    Arranca um servidor em segundo plano e espera até responder em /.
+    """
+    process = subprocess.Popen(command, env=env, cwd=cwd,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen("http://127.0.0.1:%d/" % port, timeout=1).read()
+            return process
+        except OSError:
+            if process.poll() is not None:
+                raise RuntimeError("O servidor terminou ao arrancar: %s" % " ".join(command))
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("O servidor não respondeu a tempo: %s" % " ".join(command))
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def admin_cookie(port):
+    """
+    Inicia sessão no painel de administração e devolve o cookie de sessão.
+    """
+    request = urllib.request.Request("http://127.0.0.1:%d/admin" % port, data=b"password=admin", method="POST")
+
+    class NoRedirect(urllib.request.HTTPRedirectHandler):
+        def redirect_request(self, *args, **kwargs):
+            return None
+
+    opener = urllib.request.build_opener(NoRedirect)
+    try:
+        response = opener.open(request)
+    except urllib.error.HTTPError as redirect:
+        response = redirect
+    return response.headers["Set-Cookie"].split(";")[0]
+
+
+def admin_session(port):
+    """
+    Inicia sessão no painel e devolve (cookie, token CSRF): o token é criado
+    quando o painel é mostrado, e com sessões em cookie o cookie muda.
+    """
+    cookie = admin_cookie(port)
+    request = urllib.request.Request("http://127.0.0.1:%d/admin" % port, headers={"Cookie": cookie})
+    with urllib.request.urlopen(request) as response:
+        html = response.read().decode("utf-8")
+        if response.headers["Set-Cookie"]:
+            cookie = response.headers["Set-Cookie"].split(";")[0]
+    return cookie, re.search(r'name="csrf_token" value="([^"]+)"', html).group(1)
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+# Suite de benchmarks reprodutível da aplicação Flask, sem Firebase.
+#
+# Para cada tamanho de base de dados (por omissão 1k, 10k e 100k pedidos) é
+# criado um store local (SQLite ou JSONL) numa pasta temporária, pré-carregado
+# com pedidos sintéticos gerados com uma semente fixa, e a aplicação é
+# exercitada em processo com o cliente de testes do Flask. Mede-se o débito
+# (pedidos/s) e as latências p50/p99 de:
+#   - GET /              (página em cache)
+#   - POST /             (submissão do formulário, fila de escrita diferida)
+#   - GET /admin         (autenticado, uma página de pedidos)
+#   - GET /pintura       (página em cache)
+#   - POST /admin/bulk   (aceitar e excluir 50 pedidos de cada vez)
+# Cada tamanho corre num processo próprio, porque a configuração do store é
+# lida das variáveis de ambiente ao importar app_v5.
+#
+# Os resultados são gravados em JSON (por omissão benchmarks/results/<commit>.json),
+# com o commit, a versão do Python e a máquina, para comparar entre commits:
+#   python benchmarks/suite.py
+#   python benchmarks/suite.py --sizes 1000 --duration 2 --compare benchmarks/results/<commit>.json
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from datetime import datetime, timedelta, timezone
+
+from httpload import summarize
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+BULK_SIZE = 50
+SERVICES = ("pintura", "remodelacao", "ambos")
+
+
+def synthetic_requests(count, seed):
+    """
+    Pedidos sintéticos reprodutíveis (mesma semente, mesmos pedidos).
+    """
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    for i in range(count):
+        timestamp = start + timedelta(seconds=rng.randrange(2 * 365 * 24 * 3600))
+        yield "bench%07d" % i, {
+            "contact_name": "Cliente %d" % i,
+            "contact_email": "cliente%d@exemplo.pt" % i,
+            "service": SERVICES[i % len(SERVICES)],
+            "description": "Pedido sintético %d: %s" % (i, " ".join(rng.choice(("cozinha", "sala", "quarto", "fachada",
+                                                                               "teto", "parede", "casa de banho"))
+                                                                    for _ in range(12))),
+            "created_at": timestamp.replace(tzinfo=timezone.utc).isoformat(timespec="microseconds"),
+            "timestamp": timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+            "status": rng.choice(("Pendente", "Pendente", "Aceite")),
+            "project_images": [],
+        }
+
+
+def measure(make_client, operation, duration, threads):
+    """
+    Executa `operation(client)` em ciclo durante `duration` segundos, em
+    `threads` threads (cada uma com o seu cliente), e resume as latências.
+    Respostas com código >= 400 contam como erros.
+    """
+    latencies = []
+    counters = {"errors": 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker():
+        client = make_client()
+        local, errors = [], 0
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            status = operation(client)
+            elapsed = time.perf_counter() - started
+            if status >= 400:
+                errors += 1
+            else:
+                local.append(elapsed)
+        with lock:
+            latencies.extend(local)
+            counters["errors"] += errors
+
+    started = time.monotonic()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return summarize(latencies, counters["errors"], time.monotonic() - started)
+
+
+def run_size(docs, duration, threads, seed):
+    """
+    Corre todos os cenários contra o store já configurado no ambiente
+    (executado no processo filho) e devolve os resultados.
+    """
+    import app_v5
+
+    items = list(synthetic_requests(docs, seed))
+    started = time.perf_counter()
+    app_v5.get_store().add_many(items)
+    preload_seconds = time.perf_counter() - started
+    doc_ids = [doc_id for doc_id, _ in items]
+    del items
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+
+    def sample():
+        with rng_lock:
+            return rng.sample(doc_ids, min(BULK_SIZE, len(doc_ids)))
+
+    def anonymous_client():
+        return app_v5.app.test_client()
+
+    def admin_client():
+        client = app_v5.app.test_client()
+        client.post("/admin", data={"password": app_v5.ADMIN_PASSWORD})
+        # Token CSRF da sessão, enviado em todos os pedidos deste cliente
+        client.get("/admin")
+        with client.session_transaction() as session:
+            client.environ_base["HTTP_X_CSRF_TOKEN"] = session[app_v5.CSRF_SESSION_KEY]
+        return client
+
+    form = {
+        "contact_name": "Cliente de teste",
+        "contact_email": "teste@exemplo.pt",
+        "service": "pintura",
+        "description": "Pintura interior de um T2, paredes e tetos.",
+    }
+    scenarios = [
+        ("GET /", anonymous_client, lambda client: client.get("/").status_code),
+        ("POST /", anonymous_client, lambda client: client.post("/", data=form).status_code),
+        ("GET /admin", admin_client, lambda client: client.get("/admin").status_code),
+        ("GET /pintura", anonymous_client, lambda client: client.get("/pintura").status_code),
+        ("POST /admin/bulk accept", admin_client,
+         lambda client: client.post("/admin/bulk", data={"action": "accept", "doc_ids": sample()}).status_code),
+        # Por último: os pedidos excluídos deixam de existir para os outros cenários
+        ("POST /admin/bulk delete", admin_client,
+         lambda client: client.post("/admin/bulk", data={"action": "delete", "doc_ids": sample()}).status_code),
+    ]
+    results = {"docs": docs, "preload_seconds": round(preload_seconds, 3), "routes": {}}
+    for name, make_client, operation in scenarios:
+        measure(make_client, operation, min(duration, 0.5), 1)  # Aquecimento (caches, ligações, JIT do regex)
+        results["routes"][name] = measure(make_client, operation, duration, threads)
+    app_v5.write_queue.close()
+    return results
+
+
+def git_commit():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+        dirty = bool(subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"],
+                                             cwd=ROOT, text=True).strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def run_child(store, docs, args):
+    """
+    Corre um tamanho num processo novo, com um store local numa pasta temporária.
+    """
+    workdir = tempfile.mkdtemp(prefix="probuilder-suite-")
+    env = dict(os.environ,
+               REQUEST_STORE=store,
+               REQUEST_STORE_PATH=os.path.join(workdir, "requests.%s" % ("db" if store == "sqlite" else "jsonl")),
+               REQUEST_STORE_LATENCY_MS=str(args.latency_ms),
+               WRITE_BEHIND_JOURNAL_DIR=os.path.join(workdir, "journal"),
+               UPLOAD_DIR=os.path.join(workdir, "uploads"),
+               # POST / mede o caminho de escrita: sem limite por cliente nem deduplicação
+               FORM_RATE_LIMIT_PER_MINUTE="0",
+               FORM_DEDUPE_WINDOW="0",
+               PYTHONPATH=os.pathsep.join([ROOT, os.path.join(ROOT, "benchmarks")]))
+    command = [sys.executable, os.path.abspath(__file__), "--child", "--store", store, "--sizes", str(docs),
+               "--duration", str(args.duration), "--threads", str(args.threads), "--seed", str(args.seed)]
+    output = subprocess.check_output(command, env=env, cwd=workdir)
+    return json.loads(output.decode("utf-8").strip().splitlines()[-1])
+
+
+def compare(results, baseline_path):
+    """
+    Mostra a variação de débito e de p99 em relação a um ficheiro de resultados anterior.
+    """
+    with open(baseline_path, encoding="utf-8") as handle:
+        baseline = json.load(handle)
+    print("\nComparação com %s (commit %s):" % (baseline_path, baseline.get("commit")))
+    print("%-7s %8s %-26s %12s %12s" % ("store", "pedidos", "rota", "pedidos/s", "p99"))
+    for key, run in results["runs"].items():
+        old_run = baseline.get("runs", {}).get(key)
+        if not old_run:
+            continue
+        for route, stats in run["routes"].items():
+            old = old_run["routes"].get(route)
+            if not old or not old["requests_per_second"] or not old["p99_ms"] or not stats["p99_ms"]:
+                continue
+            throughput = (stats["requests_per_second"] / old["requests_per_second"] - 1) * 100
+            p99 = (stats["p99_ms"] / old["p99_ms"] - 1) * 100
+            print("%-7s %8d %-26s %+11.1f%% %+11.1f%%" % (run["store"], run["docs"], route, throughput, p99))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks da aplicação contra um store local pré-carregado.")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Números de pedidos pré-carregados")
+    parser.add_argument("--stores", default="sqlite", help="Stores locais a testar (sqlite, jsonl)")
+    parser.add_argument("--duration", type=float, default=5.0, help="Segundos por rota")
+    parser.add_argument("--threads", type=int, default=1, help="Clientes em paralelo (threads)")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Latência simulada por operação do store")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", help="Ficheiro JSON de resultados (por omissão benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="Ficheiro JSON de resultados anterior com que comparar")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--store", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    if args.child:
+        result = run_size(sizes[0], args.duration, args.threads, args.seed)
+        result["store"] = args.store
+        print(json.dumps(result))
+        return
+
+    commit, dirty = git_commit()
+    results = {
+        "commit": commit,
+        "dirty": dirty,
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {name: value for name, value in vars(args).items() if name not in ("child", "store")},
+        "runs": {},
+    }
+    print("%-7s %8s %-26s %10s %10s %10s %7s" % ("store", "pedidos", "rota", "pedidos/s", "p50 (ms)", "p99 (ms)", "erros"))
+    for store in args.stores.split(","):
+        for docs in sizes:
+            run = run_child(store, docs, args)
+            results["runs"]["%s-%d" % (store, docs)] = run
+            for route, stats in run["routes"].items():
+                print("%-7s %8d %-26s %10s %10s %10s %7d" % (store, docs, route, stats["requests_per_second"],
+                                                           stats["p50_ms"], stats["p99_ms"], stats["errors"]))
+
+    output = args.output or os.path.join(RESULTS_DIR, "%s%s.json" % (commit or "local", "-dirty" if dirty else ""))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as handle:
+        json.dump(results, handle, indent=2)
+    print("\nResultados gravados em %s" % output)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# Configuração do gunicorn para produção. É lida automaticamente quando o
+# gunicorn arranca na raiz do repositório, ou explicitamente:
+#   gunicorn -c gunicorn.conf.py app_v5:app
+#
+# Os pedidos passam a maior parte do tempo à espera do Firestore (rede), por
+# isso cada worker usa threads (gthread): enquanto uma thread espera, as outras
+# atendem pedidos, sem o custo de memória de um processo por pedido.
+# Com GUNICORN_WORKER_CLASS=gevent, cada worker usa greenlets (o gRPC do
+# Firestore é preparado para o gevent em post_worker_init, sem preload_app);
+# precisa do pacote gevent.
+#
+# Variáveis de ambiente:
+# - PORT: porta (por omissão 5000).
+# - WEB_CONCURRENCY: número de workers (por omissão, um por CPU, no mínimo 2;
+#   2 x CPU + 1 com workers síncronos).
+# - GUNICORN_THREADS: threads por worker gthread (por omissão 8).
+# - GUNICORN_WORKER_CONNECTIONS: ligações por worker gevent (por omissão 200).
+# - GUNICORN_KEEPALIVE: segundos que uma ligação keep-alive fica aberta.
+# - GUNICORN_MAX_REQUESTS: pedidos até o worker ser substituído (0 desativa);
+#   o jitter evita que todos os workers reiniciem ao mesmo tempo.
+# - GUNICORN_GRACEFUL_TIMEOUT: segundos para terminar os pedidos em curso e
+#   esvaziar a fila de escrita diferida antes de o worker ser terminado.
+# Atrás do router da plataforma (ver Procfile) todos os pedidos chegam do mesmo
+# endereço: defina FORM_TRUSTED_PROXIES=1 para que o limite do formulário seja
+# aplicado por visitante (ver app_v5, Controlo de Admissão do Formulário).
+
+import os
+
+CPU_COUNT = os.cpu_count() or 1
+
+bind = "0.0.0.0:%s" % os.environ.get("PORT", "5000")
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+default_workers = CPU_COUNT * 2 + 1 if worker_class == "sync" else max(CPU_COUNT, 2)
+workers = int(os.environ.get("WEB_CONCURRENCY", default_workers))
+threads = int(os.environ.get("GUNICORN_THREADS", "8"))
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", "200"))
+
+# Um pouco acima do tempo de inatividade típico de um proxy à frente (ex.: nginx)
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", "5"))
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", "10000"))
+max_requests_jitter = max_requests // 10
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+
+# A aplicação é importada uma vez no processo principal e partilhada pelos
+# workers (copy-on-write). É seguro: o store e as threads são criados no
+# primeiro uso em cada worker (ver app_v5.get_store). Com ASSETS_BUILD_ON_STARTUP=1,
+# o build dos recursos estáticos também corre só aqui, antes dos workers.
+# Com o gevent não há preload: o worker só aplica o monkey-patching depois do
+# fork (init_process), e as threads, os locks e o gRPC criados antes disso (no
+# processo principal ou nos hooks de fork do app_v5) misturam-se com greenlets
+# e podem bloquear. A aplicação é então importada em cada worker, já com o
+# patching, e o arranque do worker é feito em post_worker_init.
+GEVENT = worker_class == "gevent"
+preload_app = not GEVENT
+
+
+def _start_worker():
+    import app_v5
+    # Reenvia já os diários órfãos de workers anteriores (ver WriteBehindQueue)
+    app_v5.write_queue.start()
+    # Abre as ligações ao armazenamento antes do primeiro pedido (ver /readyz);
+    # com preload e STORE_WARMUP=1, o hook de fork do app_v5 já o fez
+    if GEVENT or not app_v5.STORE_WARMUP:
+        app_v5.start_warm_up()
+
+
+def post_fork(server, worker):
+    if not GEVENT:
+        _start_worker()
+
+
+def post_worker_init(worker):
+    if GEVENT:
+        # O gRPC tem de usar o ciclo do gevent antes de abrir qualquer canal
+        # (o store, e com ele o gRPC, só é criado a seguir, no warm-up)
+        from grpc.experimental import gevent as grpc_gevent
+        grpc_gevent.init_gevent()
+        _start_worker()
+
+
+def worker_exit(server, worker):
+    import app_v5
+    # Grava os pedidos que ainda estão na fila de escrita diferida. Se o worker
+    # for terminado à força, o diário em disco é reenviado no arranque seguinte.
+    app_v5.write_queue.close(timeout=max(graceful_timeout - 5, 1))
@@ -0,0 +1,1502 @@
+# -*- coding: utf-8 -*-
+# Remodelações e Pinturas - Armazenamento dos pedidos
+#
+# As rotas não acedem diretamente ao Firestore: usam um "store" com uma
+# interface comum (RequestStore). Existem três implementações:
+# - firestore: a coleção 'requests' do Firebase (predefinição, produção);
+# - sqlite:    uma base de dados SQLite local, indexada por estado, serviço e data;
+# - jsonl:     um registo local só de acréscimo (append-only) em formato JSONL,
+#              com índices em memória.
+# As implementações locais permitem correr e testar a carga da aplicação sem
+# credenciais do Firebase. A escolha é feita com a variável de ambiente
+# REQUEST_STORE e o ficheiro local com REQUEST_STORE_PATH (ver app_v5.get_store).
+# O arquivo dos pedidos antigos (SegmentArchive) usa a mesma interface.
+# Este módulo não depende do Flask: os stores podem ser usados (e testados)
+# sem a aplicação.
+
+import re
+import os
+import gzip
+import json
+import time
+import uuid
+import base64
+import random
+import bisect
+import sqlite3
+import threading
+import contextlib
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+# O flock só existe em sistemas POSIX; no Windows (desenvolvimento local) é
+# usado o msvcrt (ver lock_file)
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# Limite de operações por WriteBatch imposto pelo Firestore
+FIRESTORE_BATCH_LIMIT = 500
+# Número de WriteBatch enviados em paralelo nas operações em massa
+BULK_WRITE_WORKERS = int(os.environ.get("BULK_WRITE_WORKERS", "4"))
+
+# Datas dos pedidos:
+# - created_at: instante de criação em UTC, um Timestamp nativo no Firestore
+#   (ou texto ISO 8601 em UTC nos stores locais e nos diários); é o campo
+#   usado para ordenar e filtrar por datas;
+# - timestamp: texto "AAAA-MM-DD HH:MM:SS" na hora local (APP_TIMEZONE), só
+#   para mostrar. Os pedidos antigos só têm este campo, interpretado em
+#   APP_TIMEZONE; no Firestore, têm de ser migrados com
+#   `flask migrate-timestamps` para aparecerem na lista.
+APP_TIMEZONE = ZoneInfo(os.environ.get("APP_TIMEZONE", "Europe/Lisbon"))
+DISPLAY_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def lock_file(handle, shared=False, blocking=True):
+    """
+    Bloqueia o ficheiro `handle` entre processos até ser fechado. Com
+    blocking=False, lança OSError se outro processo já o tiver bloqueado.
+    No Windows não há bloqueios partilhados nem espera: só o bloqueio
+    exclusivo sem espera (usado para reconhecer os diários em uso) é aplicado,
+    sobre o primeiro byte; os restantes são ignorados (um único processo).
+    """
+    if fcntl is not None:
+        flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        fcntl.flock(handle, flags if blocking else flags | fcntl.LOCK_NB)
+    elif not blocking:
+        position = handle.tell()
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        handle.seek(position)
+
+
+def format_created_at(value):
+    """
+    Texto ISO 8601 em UTC, de comprimento fixo: a ordem alfabética é a ordem
+    cronológica (usado nos stores locais e nos cursores).
+    """
+    return value.astimezone(timezone.utc).isoformat(timespec="microseconds")
+
+def created_at_of(data):
+    """
+    Instante de criação de um pedido (datetime em UTC), a partir de created_at
+    ou, nos pedidos antigos, do texto timestamp. None se não houver nenhum.
+    """
+    value = data.get("created_at")
+    if isinstance(value, datetime):
+        return value.astimezone(timezone.utc)
+    if isinstance(value, str) and value:
+        return datetime.fromisoformat(value).astimezone(timezone.utc)
+    if data.get("timestamp"):
+        try:
+            local = datetime.strptime(data["timestamp"], DISPLAY_TIMESTAMP_FORMAT)
+        except ValueError:
+            return None
+        return local.replace(tzinfo=APP_TIMEZONE).astimezone(timezone.utc)
+    return None
+
+def order_key(data):
+    """Chave de ordenação de um pedido nos stores locais e nos cursores."""
+    created_at = created_at_of(data)
+    return format_created_at(created_at) if created_at else ""
+
+def json_request(data):
+    """
+    Cópia de um pedido pronta para JSON: created_at passa a texto ISO 8601
+    (e é preenchido a partir de timestamp nos pedidos antigos).
+    """
+    created_at = created_at_of(data)
+    return dict(data, created_at=format_created_at(created_at)) if created_at else data
+
+def json_default(value):
+    # Usado em json.dumps para os campos datetime (created_at)
+    if isinstance(value, datetime):
+        return format_created_at(value)
+    raise TypeError("Tipo não serializável: %r" % type(value))
+
+
+def encode_cursor(data, doc_id):
+    """
+    Codifica a posição de um documento num cursor opaco para usar em URLs.
+    """
+    raw = json.dumps([order_key(data), doc_id])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_cursor(token):
+    """
+    Descodifica um cursor criado por encode_cursor. Devolve None se for inválido.
+    """
+    if not token:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != 2 or not isinstance(values[0], str):
+        return None
+    if values[0]:
+        try:
+            datetime.fromisoformat(values[0])
+        except ValueError:
+            return None  # Cursor de uma versão anterior (ordenado por timestamp)
+    return values
+
+def firestore_cursor(start_after):
+    # Os cursores guardam created_at em texto; o Firestore compara com o Timestamp nativo
+    return [datetime.fromisoformat(start_after[0]), start_after[1]]
+
+def paginate(requests_list, page_size, after=None, before=None):
+    """
+    Transforma o resultado de uma consulta de page_size + 1 pedidos (no sentido
+    inverso, se before) em (pedidos, cursor_seguinte, cursor_anterior).
+    """
+    has_more = len(requests_list) > page_size
+    requests_list = requests_list[:page_size]
+    if before:
+        requests_list.reverse()
+
+    next_cursor = prev_cursor = None
+    if requests_list:
+        first, last = requests_list[0], requests_list[-1]
+        if before:
+            next_cursor = encode_cursor(last, last['id'])
+            prev_cursor = encode_cursor(first, first['id']) if has_more else None
+        else:
+            next_cursor = encode_cursor(last, last['id']) if has_more else None
+            prev_cursor = encode_cursor(first, first['id']) if after else None
+    return requests_list, next_cursor, prev_cursor
+
+def chunked(items, size):
+    """
+    Divide uma lista em blocos de no máximo `size` elementos.
+    """
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+# Campos pesquisáveis por palavra-chave no painel de administração
+SEARCH_FIELDS = ("description", "contact_name", "contact_email")
+MAX_SEARCH_TOKENS = 200
+MAX_QUERY_TOKENS = 10
+
+
+def tokenize(text):
+    """
+    Divide um texto em palavras para pesquisa: minúsculas, sem acentos, com
+    pelo menos 2 caracteres ("João Silva" -> ["joao", "silva"]).
+    """
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(char for char in text if not unicodedata.combining(char)).lower()
+    return [token for token in re.findall(r"[a-z0-9]+", text) if len(token) >= 2]
+
+def request_tokens(data):
+    """
+    Conjunto ordenado de palavras pesquisáveis de um pedido (SEARCH_FIELDS).
+    """
+    tokens = set()
+    for field in SEARCH_FIELDS:
+        tokens.update(tokenize(data.get(field)))
+    return sorted(tokens)[:MAX_SEARCH_TOKENS]
+
+
+class RequestFilters:
+    """
+    Filtros da lista de pedidos do painel: estado, serviço, intervalo de datas
+    (AAAA-MM-DD, inclusivo) e pesquisa por palavras-chave. Todas as palavras
+    da pesquisa têm de aparecer no pedido (nome, email ou descrição).
+    Os stores aplicam os filtros na consulta, com os seus índices.
+    """
+
+    def __init__(self, status=None, service=None, date_from=None, date_to=None, search=None):
+        self.status = status or None
+        self.service = service or None
+        self.date_from = date_from or None
+        self.date_to = date_to or None
+        self.search = (search or "").strip() or None
+        self.tokens = sorted(set(tokenize(self.search)))[:MAX_QUERY_TOKENS]
+
+    @classmethod
+    def from_args(cls, args):
+        """Lê os filtros dos parâmetros do URL; datas inválidas são ignoradas."""
+        dates = {}
+        for name in ("date_from", "date_to"):
+            value = args.get(name) or None
+            try:
+                dates[name] = datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m-%d") if value else None
+            except ValueError:
+                dates[name] = None
+        return cls(status=args.get("status"), service=args.get("service"), search=args.get("q"), **dates)
+
+    def __bool__(self):
+        return bool(self.status or self.service or self.date_from or self.date_to or self.tokens)
+
+    def args(self):
+        """Parâmetros de URL com os filtros ativos (para os links de paginação)."""
+        values = {"status": self.status, "service": self.service, "date_from": self.date_from,
+                  "date_to": self.date_to, "q": self.search}
+        return {name: value for name, value in values.items() if value}
+
+    def created_at_range(self):
+        """
+        Limites de created_at em UTC: (início inclusivo, fim exclusivo), ou None.
+        As datas do filtro são dias em APP_TIMEZONE.
+        """
+        def day_start(value, days=0):
+            day = datetime.strptime(value, "%Y-%m-%d") + timedelta(days=days)
+            return day.replace(tzinfo=APP_TIMEZONE).astimezone(timezone.utc)
+        return (day_start(self.date_from) if self.date_from else None,
+                day_start(self.date_to, days=1) if self.date_to else None)
+
+    def matches(self, data):
+        """Verifica os filtros num pedido já lido (usado quando o índice não chega)."""
+        low, high = self.created_at_range()
+        created_at = created_at_of(data)
+        return ((self.status is None or data.get("status") == self.status)
+                and (self.service is None or data.get("service") == self.service)
+                and (low is None or (created_at is not None and created_at >= low))
+                and (high is None or (created_at is not None and created_at < high))
+                and set(self.tokens) <= set(request_tokens(data)))
+
+
+def firestore_filtered_query(firestore, collection, filters, descending):
+    """
+    Consulta do Firestore ordenada por (created_at, id) com os filtros aplicados
+    no servidor. Os índices compostos necessários estão em firestore.indexes.json
+    (firebase deploy --only firestore:indexes), nos dois sentidos, porque a
+    página anterior é lida por ordem ascendente. A pesquisa usa
+    o campo search_tokens (array-contains), que só aceita uma palavra por
+    consulta: devolve também True se for preciso filtrar as restantes palavras
+    depois da leitura.
+    """
+    query = collection
+    needs_matching = False
+    if filters:
+        if filters.status:
+            query = query.where(filter=firestore.FieldFilter('status', '==', filters.status))
+        if filters.service:
+            query = query.where(filter=firestore.FieldFilter('service', '==', filters.service))
+        low, high = filters.created_at_range()
+        if low:
+            query = query.where(filter=firestore.FieldFilter('created_at', '>=', low))
+        if high:
+            query = query.where(filter=firestore.FieldFilter('created_at', '<', high))
+        if filters.tokens:
+            # A palavra mais longa é, em regra, a mais seletiva
+            token = max(filters.tokens, key=len)
+            query = query.where(filter=firestore.FieldFilter('search_tokens', 'array_contains', token))
+            needs_matching = len(filters.tokens) > 1
+    direction = firestore.Query.DESCENDING if descending else firestore.Query.ASCENDING
+    query = (query.order_by('created_at', direction=direction)
+             .order_by(firestore.FieldPath.document_id(), direction=direction))
+    return query, needs_matching
+
+def firestore_document(doc):
+    """Converte um documento do Firestore num pedido (sem os campos internos)."""
+    request_data = doc.to_dict()
+    request_data.pop('search_tokens', None)
+    request_data['id'] = doc.id
+    return request_data
+
+def firestore_request(data):
+    """
+    Dados de um pedido tal como são gravados no Firestore: created_at como
+    Timestamp nativo e search_tokens (palavras pesquisáveis, para array-contains).
+    """
+    return dict(data, created_at=created_at_of(data), search_tokens=request_tokens(data))
+
+
+# Contadores do resumo do painel: total, por estado, por serviço e por dia
+# (em APP_TIMEZONE). São atualizados na mesma transação que cada escrita de
+# pedidos, pelo que mostrar o resumo não obriga a ler a coleção.
+# No Firestore, cada transação incrementa um de COUNTER_SHARDS documentos
+# (shards) da coleção 'request_counters', escolhido ao acaso, para não exceder
+# o limite de escritas por segundo num único documento; o resumo soma os
+# shards (sempre COUNTER_SHARDS leituras). `flask reconcile-counters` corrige
+# os contadores com consultas de agregação (count()).
+COUNTER_SHARDS = int(os.environ.get("COUNTER_SHARDS", "10"))
+COUNTERS_COLLECTION = "request_counters"
+# Uma transação aceita até 500 escritas: os pedidos e o shard dos contadores
+COUNTED_WRITES_PER_TRANSACTION = 400
+SUMMARY_DAYS = int(os.environ.get("SUMMARY_DAYS", "14"))
+KNOWN_STATUSES = ("Pendente", "Aceite")
+KNOWN_SERVICES = ("pintura", "remodelacao", "ambos")
+
+
+def counter_keys(data):
+    """
+    Contadores a que um pedido pertence: ("total",), ("status", estado),
+    ("service", serviço) e ("day", "AAAA-MM-DD"). Valores desconhecidos
+    (ex.: um serviço inventado no formulário) contam como "outro".
+    """
+    status = data.get("status")
+    service = data.get("service")
+    keys = [("total",),
+            ("status", status if status in KNOWN_STATUSES else "outro"),
+            ("service", service if service in KNOWN_SERVICES else "outro")]
+    created_at = created_at_of(data)
+    if created_at is not None:
+        keys.append(("day", created_at.astimezone(APP_TIMEZONE).strftime("%Y-%m-%d")))
+    return keys
+
+def counter_deltas(old, new):
+    """
+    Variação dos contadores quando um pedido passa de `old` para `new`
+    (None: o pedido não existia / foi removido).
+    """
+    deltas = {}
+    for data, sign in ((old, -1), (new, 1)):
+        if data is not None:
+            for key in counter_keys(data):
+                deltas[key] = deltas.get(key, 0) + sign
+    return {key: delta for key, delta in deltas.items() if delta}
+
+def merge_deltas(total, deltas):
+    for key, delta in deltas.items():
+        total[key] = total.get(key, 0) + delta
+    return total
+
+def nest_counts(flat, since=None):
+    """{("status", "Aceite"): 3, ...} -> {"total": n, "status": {...}, "service": {...}, "day": {...}}"""
+    counts = {"total": 0, "status": {}, "service": {}, "day": {}}
+    for key, value in flat.items():
+        if since and key[0] == "day" and key[1] < since:
+            continue
+        if key == ("total",):
+            counts["total"] += value
+        else:
+            group = counts[key[0]]
+            group[key[1]] = group.get(key[1], 0) + value
+    return counts
+
+def sum_counter_shards(shards):
+    """Soma os documentos (dicionários) dos shards de contadores do Firestore."""
+    flat = {}
+    for shard in shards:
+        for name, value in shard.items():
+            if isinstance(value, dict):
+                for key, count in value.items():
+                    flat[(name, key)] = flat.get((name, key), 0) + count
+            else:
+                flat[(name,)] = flat.get((name,), 0) + value
+    return nest_counts(flat)
+
+def counter_shard_refs(collection):
+    return [collection.document("shard-%02d" % shard) for shard in range(COUNTER_SHARDS)]
+
+def stage_counted_change(transaction, ref, old, op, value=None):
+    """
+    Regista numa transação do Firestore (síncrona ou assíncrona) a alteração
+    de um pedido, dado o seu estado atual `old` (lido na mesma transação):
+    op "add" grava `value`, "status" muda o estado para `value`, "delete"
+    remove-o. Devolve a variação dos contadores, ou None se nada mudou.
+    """
+    if op == "add":
+        transaction.set(ref, firestore_request(value))
+        return counter_deltas(old, value)
+    if old is None:
+        return None  # Pedido inexistente (ex.: já excluído noutro separador)
+    if op == "status":
+        if old.get("status") == value:
+            return None
+        transaction.update(ref, {"status": value})
+        return counter_deltas(old, dict(old, status=value))
+    transaction.delete(ref)
+    return counter_deltas(old, None)
+
+def stage_counter_increments(firestore, transaction, collection, deltas):
+    """Regista na transação os incrementos dos contadores, num shard ao acaso."""
+    if not deltas:
+        return
+    fields = {}
+    for key, delta in deltas.items():
+        if len(key) == 1:
+            fields[key[0]] = firestore.Increment(delta)
+        else:
+            fields.setdefault(key[0], {})[key[1]] = firestore.Increment(delta)
+    shard = collection.document("shard-%02d" % random.randrange(COUNTER_SHARDS))
+    transaction.set(shard, fields, merge=True)
+
+def summary_since(days=SUMMARY_DAYS):
+    """Primeiro dia (AAAA-MM-DD) mostrado no resumo do painel."""
+    return (datetime.now(APP_TIMEZONE).date() - timedelta(days=days - 1)).isoformat()
+
+def dashboard_summary(counts, days=SUMMARY_DAYS):
+    """
+    Dados do resumo do painel: total, contagens por estado e por serviço e
+    pedidos submetidos em cada um dos últimos `days` dias.
+    """
+    today = datetime.now(APP_TIMEZONE).date()
+    status = dict.fromkeys(KNOWN_STATUSES, 0)
+    status.update(counts["status"])
+    service = dict.fromkeys(KNOWN_SERVICES, 0)
+    service.update(counts["service"])
+    recent = [(today - timedelta(days=offset)).isoformat() for offset in range(days - 1, -1, -1)]
+    return {
+        "total": counts["total"],
+        "status": [(name, count) for name, count in status.items() if count or name in KNOWN_STATUSES],
+        "service": [(name, count) for name, count in service.items() if count or name in KNOWN_SERVICES],
+        "days": [(day, counts["day"].get(day, 0)) for day in recent],
+    }
+
+
+class RequestStore:
+    """
+    Interface comum para guardar e consultar pedidos de orçamento.
+    Os pedidos são dicionários; os métodos de leitura devolvem-nos com a chave 'id'.
+
+    A lista é paginada por cursor (keyset pagination): cada página é obtida a
+    partir da posição (created_at, id) do último elemento visto, pelo que só são
+    lidos os documentos dessa página, independentemente do tamanho da coleção.
+    As implementações só têm de fornecer _query_page.
+    """
+
+    def new_id(self):
+        """Gera um ID novo para um pedido, sem aceder ao armazenamento."""
+        return uuid.uuid4().hex
+
+    def add(self, data, doc_id=None):
+        """Guarda um pedido e devolve o seu ID."""
+        doc_id = doc_id or self.new_id()
+        self.add_many([(doc_id, data)])
+        return doc_id
+
+    def add_many(self, items):
+        """Guarda uma lista de (doc_id, dados). Reenviar o mesmo ID substitui o pedido."""
+        raise NotImplementedError
+
+    def get(self, doc_id):
+        """Devolve o pedido com o ID indicado, ou None se não existir."""
+        raise NotImplementedError
+
+    def update_status(self, doc_id, status):
+        """Altera o estado de um pedido. Devolve 0 se o pedido não foi alterado."""
+        return self.bulk_update_status([doc_id], status)
+
+    def delete(self, doc_id):
+        """Remove um pedido. Devolve 0 se o pedido já não existia."""
+        return self.bulk_delete([doc_id])
+
+    def bulk_update_status(self, doc_ids, status):
+        """
+        Altera o estado de vários pedidos. Devolve o número de pedidos
+        alterados: os inexistentes e os que já tinham este estado não contam.
+        """
+        raise NotImplementedError
+
+    def bulk_delete(self, doc_ids):
+        """Remove vários pedidos. Devolve o número de pedidos removidos."""
+        raise NotImplementedError
+
+    def delete_matching(self, status=None, service=None, on_deleted=None):
+        """
+        Remove todos os pedidos com o estado e/ou serviço indicados.
+        Devolve o número de pedidos removidos; on_deleted(doc_ids), se
+        indicado, é chamado com os IDs de cada lote removido.
+        """
+        doc_ids = [data["id"] for data in self.iter_all()
+                   if (status is None or data.get("status") == status)
+                   and (service is None or data.get("service") == service)]
+        count = self.bulk_delete(doc_ids)
+        if on_deleted and doc_ids:
+            on_deleted(doc_ids)
+        return count
+
+    def _query_page(self, descending, start_after, limit, filters=None):
+        """
+        Devolve até `limit` pedidos ordenados por (created_at, id), a começar
+        depois da posição start_after ([created_at em texto, id] ou None), apenas os que
+        correspondem aos filtros (RequestFilters ou None).
+        """
+        raise NotImplementedError
+
+    def iter_all(self, batch_size=500, filters=None):
+        """
+        Percorre todos os pedidos (que correspondem aos filtros), do mais recente
+        para o mais antigo, lendo-os em páginas de batch_size: a memória usada
+        não depende do total.
+        """
+        cursor = None
+        while True:
+            page = self._query_page(True, cursor, batch_size, filters)
+            # O cursor é calculado antes de entregar os pedidos, que quem chama pode alterar
+            last = [order_key(page[-1]), page[-1]["id"]] if page else None
+            yield from page
+            if len(page) < batch_size:
+                return
+            cursor = last
+
+    def warm_up(self):
+        """Prepara as ligações ao armazenamento (ver STORE_WARMUP)."""
+
+    def reindex_search(self):
+        """
+        Reconstrói o índice de pesquisa por palavras-chave dos pedidos já
+        guardados. Devolve o número de pedidos indexados.
+        """
+        return 0
+
+    def counters(self, since=None):
+        """
+        Contadores do resumo do painel (ver counter_keys), no formato de
+        nest_counts, sem percorrer os pedidos. Com since ("AAAA-MM-DD"), os
+        totais diários anteriores a esse dia podem ser omitidos.
+        """
+        raise NotImplementedError
+
+    def reconcile_counters(self, days=30):
+        """
+        Recalcula os contadores a partir dos pedidos e corrige-os. Devolve as
+        correções aplicadas ({chave: variação}).
+        """
+        raise NotImplementedError
+
+    def scan_page(self, after_id, limit, fields=None):
+        """
+        Devolve até `limit` pedidos ordenados por ID, a começar depois de
+        after_id (usado nas migrações). Com `fields`, o store pode devolver
+        apenas esses campos.
+        """
+        raise NotImplementedError
+
+    def update_fields(self, updates):
+        """Altera campos de vários pedidos: {doc_id: {campo: valor}}."""
+        raise NotImplementedError
+
+    def listen(self, callback):
+        """
+        Subscreve alterações em tempo real: callback(alterações), em que cada
+        alteração é um tuplo (tipo, doc_id, dados) com tipo ADDED, MODIFIED ou
+        REMOVED. Devolve uma função para cancelar, ou None se o store não
+        suportar subscrições (nesse caso, quem chama deve fazer polling).
+        """
+        return None
+
+    def list_page(self, page_size, after=None, before=None, filters=None):
+        """
+        Obtém uma página de pedidos, do mais recente para o mais antigo.
+        - after: cursor do último pedido da página anterior (avançar).
+        - before: cursor do primeiro pedido da página seguinte (recuar).
+        - filters: RequestFilters opcional.
+        Devolve (pedidos, cursor_seguinte, cursor_anterior).
+        """
+        # Lê um pedido a mais para saber se existe outra página.
+        # Para recuar, percorre no sentido inverso.
+        if before:
+            requests_list = self._query_page(False, before, page_size + 1, filters)
+        else:
+            requests_list = self._query_page(True, after, page_size + 1, filters)
+        return paginate(requests_list, page_size, after, before)
+
+
+class FirestoreRequestStore(RequestStore):
+    """
+    Pedidos guardados na coleção 'requests' do Firestore.
+    """
+
+    def __init__(self, client, collection='requests', counters_collection=COUNTERS_COLLECTION):
+        from google.cloud import firestore
+        self.firestore = firestore
+        self.client = client
+        self.collection = client.collection(collection)
+        self.counters_collection = client.collection(counters_collection)
+
+    def new_id(self):
+        # O ID é gerado localmente pela biblioteca, sem ida ao servidor
+        return self.collection.document().id
+
+    def _counted_writes(self, changes):
+        """
+        Aplica uma lista de (doc_id, op, valor) (ver stage_counted_change) em
+        transações de até COUNTED_WRITES_PER_TRANSACTION pedidos, enviadas em
+        paralelo: cada transação lê os pedidos, grava-os e incrementa um shard
+        dos contadores. Devolve o número de pedidos alterados.
+        """
+        def commit(chunk):
+            @self.firestore.transactional
+            def run(transaction):
+                refs = [self.collection.document(doc_id) for doc_id, _, _ in chunk]
+                current = {snapshot.id: snapshot.to_dict() for snapshot in transaction.get_all(refs)
+                           if snapshot.exists}
+                deltas, changed = {}, 0
+                for ref, (doc_id, op, value) in zip(refs, chunk):
+                    change = stage_counted_change(transaction, ref, current.get(doc_id), op, value)
+                    if change is not None:
+                        changed += 1
+                        merge_deltas(deltas, change)
+                stage_counter_increments(self.firestore, transaction, self.counters_collection,
+                                         {key: delta for key, delta in deltas.items() if delta})
+                return changed
+            return run(self.client.transaction())
+
+        chunks = list(chunked(list(changes), COUNTED_WRITES_PER_TRANSACTION))
+        if len(chunks) <= 1:
+            return sum(commit(chunk) for chunk in chunks)
+        with ThreadPoolExecutor(max_workers=BULK_WRITE_WORKERS) as executor:
+            return sum(executor.map(commit, chunks))
+
+    def add_many(self, items):
+        # Reenviar um ID (ex.: diário da fila reenviado) substitui o pedido sem o contar duas vezes
+        self._counted_writes([(doc_id, "add", data) for doc_id, data in dict(items).items()])
+
+    def get(self, doc_id):
+        snapshot = self.collection.document(doc_id).get()
+        if not snapshot.exists:
+            return None
+        return firestore_document(snapshot)
+
+    def _commit_chunks(self, doc_ids, operation):
+        """
+        Aplica `operation(batch, referência)` a cada documento, em WriteBatch de
+        até 500 operações enviados em paralelo.
+        """
+        def commit(chunk):
+            batch = self.client.batch()
+            for doc_id in chunk:
+                operation(batch, self.collection.document(doc_id))
+            batch.commit()
+            return len(chunk)
+
+        chunks = list(chunked(list(doc_ids), FIRESTORE_BATCH_LIMIT))
+        if len(chunks) <= 1:
+            return sum(commit(chunk) for chunk in chunks)
+        with ThreadPoolExecutor(max_workers=BULK_WRITE_WORKERS) as executor:
+            return sum(executor.map(commit, chunks))
+
+    def bulk_update_status(self, doc_ids, status):
+        # Pedidos inexistentes ou já com este estado são ignorados
+        return self._counted_writes([(doc_id, "status", status) for doc_id in dict.fromkeys(doc_ids)])
+
+    def bulk_delete(self, doc_ids):
+        return self._counted_writes([(doc_id, "delete", None) for doc_id in dict.fromkeys(doc_ids)])
+
+    def counters(self, since=None):
+        return sum_counter_shards(snapshot.to_dict() for snapshot in
+                                  self.client.get_all(counter_shard_refs(self.counters_collection))
+                                  if snapshot.exists)
+
+    def reconcile_counters(self, days=30):
+        # Valores exatos com consultas de agregação (1 leitura por cada 1000 entradas de índice).
+        # Os contadores e as contagens são lidos no mesmo instante (read_time,
+        # ligeiramente no passado para tolerar o desvio do relógio local): uma
+        # escrita feita durante a reconciliação não entra em nenhum dos dois,
+        # e o seu incremento continua válido por cima da correção.
+        read_time = datetime.now(timezone.utc) - timedelta(seconds=5)
+
+        def count(query):
+            return query.count().get(read_time=read_time)[0][0].value
+
+        def where(query, field, op, value):
+            return query.where(filter=self.firestore.FieldFilter(field, op, value))
+
+        current = sum_counter_shards(snapshot.to_dict() for snapshot in
+                                     self.client.get_all(counter_shard_refs(self.counters_collection),
+                                                         read_time=read_time)
+                                     if snapshot.exists)
+        exact = {("total",): count(self.collection)}
+        for field, known in (("status", KNOWN_STATUSES), ("service", KNOWN_SERVICES)):
+            for value in known:
+                exact[(field, value)] = count(where(self.collection, field, "==", value))
+            exact[(field, "outro")] = exact[("total",)] - sum(exact[(field, value)] for value in known)
+        today = datetime.now(APP_TIMEZONE).date()
+        for offset in range(days):
+            day = today - timedelta(days=offset)
+            start = datetime(day.year, day.month, day.day, tzinfo=APP_TIMEZONE)
+            query = where(where(self.collection, "created_at", ">=", start),
+                          "created_at", "<", start + timedelta(days=1))
+            exact[("day", day.isoformat())] = count(query)
+        flat_current = {("total",): current["total"]}
+        for group in ("status", "service", "day"):
+            flat_current.update({(group, name): value for name, value in current[group].items()})
+        # As correções são aplicadas como incrementos sobre o valor lido em
+        # read_time: as escritas posteriores não se perdem nem contam a dobrar
+        deltas = {key: value - flat_current.get(key, 0) for key, value in exact.items()
+                  if value != flat_current.get(key, 0)}
+
+        @self.firestore.transactional
+        def apply(transaction):
+            stage_counter_increments(self.firestore, transaction, self.counters_collection, deltas)
+        apply(self.client.transaction())
+        return deltas
+
+    def delete_matching(self, status=None, service=None, on_deleted=None):
+        query = self.collection
+        if status:
+            query = query.where(filter=self.firestore.FieldFilter('status', '==', status))
+        if service:
+            query = query.where(filter=self.firestore.FieldFilter('service', '==', service))
+        # Por lotes, ordenados por ID: só um lote de IDs fica em memória, e cada
+        # um é excluído antes de ler o seguinte. select([]) devolve apenas as
+        # referências, sem os campos dos documentos.
+        query = query.select([]).order_by(self.firestore.FieldPath.document_id())
+        count, last_id = 0, None
+        while True:
+            page_query = query.start_after([last_id]) if last_id else query
+            doc_ids = [doc.id for doc in page_query.limit(COUNTED_WRITES_PER_TRANSACTION).stream()]
+            if not doc_ids:
+                return count
+            count += self.bulk_delete(doc_ids)
+            if on_deleted:
+                on_deleted(doc_ids)
+            last_id = doc_ids[-1]
+
+    def _query_page(self, descending, start_after, limit, filters=None):
+        query, needs_matching = firestore_filtered_query(self.firestore, self.collection, filters, descending)
+        requests_list = []
+        while True:
+            page_query = query.start_after(firestore_cursor(start_after)) if start_after else query
+            page = [firestore_document(doc) for doc in page_query.limit(limit).stream()]
+            requests_list.extend(data for data in page if not needs_matching or filters.matches(data))
+            # Com várias palavras, continua a ler até encher a página
+            if not needs_matching or len(requests_list) >= limit or len(page) < limit:
+                return requests_list[:limit]
+            start_after = [order_key(page[-1]), page[-1]["id"]]
+
+    def warm_up(self):
+        # Abre o canal gRPC e obtém o token de acesso antes do primeiro pedido real
+        list(self.collection.limit(1).stream())
+
+    def scan_page(self, after_id, limit, fields=None):
+        query = self.collection.order_by(self.firestore.FieldPath.document_id())
+        if fields:
+            query = query.select(list(fields))
+        if after_id:
+            query = query.start_after([after_id])
+        return [firestore_document(doc) for doc in query.limit(limit).stream()]
+
+    def update_fields(self, updates):
+        return self._commit_chunks(list(updates), lambda batch, ref: batch.update(ref, updates[ref.id]))
+
+    def reindex_search(self):
+        # Acrescenta search_tokens aos pedidos guardados antes da pesquisa existir
+        # (lê por páginas com iter_all, para não manter uma leitura aberta durante minutos)
+        count = 0
+        batch = self.client.batch()
+        for data in self.iter_all():
+            batch.update(self.collection.document(data["id"]), {'search_tokens': request_tokens(data)})
+            count += 1
+            if count % FIRESTORE_BATCH_LIMIT == 0:
+                batch.commit()
+                batch = self.client.batch()
+        if count % FIRESTORE_BATCH_LIMIT:
+            batch.commit()
+        return count
+
+    def listen(self, callback):
+        def on_snapshot(docs, changes, read_time):
+            callback([(change.type.name, change.document.id, change.document.to_dict())
+                      for change in changes])
+        watch = self.collection.on_snapshot(on_snapshot)
+        return watch.unsubscribe
+
+
+class SQLiteRequestStore(RequestStore):
+    """
+    Pedidos guardados numa base de dados SQLite local.
+    Os campos usados em filtros e ordenação têm colunas próprias e índices;
+    o pedido completo é guardado em JSON na coluna 'data'. A pesquisa por
+    palavras-chave usa um índice invertido (tabela request_tokens) e o resumo
+    do painel a tabela request_counters, ambos mantidos na mesma transação
+    que cada escrita.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS requests (
+            id TEXT PRIMARY KEY,
+            created_at TEXT,
+            status TEXT,
+            service TEXT,
+            data TEXT NOT NULL
+        );
+        DROP INDEX IF EXISTS idx_requests_timestamp;
+        DROP INDEX IF EXISTS idx_requests_status;
+        DROP INDEX IF EXISTS idx_requests_service;
+        DROP INDEX IF EXISTS idx_requests_status_service;
+        CREATE INDEX IF NOT EXISTS idx_requests_created_at ON requests (created_at, id);
+        CREATE INDEX IF NOT EXISTS idx_requests_status_created_at ON requests (status, created_at, id);
+        CREATE INDEX IF NOT EXISTS idx_requests_service_created_at ON requests (service, created_at, id);
+        CREATE INDEX IF NOT EXISTS idx_requests_status_service_created_at
+            ON requests (status, service, created_at, id);
+        CREATE TABLE IF NOT EXISTS request_tokens (
+            token TEXT NOT NULL,
+            id TEXT NOT NULL,
+            PRIMARY KEY (token, id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_request_tokens_id ON request_tokens (id);
+        CREATE TABLE IF NOT EXISTS request_counters (
+            kind TEXT NOT NULL,
+            name TEXT NOT NULL,
+            value INTEGER NOT NULL,
+            PRIMARY KEY (kind, name)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(requests)")]
+            if columns and "created_at" not in columns:
+                self._add_created_at(conn)
+            conn.executescript(self.SCHEMA)
+        # Base de dados anterior à pesquisa ou aos contadores: calcula-os a partir dos pedidos
+        if "request_tokens" not in tables:
+            self.reindex_search()
+        if "request_counters" not in tables:
+            self.reconcile_counters()
+
+    def _connect(self):
+        # Uma ligação por thread (e por processo, depois do fork dos workers)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """
+        Transação de escrita. O BEGIN IMMEDIATE obtém o bloqueio de escrita
+        antes das leituras: sem ele, o sqlite3 só abre a transação no primeiro
+        INSERT/UPDATE/DELETE, e dois workers podiam calcular as variações dos
+        contadores a partir das mesmas linhas e aplicá-las as duas.
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            yield conn
+
+    @staticmethod
+    def _add_created_at(conn):
+        # Base de dados anterior a created_at: a coluna timestamp dá lugar a
+        # created_at (UTC), calculado a partir de cada pedido
+        conn.execute("ALTER TABLE requests ADD COLUMN created_at TEXT")
+        rows = conn.execute("SELECT id, data FROM requests").fetchall()
+        conn.executemany("UPDATE requests SET created_at = ?, data = ? WHERE id = ?",
+                         [(order_key(data), json.dumps(json_request(data)), doc_id)
+                          for doc_id, data in ((doc_id, json.loads(raw)) for doc_id, raw in rows)])
+
+    @staticmethod
+    def _row_to_request(row):
+        data = json.loads(row[1])
+        data['id'] = row[0]
+        return data
+
+    @staticmethod
+    def _current(conn, doc_ids):
+        # Estado atual dos pedidos indicados, lido em blocos (limite de parâmetros do SQLite)
+        current = {}
+        for chunk in chunked(list(doc_ids), 500):
+            sql = "SELECT id, data FROM requests WHERE id IN (%s)" % ",".join("?" * len(chunk))
+            current.update((doc_id, json.loads(data)) for doc_id, data in conn.execute(sql, chunk))
+        return current
+
+    @staticmethod
+    def _apply_counts(conn, deltas):
+        conn.executemany("INSERT INTO request_counters (kind, name, value) VALUES (?, ?, ?) "
+                         "ON CONFLICT (kind, name) DO UPDATE SET value = value + excluded.value",
+                         [(key[0], key[1] if len(key) > 1 else "", delta) for key, delta in deltas.items() if delta])
+
+    def add_many(self, items):
+        items = [(doc_id, json_request(data)) for doc_id, data in items]
+        rows = [(doc_id, data.get("created_at"), data.get("status"), data.get("service"), json.dumps(data))
+                for doc_id, data in items]
+        with self._transaction() as conn:
+            current = self._current(conn, [doc_id for doc_id, _ in items])
+            deltas = {}
+            for doc_id, data in items:
+                merge_deltas(deltas, counter_deltas(current.get(doc_id), data))
+                current[doc_id] = data
+            self._apply_counts(conn, deltas)
+            conn.executemany("INSERT OR REPLACE INTO requests (id, created_at, status, service, data) "
+                             "VALUES (?, ?, ?, ?, ?)", rows)
+            conn.executemany("DELETE FROM request_tokens WHERE id = ?", [(doc_id,) for doc_id, _ in items])
+            conn.executemany("INSERT INTO request_tokens (token, id) VALUES (?, ?)",
+                             [(token, doc_id) for doc_id, data in items for token in request_tokens(data)])
+
+    def get(self, doc_id):
+        row = self._connect().execute("SELECT id, data FROM requests WHERE id = ?", (doc_id,)).fetchone()
+        return self._row_to_request(row) if row else None
+
+    def bulk_update_status(self, doc_ids, status):
+        changed = 0
+        deltas = {}
+        with self._transaction() as conn:
+            for doc_id in dict.fromkeys(doc_ids):
+                row = conn.execute("SELECT data FROM requests WHERE id = ?", (doc_id,)).fetchone()
+                if row is None:
+                    continue
+                old = json.loads(row[0])
+                if old.get("status") == status:
+                    continue  # Já tinha este estado (ex.: aceite noutro separador)
+                data = dict(old, status=status)
+                merge_deltas(deltas, counter_deltas(old, data))
+                conn.execute("UPDATE requests SET status = ?, data = ? WHERE id = ?",
+                             (status, json.dumps(data), doc_id))
+                changed += 1
+            self._apply_counts(conn, deltas)
+        return changed
+
+    def bulk_delete(self, doc_ids):
+        params = [(doc_id,) for doc_id in dict.fromkeys(doc_ids)]
+        with self._transaction() as conn:
+            deltas = {}
+            for data in self._current(conn, [doc_id for doc_id, in params]).values():
+                merge_deltas(deltas, counter_deltas(data, None))
+            self._apply_counts(conn, deltas)
+            conn.executemany("DELETE FROM request_tokens WHERE id = ?", params)
+            cursor = conn.executemany("DELETE FROM requests WHERE id = ?", params)
+        return cursor.rowcount
+
+    def delete_matching(self, status=None, service=None, on_deleted=None):
+        clauses, params = [], []
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if service:
+            clauses.append("service = ?")
+            params.append(service)
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        with self._transaction() as conn:
+            doc_ids, deltas = [], {}
+            for doc_id, data in conn.execute("SELECT id, data FROM requests" + where, params):
+                doc_ids.append(doc_id)
+                merge_deltas(deltas, counter_deltas(json.loads(data), None))
+            self._apply_counts(conn, deltas)
+            conn.execute("DELETE FROM request_tokens WHERE id IN (SELECT id FROM requests%s)" % where, params)
+            cursor = conn.execute("DELETE FROM requests" + where, params)
+        if on_deleted and doc_ids:
+            on_deleted(doc_ids)
+        return cursor.rowcount
+
+    def _query_page(self, descending, start_after, limit, filters=None):
+        order = "DESC" if descending else "ASC"
+        clauses, params = [], []
+        if start_after:
+            clauses.append("(created_at, id) %s (?, ?)" % ("<" if descending else ">"))
+            params.extend(start_after)
+        if filters:
+            if filters.status:
+                clauses.append("status = ?")
+                params.append(filters.status)
+            if filters.service:
+                clauses.append("service = ?")
+                params.append(filters.service)
+            low, high = filters.created_at_range()
+            if low:
+                clauses.append("created_at >= ?")
+                params.append(format_created_at(low))
+            if high:
+                clauses.append("created_at < ?")
+                params.append(format_created_at(high))
+            for token in filters.tokens:
+                clauses.append("id IN (SELECT id FROM request_tokens WHERE token = ?)")
+                params.append(token)
+        sql = "SELECT id, data FROM requests"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY created_at %s, id %s LIMIT ?" % (order, order)
+        params.append(limit)
+        return [self._row_to_request(row) for row in self._connect().execute(sql, params)]
+
+    def scan_page(self, after_id, limit, fields=None):
+        rows = self._connect().execute("SELECT id, data FROM requests WHERE id > ? ORDER BY id LIMIT ?",
+                                       (after_id or "", limit))
+        return [self._row_to_request(row) for row in rows]
+
+    def update_fields(self, updates):
+        changed = 0
+        with self._transaction() as conn:
+            for doc_id, fields in updates.items():
+                row = conn.execute("SELECT data FROM requests WHERE id = ?", (doc_id,)).fetchone()
+                if row is None:
+                    continue
+                old = json.loads(row[0])
+                data = json_request(dict(old, **fields))
+                self._apply_counts(conn, counter_deltas(old, data))
+                conn.execute("UPDATE requests SET created_at = ?, status = ?, service = ?, data = ? WHERE id = ?",
+                             (data.get("created_at"), data.get("status"), data.get("service"), json.dumps(data),
+                              doc_id))
+                changed += 1
+        return changed
+
+    def counters(self, since=None):
+        rows = self._connect().execute("SELECT kind, name, value FROM request_counters "
+                                       "WHERE kind != 'day' OR name >= ?", (since or "",))
+        return nest_counts({(kind, name) if kind != "total" else (kind,): value for kind, name, value in rows})
+
+    def reconcile_counters(self, days=30):
+        # Num SQLite local, recalcular tudo é barato: os contadores são substituídos
+        with self._transaction() as conn:
+            exact = {}
+            for (data,) in conn.execute("SELECT data FROM requests"):
+                merge_deltas(exact, counter_deltas(None, json.loads(data)))
+            current = {(kind, name) if kind != "total" else (kind,): value
+                       for kind, name, value in conn.execute("SELECT kind, name, value FROM request_counters")}
+            conn.execute("DELETE FROM request_counters")
+            self._apply_counts(conn, exact)
+        return {key: exact.get(key, 0) - current.get(key, 0) for key in set(exact) | set(current)
+                if exact.get(key, 0) != current.get(key, 0)}
+
+    def reindex_search(self):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM request_tokens")
+            count = 0
+            for doc_id, data in conn.execute("SELECT id, data FROM requests").fetchall():
+                conn.executemany("INSERT INTO request_tokens (token, id) VALUES (?, ?)",
+                                 [(token, doc_id) for token in request_tokens(json.loads(data))])
+                count += 1
+        return count
+
+
+class RequestIndex:
+    """
+    Conjunto de pedidos em memória, com índices por estado, por serviço, por
+    palavra (índice invertido para a pesquisa) e por (created_at, id). Usado
+    pelo store JSONL e pela vista materializada.
+    Não é thread-safe: quem o usa tem de o proteger com um lock.
+    """
+
+    def __init__(self):
+        self.docs = {}
+        self.by_status = {}
+        self.by_service = {}
+        self.by_token = {}
+        self.counts = {}  # Contadores do resumo (ver counter_keys)
+        self.order = []  # Lista ordenada de (order_key, id)
+
+    def __len__(self):
+        return len(self.docs)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.docs
+
+    def get(self, doc_id):
+        data = self.docs.get(doc_id)
+        return dict(data, id=doc_id) if data is not None else None
+
+    def put(self, doc_id, data):
+        if doc_id in self.docs:
+            self.remove(doc_id)
+        self.docs[doc_id] = data
+        merge_deltas(self.counts, counter_deltas(None, data))
+        self.by_status.setdefault(data.get("status"), set()).add(doc_id)
+        self.by_service.setdefault(data.get("service"), set()).add(doc_id)
+        for token in request_tokens(data):
+            self.by_token.setdefault(token, set()).add(doc_id)
+        bisect.insort(self.order, (order_key(data), doc_id))
+
+    def remove(self, doc_id):
+        data = self.docs.pop(doc_id, None)
+        if data is None:
+            return
+        merge_deltas(self.counts, counter_deltas(data, None))
+        self.by_status.get(data.get("status"), set()).discard(doc_id)
+        self.by_service.get(data.get("service"), set()).discard(doc_id)
+        for token in request_tokens(data):
+            ids = self.by_token.get(token)
+            if ids is not None:
+                ids.discard(doc_id)
+                if not ids:
+                    del self.by_token[token]
+        key = (order_key(data), doc_id)
+        position = bisect.bisect_left(self.order, key)
+        if position < len(self.order) and self.order[position] == key:
+            del self.order[position]
+
+    def update(self, doc_id, fields):
+        data = self.docs.get(doc_id)
+        if data is not None:
+            self.put(doc_id, dict(data, **fields))
+
+    def set_status(self, doc_id, status):
+        data = self.docs.get(doc_id)
+        if data is None:
+            return
+        self.by_status.get(data.get("status"), set()).discard(doc_id)
+        merge_deltas(self.counts, counter_deltas(data, dict(data, status=status)))
+        data["status"] = status
+        self.by_status.setdefault(status, set()).add(doc_id)
+
+    def matching(self, status=None, service=None):
+        """IDs dos pedidos com o estado e/ou serviço indicados (usa os índices)."""
+        doc_ids = set(self.docs)
+        if status:
+            doc_ids &= self.by_status.get(status, set())
+        if service:
+            doc_ids &= self.by_service.get(service, set())
+        return list(doc_ids)
+
+    def candidates(self, filters):
+        """
+        IDs que passam nos filtros de estado, serviço e palavras (interseção dos
+        índices, a começar pelo menor), ou None se nenhum destes filtros existir.
+        """
+        sets = []
+        if filters.status:
+            sets.append(self.by_status.get(filters.status, set()))
+        if filters.service:
+            sets.append(self.by_service.get(filters.service, set()))
+        sets.extend(self.by_token.get(token, set()) for token in filters.tokens)
+        if not sets:
+            return None
+        sets.sort(key=len)
+        return sets[0].intersection(*sets[1:])
+
+    def page(self, descending, start_after, limit, filters=None):
+        """Mesma semântica que RequestStore._query_page."""
+        keys, candidates, low, high = self.order, None, None, None
+        if filters:
+            candidates = self.candidates(filters)
+            low, high = (format_created_at(value) if value else None for value in filters.created_at_range())
+            if candidates is not None and len(candidates) * 20 < len(self.order):
+                # Poucos candidatos: ordená-los é mais rápido do que percorrer a lista toda
+                keys = sorted((order_key(self.docs[doc_id]), doc_id) for doc_id in candidates)
+                candidates = None
+        start = bisect.bisect_left(keys, (low,)) if low else 0
+        end = bisect.bisect_left(keys, (high,)) if high else len(keys)
+        if descending:
+            if start_after:
+                end = min(end, bisect.bisect_left(keys, tuple(start_after)))
+            positions = range(end - 1, start - 1, -1)
+        else:
+            if start_after:
+                start = max(start, bisect.bisect_right(keys, tuple(start_after)))
+            positions = range(start, end)
+        requests_list = []
+        for position in positions:
+            if len(requests_list) == limit:
+                break
+            doc_id = keys[position][1]
+            if candidates is None or doc_id in candidates:
+                requests_list.append(dict(self.docs[doc_id], id=doc_id))
+        return requests_list
+
+
+class JSONLRequestStore(RequestStore):
+    """
+    Pedidos guardados num registo local só de acréscimo, uma operação por linha:
+        {"op": "put", "id": ..., "data": {...}}
+        {"op": "status", "id": ..., "status": ...}
+        {"op": "update", "id": ..., "fields": {...}}
+        {"op": "delete", "id": ...}
+    O estado atual é reconstruído em memória, com índices por estado, por
+    serviço e por (created_at, id). Antes de cada operação, o store lê as linhas
+    acrescentadas por outros processos, o que mantém os workers sincronizados.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._index = RequestIndex()
+        self._offset = 0
+        open(self.path, "a").close()
+
+    def _apply(self, entry):
+        if entry["op"] == "put":
+            self._index.put(entry["id"], entry["data"])
+        elif entry["op"] == "status":
+            self._index.set_status(entry["id"], entry["status"])
+        elif entry["op"] == "update":
+            self._index.update(entry["id"], entry["fields"])
+        elif entry["op"] == "delete":
+            self._index.remove(entry["id"])
+
+    def _catch_up(self, handle):
+        # Chamado com o ficheiro bloqueado: aplica as linhas novas desde a última leitura
+        handle.seek(self._offset)
+        for line in handle:
+            if not line.endswith("\n"):
+                break  # Linha incompleta: será lida na próxima vez
+            self._apply(json.loads(line))
+            self._offset += len(line.encode("utf-8"))
+
+    def _read(self):
+        with self._lock, open(self.path, "r", encoding="utf-8") as handle:
+            lock_file(handle, shared=True)
+            self._catch_up(handle)
+
+    def _write(self, entries):
+        with self._lock, open(self.path, "a+", encoding="utf-8") as handle:
+            lock_file(handle)
+            self._catch_up(handle)
+            entries = [entry for entry in entries if entry["op"] == "put" or (
+                entry["id"] in self._index
+                and not (entry["op"] == "status" and self._index.get(entry["id"]).get("status") == entry["status"]))]
+            payload = "".join(json.dumps(entry) + "\n" for entry in entries)
+            handle.seek(0, os.SEEK_END)
+            handle.write(payload)
+            handle.flush()
+            os.fsync(handle.fileno())
+            for entry in entries:
+                self._apply(entry)
+            self._offset += len(payload.encode("utf-8"))
+        return len(entries)
+
+    def add_many(self, items):
+        self._write([{"op": "put", "id": doc_id, "data": json_request(data)} for doc_id, data in items])
+
+    def get(self, doc_id):
+        self._read()
+        with self._lock:
+            return self._index.get(doc_id)
+
+    def bulk_update_status(self, doc_ids, status):
+        # Pedidos inexistentes ou já com este estado são ignorados
+        return self._write([{"op": "status", "id": doc_id, "status": status} for doc_id in dict.fromkeys(doc_ids)])
+
+    def bulk_delete(self, doc_ids):
+        return self._write([{"op": "delete", "id": doc_id} for doc_id in dict.fromkeys(doc_ids)])
+
+    def update_fields(self, updates):
+        return self._write([{"op": "update", "id": doc_id, "fields": json.loads(json.dumps(fields, default=json_default))}
+                            for doc_id, fields in updates.items()])
+
+    def counters(self, since=None):
+        # Mantidos em memória pelo RequestIndex, a partir do registo
+        self._read()
+        with self._lock:
+            return nest_counts(self._index.counts, since)
+
+    def reconcile_counters(self, days=30):
+        # O índice é reconstruído do registo em cada arranque: não há nada a corrigir
+        return {}
+
+    def scan_page(self, after_id, limit, fields=None):
+        self._read()
+        with self._lock:
+            doc_ids = sorted(doc_id for doc_id in self._index.docs if doc_id > (after_id or ""))[:limit]
+            return [self._index.get(doc_id) for doc_id in doc_ids]
+
+    def delete_matching(self, status=None, service=None, on_deleted=None):
+        self._read()
+        with self._lock:
+            doc_ids = self._index.matching(status, service)
+            count = self.bulk_delete(doc_ids)
+        if on_deleted and doc_ids:
+            on_deleted(doc_ids)
+        return count
+
+    def _query_page(self, descending, start_after, limit, filters=None):
+        self._read()
+        with self._lock:
+            return self._index.page(descending, start_after, limit, filters)
+
+
+class SegmentArchive(RequestStore):
+    """
+    Arquivo em segmentos JSONL comprimidos (gzip) numa pasta, um pedido por
+    linha. Cada add_many grava um segmento novo, que nunca mais é alterado.
+    Nada fica em memória entre consultas: cada página percorre os segmentos,
+    do mais recente para o mais antigo, e guarda apenas os `limit` melhores
+    pedidos. Ao lado dos segmentos, um índice SQLite pequeno (index.db) guarda:
+    - os segmentos gravados, com o intervalo de created_at de cada um, o que
+      permite saltar os que não podem ter pedidos da página;
+    - o segmento de cada pedido, para get() ler apenas esse;
+    - os contadores do resumo (tabela request_counters, como no SQLite).
+    Um pedido copiado duas vezes (arquivamento interrompido antes de o excluir
+    do store) conta uma só vez; a cópia anterior fica marcada como substituída.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS segments (name TEXT PRIMARY KEY, low TEXT NOT NULL, high TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS archived (id TEXT PRIMARY KEY, segment TEXT NOT NULL) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS superseded (segment TEXT NOT NULL, id TEXT NOT NULL, PRIMARY KEY (segment, id))
+            WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS request_counters (
+            kind TEXT NOT NULL,
+            name TEXT NOT NULL,
+            value INTEGER NOT NULL,
+            PRIMARY KEY (kind, name)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.index_path = os.path.join(directory, "index.db")
+        self._local = threading.local()
+        with self._transaction() as conn:
+            # Arquivo anterior ao índice: regista os segmentos que já existem
+            if conn.execute("PRAGMA user_version").fetchone()[0] == 0:
+                for name in sorted(name for name in os.listdir(directory) if name.endswith(".jsonl.gz")):
+                    items = [(entry["id"], entry["data"]) for entry in self._read_segment(name)]
+                    if items:
+                        self._register(conn, name, items)
+                conn.execute("PRAGMA user_version = 1")
+
+    def _connect(self):
+        # Uma ligação por thread (e por processo, depois do fork dos workers)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(self.directory, exist_ok=True)
+            conn = sqlite3.connect(self.index_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(self.SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE: dois arquivamentos ao mesmo tempo registam um segmento de cada vez
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            yield conn
+
+    def _read_segment(self, name):
+        try:
+            handle = gzip.open(os.path.join(self.directory, name), "rt", encoding="utf-8")
+        except FileNotFoundError:
+            return
+        with handle:
+            for line in handle:
+                yield json.loads(line)
+
+    def _register(self, conn, name, items):
+        """
+        Regista um segmento gravado: intervalo de created_at, segmento de cada
+        pedido e contadores. Os pedidos que já estavam arquivados noutro
+        segmento substituem essa cópia (e os contadores contam a diferença).
+        """
+        keys = [order_key(data) for _, data in items]
+        conn.execute("INSERT INTO segments (name, low, high) VALUES (?, ?, ?)", (name, min(keys), max(keys)))
+        previous = {}
+        for chunk in chunked([doc_id for doc_id, _ in items], 500):
+            sql = "SELECT id, segment FROM archived WHERE id IN (%s)" % ",".join("?" * len(chunk))
+            previous.update(conn.execute(sql, chunk))
+        old = {}
+        for segment in set(previous.values()):
+            old.update((entry["id"], entry["data"]) for entry in self._read_segment(segment)
+                       if previous.get(entry["id"]) == segment)
+        deltas = {}
+        for doc_id, data in items:
+            merge_deltas(deltas, counter_deltas(old.get(doc_id), data))
+        SQLiteRequestStore._apply_counts(conn, deltas)
+        conn.executemany("INSERT OR IGNORE INTO superseded (segment, id) VALUES (?, ?)",
+                         [(segment, doc_id) for doc_id, segment in previous.items()])
+        conn.executemany("INSERT OR REPLACE INTO archived (id, segment) VALUES (?, ?)",
+                         [(doc_id, name) for doc_id, _ in items])
+
+    def add_many(self, items):
+        if not items:
+            return
+        items = [(doc_id, json.loads(json.dumps(json_request(data), default=json_default))) for doc_id, data in items]
+        os.makedirs(self.directory, exist_ok=True)
+        name = "segment-%s-%d.jsonl.gz" % (datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f"), os.getpid())
+        path = os.path.join(self.directory, name)
+        # O segmento só aparece (os.replace) depois de gravado no disco, e só é
+        # lido depois de registado no índice
+        with gzip.open(path + ".tmp", "wt", encoding="utf-8") as handle:
+            for doc_id, data in items:
+                handle.write(json.dumps({"id": doc_id, "data": data}, ensure_ascii=False) + "\n")
+        with open(path + ".tmp", "rb") as handle:
+            os.fsync(handle.fileno())
+        os.replace(path + ".tmp", path)
+        with self._transaction() as conn:
+            self._register(conn, name, items)
+
+    def get(self, doc_id):
+        row = self._connect().execute("SELECT segment FROM archived WHERE id = ?", (doc_id,)).fetchone()
+        if row is None:
+            return None
+        for entry in self._read_segment(row[0]):
+            if entry["id"] == doc_id:
+                return dict(entry["data"], id=doc_id)
+        return None
+
+    def _query_page(self, descending, start_after, limit, filters=None):
+        conn = self._connect()
+        segments = conn.execute("SELECT name, low, high FROM segments ORDER BY name DESC").fetchall()
+        superseded = set(conn.execute("SELECT segment, id FROM superseded"))
+        low, high = (format_created_at(value) if value else None
+                     for value in filters.created_at_range()) if filters else (None, None)
+        cursor = tuple(start_after) if start_after else None
+        best = []  # Os melhores (order_key, id, dados) até agora, por ordem crescente
+        for name, segment_low, segment_high in segments:
+            # Segmentos sem nenhum pedido no intervalo pedido (ou pior do que os já escolhidos)
+            if (low and segment_high < low) or (high and segment_low >= high):
+                continue
+            if descending:
+                if (cursor and segment_low > cursor[0]) or (len(best) == limit and segment_high < best[0][0]):
+                    continue
+            elif (cursor and segment_high < cursor[0]) or (len(best) == limit and segment_low > best[-1][0]):
+                continue
+            for entry in self._read_segment(name):
+                doc_id, data = entry["id"], entry["data"]
+                key = (order_key(data), doc_id)
+                if cursor and (key >= cursor if descending else key <= cursor):
+                    continue
+                if len(best) == limit and (key <= best[0][:2] if descending else key >= best[-1][:2]):
+                    continue
+                if (name, doc_id) in superseded or (filters and not filters.matches(data)):
+                    continue
+                bisect.insort(best, key + (data,), key=lambda item: item[:2])
+                if len(best) > limit:
+                    best.pop(0 if descending else -1)
+        if descending:
+            best.reverse()
+        return [dict(data, id=doc_id) for _, doc_id, data in best]
+
+    def counters(self, since=None):
+        rows = self._connect().execute("SELECT kind, name, value FROM request_counters "
+                                       "WHERE kind != 'day' OR name >= ?", (since or "",))
+        return nest_counts({(kind, name) if kind != "total" else (kind,): value for kind, name, value in rows})
+
+
+def create_store(kind, path=None):
+    """
+    Cria o store de pedidos indicado pela configuração (REQUEST_STORE).
+    """
+    if kind == "firestore":
+        import firebase_admin
+        from firebase_admin import credentials
+        from google.cloud import firestore
+        try:
+            firebase_app = firebase_admin.get_app()
+        except ValueError:
+            # Certifique-se de que o ficheiro 'firebase-service-account.json' está na mesma pasta.
+            cred = credentials.Certificate('firebase-service-account.json')
+            firebase_app = firebase_admin.initialize_app(cred)
+        # O cliente é criado diretamente (e não com firebase_admin.firestore.client(),
+        # que o guarda na app do Firebase) para que cada processo tenha o seu canal gRPC.
+        client = firestore.Client(credentials=firebase_app.credential.get_credential(),
+                                  project=firebase_app.project_id)
+        return FirestoreRequestStore(client)
+    if kind not in ("sqlite", "jsonl"):
+        raise ValueError("REQUEST_STORE desconhecido: %r (use firestore, sqlite ou jsonl)" % kind)
+    path = path or os.path.join("data", "requests.db" if kind == "sqlite" else "requests.jsonl")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if kind == "sqlite":
+        return SQLiteRequestStore(path)
+    return JSONLRequestStore(path)
+
+
+class SimulatedLatencyStore:
+    """
+    Envolve um store local e acrescenta uma latência fixa a cada operação,
+    para imitar as idas e voltas ao Firestore nos testes de carga
+    (REQUEST_STORE_LATENCY_MS). Não deve ser usado em produção.
+    """
+
+    def __init__(self, inner, latency):
+        self.inner = inner
+        self.latency = latency
+
+    def __getattr__(self, name):
+        attr = getattr(self.inner, name)
+        if not callable(attr) or name == "new_id":
+            return attr
+
+        def delayed(*args, **kwargs):
+            time.sleep(self.latency)
+            return attr(*args, **kwargs)
+        return delayed
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# Os módulos da aplicação estão na raiz do repositório, sem pacote:
+#   python -m pytest -q
+import os
+import sys
+import atexit
+import shutil
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importar app_v5 cria a aplicação (chave secreta, pasta de uploads) e o
+# primeiro pedido arranca a fila de escrita: tudo numa pasta temporária, fora
+# do repositório, e com um store local em vez do Firestore.
+_TEST_DATA_DIR = tempfile.mkdtemp(prefix="probuilder-tests-")
+atexit.register(shutil.rmtree, _TEST_DATA_DIR, ignore_errors=True)
+os.environ.update({
+    "REQUEST_STORE": "sqlite",
+    "REQUEST_STORE_PATH": os.path.join(_TEST_DATA_DIR, "requests.db"),
+    "SECRET_KEY_FILE": os.path.join(_TEST_DATA_DIR, "secret_key"),
+    "SESSION_STORE_PATH": os.path.join(_TEST_DATA_DIR, "sessions.db"),
+    "UPLOAD_DIR": os.path.join(_TEST_DATA_DIR, "uploads"),
+    "WRITE_BEHIND_JOURNAL_DIR": os.path.join(_TEST_DATA_DIR, "write_behind_journal"),
+    "FORM_ADMISSION_STORE_PATH": os.path.join(_TEST_DATA_DIR, "form_admission.db"),
+    "ARCHIVE_DIR": os.path.join(_TEST_DATA_DIR, "archive"),
+    "PROFILE_DIR": os.path.join(_TEST_DATA_DIR, "profiles"),
+})
+os.environ.pop("ASSETS_BUILD_ON_STARTUP", None)
+
+from stores import create_store  # noqa: E402
+
+
+@pytest.fixture(params=["sqlite", "jsonl"])
+def store(request, tmp_path):
+    """Um store local vazio, de cada tipo."""
+    return create_store(request.param, str(tmp_path / ("requests." + ("db" if request.param == "sqlite" else "jsonl"))))
+
+
+def make_request(minutes=0, status="Pendente", service="pintura", description="Pintar a sala"):
+    """Pedido de teste, criado `minutes` minutos depois de 2024-05-01 10:00 UTC."""
+    return {
+        "contact_name": "Ana Silva",
+        "contact_email": "ana@example.com",
+        "service": service,
+        "description": description,
+        "status": status,
+        "created_at": datetime(2024, 5, 1, 10, 0, tzinfo=timezone.utc) + timedelta(minutes=minutes),
+    }
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+# Arquivo em segmentos: páginas lidas dos segmentos, contadores no índice e
+# cópias repetidas de um arquivamento interrompido.
+import gzip
+import json
+import os
+import random
+
+import pytest
+from conftest import make_request
+
+from stores import RequestFilters, SegmentArchive, SQLiteRequestStore, decode_cursor
+
+
+def all_pages(store, page_size, filters=None):
+    """IDs de todas as páginas a avançar, e a recuar a partir da última."""
+    forward, cursor = [], None
+    while True:
+        page, next_cursor, prev_cursor = store.list_page(page_size, after=cursor, filters=filters)
+        forward.extend(data["id"] for data in page)
+        if not next_cursor:
+            break
+        cursor = decode_cursor(next_cursor)
+    backward = [data["id"] for data in page]
+    while prev_cursor:
+        page, _, prev_cursor = store.list_page(page_size, before=decode_cursor(prev_cursor), filters=filters)
+        backward = [data["id"] for data in page] + backward
+    return forward, backward
+
+
+@pytest.fixture
+def archive(tmp_path):
+    return SegmentArchive(str(tmp_path / "archive"))
+
+
+def test_pages_match_an_indexed_store(archive, tmp_path):
+    reference = SQLiteRequestStore(str(tmp_path / "reference.db"))
+    generator = random.Random(7)
+    # Segmentos com intervalos de datas sobrepostos, como num arquivamento por várias regras
+    for segment in range(6):
+        items = [("doc-%d-%d" % (segment, index),
+                  make_request(generator.randrange(0, 60 * 24 * 30),
+                               status=generator.choice(["Pendente", "Aceite"]),
+                               service=generator.choice(["pintura", "ambos"]),
+                               description=generator.choice(["Pintar a sala", "Remodelar a cozinha"])))
+                 for index in range(15)]
+        archive.add_many(items)
+        reference.add_many(items)
+    for filters in (None, RequestFilters(status="Aceite"), RequestFilters(search="cozinha", service="ambos"),
+                    RequestFilters(date_from="2024-05-10", date_to="2024-05-20")):
+        expected = [data["id"] for data in reference.iter_all(filters=filters)]
+        assert all_pages(archive, 7, filters) == (expected, expected)
+    assert archive.counters() == reference.counters()
+
+
+def test_get_reads_only_the_segment_of_the_request(archive):
+    archive.add_many([("a", make_request(0))])
+    archive.add_many([("b", make_request(1))])
+    os.remove(os.path.join(archive.directory, sorted(name for name in os.listdir(archive.directory)
+                                                     if name.endswith(".jsonl.gz"))[0]))
+    assert archive.get("b")["id"] == "b"
+    assert archive.get("a") is None
+    assert archive.get("inexistente") is None
+
+
+def test_repeated_copy_counts_once(archive):
+    # Arquivamento interrompido: o lote volta a ser copiado, entretanto aceite
+    archive.add_many([("a", make_request(0)), ("b", make_request(1))])
+    archive.add_many([("a", make_request(0, status="Aceite"))])
+    counts = archive.counters()
+    assert counts["total"] == 2
+    assert counts["status"] == {"Pendente": 1, "Aceite": 1}
+    page, _, _ = archive.list_page(10)
+    assert [(data["id"], data["status"]) for data in page] == [("b", "Pendente"), ("a", "Aceite")]
+    assert archive.get("a")["status"] == "Aceite"
+
+
+def test_segments_without_index_are_registered(tmp_path):
+    # Arquivo gravado antes de existir o índice
+    directory = tmp_path / "archive"
+    directory.mkdir()
+    with gzip.open(directory / "segment-20240101T000000000000-1.jsonl.gz", "wt", encoding="utf-8") as handle:
+        for minute in range(3):
+            data = make_request(minute)
+            data["created_at"] = data["created_at"].isoformat()
+            handle.write(json.dumps({"id": "doc-%d" % minute, "data": data}) + "\n")
+    archive = SegmentArchive(str(directory))
+    assert archive.counters()["total"] == 3
+    page, _, _ = archive.list_page(10)
+    assert [data["id"] for data in page] == ["doc-2", "doc-1", "doc-0"]
+    # Outro processo a abrir o mesmo arquivo não regista os segmentos outra vez
+    assert SegmentArchive(str(directory)).counters()["total"] == 3
+
+
+def test_unregistered_segment_is_ignored(archive):
+    archive.add_many([("a", make_request(0))])
+    # Segmento gravado por um arquivamento que falhou antes de o registar
+    with gzip.open(os.path.join(archive.directory, "segment-29990101T000000000000-1.jsonl.gz"), "wt") as handle:
+        handle.write(json.dumps({"id": "b", "data": {"status": "Pendente"}}) + "\n")
+    page, _, _ = archive.list_page(10)
+    assert [data["id"] for data in page] == ["a"]
+    assert archive.counters()["total"] == 1
+
+
+def test_archive_requests_moves_old_requests(tmp_path):
+    import app_v5
+
+    store = SQLiteRequestStore(str(tmp_path / "requests.db"))
+    for minute in range(5):
+        store.add(make_request(minute, status="Aceite"), doc_id="old-%d" % minute)
+    archive = SegmentArchive(str(tmp_path / "archive"))
+    moved = app_v5.archive_requests(store, archive, app_v5.archive_rules(accepted_days=30, days=0), batch_size=2)
+    assert moved == 5
+    assert store.counters()["total"] == 0
+    assert archive.counters()["total"] == 5
+    assert len([name for name in os.listdir(archive.directory) if name.endswith(".jsonl.gz")]) == 3
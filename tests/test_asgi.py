@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# Modo ASGI: ciclo de pedido das rotas assíncronas e entrega à aplicação
+# síncrona.
+import asyncio
+import cProfile
+
+import pytest
+
+pytest.importorskip("asgiref")
+
+import app_v5  # noqa: E402
+import asgi  # noqa: E402
+
+
+def scope(method, path, headers=()):
+    return {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": b"",
+        "http_version": "1.1",
+        "headers": [(name.lower().encode("latin1"), value.encode("latin1")) for name, value in headers],
+        "client": ("127.0.0.1", 50000),
+    }
+
+
+@pytest.fixture
+def hooks(monkeypatch):
+    """Regista as respostas vistas pelo after_request e as exceções vistas pelo teardown."""
+    seen = {"after": [], "teardown": []}
+
+    def after(response):
+        seen["after"].append(response.status_code)
+        return response
+
+    monkeypatch.setitem(app_v5.app.after_request_funcs, None,
+                        app_v5.app.after_request_funcs.get(None, []) + [after])
+    monkeypatch.setitem(app_v5.app.teardown_request_funcs, None,
+                        app_v5.app.teardown_request_funcs.get(None, []) + [seen["teardown"].append])
+    return seen
+
+
+def test_unhandled_error_runs_after_request_and_teardown(monkeypatch, hooks):
+    async def failing_view():
+        raise RuntimeError("Firestore indisponível")
+
+    monkeypatch.setitem(asgi.ASYNC_VIEWS, "main.api_list_requests", failing_view)
+    # Um perfilador ativado no before_request tem de ser desativado
+    monkeypatch.setattr(app_v5, "PROFILE_SLOW_REQUESTS_MS", 10 ** 9)
+    response = asyncio.run(asgi.dispatch(scope("GET", "/api/requests")))
+    assert response.status_code == 500
+    assert hooks["after"] == [500]
+    assert len(hooks["teardown"]) == 1
+    assert isinstance(hooks["teardown"][0], RuntimeError)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    profiler.disable()
+
+
+def test_http_errors_run_after_request(monkeypatch, hooks):
+    async def missing_view():
+        app_v5.abort(404)
+
+    monkeypatch.setitem(asgi.ASYNC_VIEWS, "main.api_list_requests", missing_view)
+    response = asyncio.run(asgi.dispatch(scope("GET", "/api/requests")))
+    assert response.status_code == 404
+    assert hooks["after"] == [404]
+    assert hooks["teardown"] == [None]
+
+
+def test_sync_routes_are_not_dispatched(hooks):
+    assert asyncio.run(asgi.dispatch(scope("GET", "/"))) is None
+    # O pedido segue para a aplicação síncrona, que corre os hooks
+    assert hooks == {"after": [], "teardown": []}
+
+
+def test_csrf_protected_form_goes_to_sync_app(hooks):
+    # Sem X-CSRF-Token, o token vem no corpo do formulário, que só a aplicação síncrona lê
+    assert asyncio.run(asgi.dispatch(scope("POST", "/accept_request/abc"))) is None
+    assert hooks == {"after": [], "teardown": []}
+
+
+def test_csrf_header_is_checked_in_async_mode(hooks):
+    response = asyncio.run(asgi.dispatch(scope("POST", "/api/requests/abc/accept",
+                                                headers=[("X-CSRF-Token", "errado")])))
+    assert response.status_code == 403
+    assert hooks["after"] == [403]
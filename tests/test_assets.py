@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# Folha de estilos: CSS crítico de cada página e fontes servidas localmente.
+import os
+import re
+
+import app_v5
+from app_v5 import critical_stylesheet, missing_classes, template_classes
+
+CSS = """@layer properties{@supports (-moz-orient:inline){*,:before{--tw-shadow:0 0 #0000;--tw-scale-x:1}}}\
+@layer theme{:root,:host{--font-sans:Inter, sans-serif;--color-gray-200:oklch(92.8% .006 264.531);\
+--color-red-500:oklch(63.7% .237 25.331);--default-font-family:var(--font-sans)}}\
+@layer base{html{font-family:var(--default-font-family,sans-serif)}}\
+@layer utilities{.shadow{--tw-shadow:0 1px 3px #0000001a;box-shadow:var(--tw-shadow)}\
+.bg-gray-200{background-color:var(--color-gray-200)}.text-red-500{color:var(--color-red-500)}\
+.scale-105{--tw-scale-x:105%;scale:var(--tw-scale-x)}}\
+@property --tw-shadow{syntax:"*";inherits:false;initial-value:0 0 #0000}\
+@property --tw-scale-x{syntax:"*";inherits:false;initial-value:1}"""
+
+
+def stylesheet():
+    with open(app_v5.STYLESHEET, encoding="utf-8") as handle:
+        return handle.read()
+
+
+def test_critical_css_keeps_only_used_variables():
+    critical = critical_stylesheet(CSS, {"shadow", "bg-gray-200"})
+    assert ".shadow{" in critical and ".bg-gray-200{" in critical
+    assert ".text-red-500" not in critical and ".scale-105" not in critical
+    # Variáveis usadas pelas regras, também através de outras variáveis
+    for name in ("--tw-shadow", "--color-gray-200", "--default-font-family", "--font-sans"):
+        assert name + ":" in critical
+    assert "@property --tw-shadow{" in critical
+    for name in ("--color-red-500", "--tw-scale-x"):
+        assert name not in critical
+
+
+def test_critical_css_of_the_pages():
+    css = stylesheet()
+    for page, source in app_v5.TEMPLATES.items():
+        critical = critical_stylesheet(css, template_classes(source.split(app_v5.CRITICAL_CSS_MARKER)[0]))
+        defined = set(re.findall(r"(--[\w-]+):", critical))
+        assert set(re.findall(r"var\((--[\w-]+)", critical)) - defined <= {
+            # Variáveis com valor de recurso no var(), que o tema não define
+            name for name in re.findall(r"var\((--[\w-]+),", critical)}
+        assert len(critical) < len(css) * 0.8, page
+
+
+def test_templates_use_vendored_font_weights():
+    css = stylesheet()
+    assert not missing_classes(css)
+    weights = set(re.findall(r"@font-face{[^}]*font-weight:(\d+)", css))
+    for name in re.findall(r"--font-weight-[\w-]+:(\d+)", css):
+        assert name in weights
+    # Só o subconjunto latino das fontes
+    assert css.count("unicode-range:") == css.count("@font-face")
+    for filename in os.listdir(app_v5.FONTS_DIR):
+        if filename.endswith(".woff2"):
+            assert os.path.getsize(os.path.join(app_v5.FONTS_DIR, filename)) < 40 * 1024
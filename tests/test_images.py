@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# Imagens dos pedidos: miniaturas geradas em segundo plano.
+import logging
+import os
+import time
+import uuid
+
+import pytest
+
+pytest.importorskip("PIL")
+
+from PIL import Image  # noqa: E402
+
+from app_v5 import LocalBlobStore, ThumbnailWorker  # noqa: E402
+
+
+def add_image(blobs, image_id):
+    os.makedirs(blobs._dir(image_id))
+    Image.new("RGB", (800, 600), "white").save(os.path.join(blobs._dir(image_id), "original.png"))
+
+
+def test_missing_images_are_skipped(tmp_path, caplog):
+    blobs = LocalBlobStore(str(tmp_path / "uploads"))
+    worker = ThumbnailWorker(blobs, (320, 320))
+    deleted, kept = uuid.uuid4().hex, uuid.uuid4().hex
+    add_image(blobs, kept)
+    with caplog.at_level(logging.WARNING):
+        # Pedido excluído antes de a miniatura ser gerada
+        worker.submit(deleted)
+        worker.submit(kept)
+        deadline = time.monotonic() + 5
+        while blobs.path(kept, "thumb") is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+    with Image.open(blobs.path(kept, "thumb")) as thumb:
+        assert max(thumb.size) == 320
+    assert blobs.path(deleted, "thumb") is None
+    assert "Imagem %s não encontrada" % deleted in caplog.text
+    assert "Falha ao gerar" not in caplog.text
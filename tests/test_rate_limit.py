@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# Controlo de admissão do formulário: baldes de fichas, submissões repetidas
+# e endereço do cliente atrás de proxies.
+import time
+
+import pytest
+
+import app_v5
+from app_v5 import MemoryAdmissionStore, SQLiteAdmissionStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def admission_store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryAdmissionStore()
+    return SQLiteAdmissionStore(str(tmp_path / "admission.db"))
+
+
+def test_token_bucket(admission_store):
+    # Duas fichas, repostas a uma por segundo
+    assert admission_store.take("1.2.3.4", 1.0, 2, now=100.0) == 0
+    assert admission_store.take("1.2.3.4", 1.0, 2, now=100.0) == 0
+    assert admission_store.take("1.2.3.4", 1.0, 2, now=100.0) == pytest.approx(1.0)
+    assert admission_store.take("1.2.3.4", 1.0, 2, now=100.5) == pytest.approx(0.5)
+    assert admission_store.take("1.2.3.4", 1.0, 2, now=101.0) == 0
+    # Cada cliente tem o seu balde
+    assert admission_store.take("5.6.7.8", 1.0, 2, now=101.0) == 0
+
+
+def test_bucket_refills_up_to_burst(admission_store):
+    for _ in range(2):
+        assert admission_store.take("1.2.3.4", 1.0, 2, now=100.0) == 0
+    # Muito tempo depois, o balde tem apenas `burst` fichas
+    for _ in range(2):
+        assert admission_store.take("1.2.3.4", 1.0, 2, now=1000.0) == 0
+    assert admission_store.take("1.2.3.4", 1.0, 2, now=1000.0) > 0
+
+
+def test_duplicate_submissions(admission_store):
+    assert admission_store.seen("resumo", 600, now=100.0) is False
+    assert admission_store.seen("resumo", 600, now=200.0) is True
+    assert admission_store.seen("outro", 600, now=200.0) is False
+    # Depois da janela, volta a ser aceite
+    assert admission_store.seen("resumo", 600, now=701.0) is False
+    admission_store.forget("resumo")
+    assert admission_store.seen("resumo", 600, now=702.0) is False
+
+
+def test_memory_store_drops_oldest_keys():
+    admission_store = MemoryAdmissionStore(max_keys=2)
+    for key in ("a", "b", "c"):
+        assert admission_store.take(key, 1.0, 1, now=100.0) == 0
+    # "a" foi descartado: volta a ter o balde cheio
+    assert admission_store.take("a", 1.0, 1, now=100.0) == 0
+    assert admission_store.take("c", 1.0, 1, now=100.0) > 0
+
+
+@pytest.fixture
+def rate_limit(monkeypatch):
+    """Limite de uma submissão por minuto, em memória; devolve uma função que configura os proxies."""
+    monkeypatch.setattr(app_v5, "FORM_RATE_LIMIT_PER_MINUTE", 1.0)
+    monkeypatch.setattr(app_v5, "FORM_RATE_LIMIT_BURST", 1)
+    monkeypatch.setattr(app_v5, "admission_store", MemoryAdmissionStore())
+
+    def configure(trusted_proxies=0):
+        monkeypatch.setattr(app_v5, "FORM_TRUSTED_PROXIES", trusted_proxies)
+    configure()
+    return configure
+
+
+def wait_for_client(remote_addr, forwarded=None):
+    headers = {"X-Forwarded-For": forwarded} if forwarded else {}
+    with app_v5.app.test_request_context("/", method="POST", headers=headers,
+                                         environ_base={"REMOTE_ADDR": remote_addr}):
+        return app_v5.rate_limit_wait()
+
+
+def test_rate_limit_by_remote_address(rate_limit):
+    assert wait_for_client("1.2.3.4") == 0
+    assert wait_for_client("1.2.3.4") == pytest.approx(60, abs=1)
+    assert wait_for_client("5.6.7.8") == 0
+
+
+def test_rate_limit_disabled(rate_limit, monkeypatch):
+    monkeypatch.setattr(app_v5, "FORM_RATE_LIMIT_PER_MINUTE", 0)
+    for _ in range(3):
+        assert wait_for_client("1.2.3.4") == 0
+
+
+def test_rate_limit_behind_trusted_proxy(rate_limit):
+    rate_limit(trusted_proxies=1)
+    # O endereço é o acrescentado pelo proxy; o resto de X-Forwarded-For é do cliente
+    assert wait_for_client("10.0.0.1", "9.9.9.9, 1.2.3.4") == 0
+    assert wait_for_client("10.0.0.1", "8.8.8.8, 1.2.3.4") > 0
+    assert wait_for_client("10.0.0.1", "5.6.7.8") == 0
+
+
+def test_rate_limit_ignores_untrusted_forwarded_header(rate_limit):
+    # Atrás de um proxy não declarado, o limite não se aplica
+    for _ in range(3):
+        assert wait_for_client("10.0.0.1", "1.2.3.4") == 0
+
+
+def test_form_returns_429_with_retry_after(rate_limit):
+    client = app_v5.app.test_client()
+    app_v5.admission_store.take("1.2.3.4", 1 / 60, 1, time.time())
+    response = client.post("/", data={}, environ_base={"REMOTE_ADDR": "1.2.3.4"})
+    assert response.status_code == 429
+    assert 59 <= int(response.headers["Retry-After"]) <= 60
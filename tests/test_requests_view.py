@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+# Vista materializada dos pedidos: registo do listener e limite de memória.
+import threading
+import time
+
+from conftest import make_request
+
+from app_v5 import RequestsView
+
+
+class ListeningSource:
+    """Store com subscrições, como o Firestore: guarda o callback e conta os cancelamentos."""
+
+    def __init__(self):
+        self.callbacks = []
+        self.unsubscribed = threading.Event()
+        self.unsubscribe_thread = None
+
+    def listen(self, callback):
+        time.sleep(0.05)  # Dá tempo a outra thread para tentar registar-se também
+        self.callbacks.append(callback)
+        return self.unsubscribe
+
+    def unsubscribe(self):
+        self.unsubscribe_thread = threading.current_thread()
+        self.unsubscribed.set()
+
+
+def test_listener_is_registered_once_per_process():
+    source = ListeningSource()
+    view = RequestsView(lambda: source, max_docs=10, poll_interval=1)
+    threads = [threading.Thread(target=lambda: view.ready) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(source.callbacks) == 1
+
+
+def test_overflow_cancels_the_listener():
+    source = ListeningSource()
+    view = RequestsView(lambda: source, max_docs=2, poll_interval=1)
+    assert not view.ready
+    callback = source.callbacks[0]
+    callback([("ADDED", "a", make_request(0)), ("ADDED", "b", make_request(1))])
+    assert view.ready
+    assert not source.unsubscribed.is_set()
+
+    callback([("ADDED", "c", make_request(2))])
+    assert source.unsubscribed.wait(5)
+    # Cancelado fora da thread do callback, que é a da stream do Firestore
+    assert source.unsubscribe_thread is not threading.current_thread()
+    assert not view.ready
+    assert view.stats()["documents"] == 0
+    callback([("ADDED", "d", make_request(3))])
+    assert view.stats()["documents"] == 0
+
+
+def test_overflow_stops_polling(store):
+    for minute in range(3):
+        store.add(make_request(minute))
+    view = RequestsView(lambda: store, max_docs=2, poll_interval=0.01)
+    view.ready
+    poll_threads = [thread for thread in threading.enumerate() if thread.name == "requests-view"]
+    for thread in poll_threads:
+        thread.join(5)
+        assert not thread.is_alive()
+    stats = view.stats()
+    assert stats["mode"] == "polling"
+    assert stats["overflowed"]
+    assert stats["documents"] == 0
+
+
+def test_polling_view_follows_the_store(store):
+    doc_id = store.add(make_request())
+    view = RequestsView(lambda: store, max_docs=10, poll_interval=0.01)
+    deadline = time.monotonic() + 5
+    while not view.ready and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert view.get(doc_id)["contact_name"] == "Ana Silva"
+    view._stopped.set()
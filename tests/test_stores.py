@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+# Contrato dos stores locais (sqlite e jsonl): contadores, operações em lote
+# e paginação por cursor.
+from conftest import make_request
+
+from stores import JSONLRequestStore, RequestFilters, decode_cursor
+
+
+def test_add_and_get(store):
+    doc_id = store.add(make_request())
+    data = store.get(doc_id)
+    assert data["id"] == doc_id
+    assert data["contact_name"] == "Ana Silva"
+    assert data["created_at"] == "2024-05-01T10:00:00.000000+00:00"
+    assert store.get("inexistente") is None
+
+
+def test_counters_follow_writes(store):
+    first = store.add(make_request(0, service="pintura"))
+    store.add(make_request(1, service="remodelacao"))
+    store.add(make_request(2, service="inventado"))
+    counts = store.counters()
+    assert counts["total"] == 3
+    assert counts["status"] == {"Pendente": 3}
+    assert counts["service"] == {"pintura": 1, "remodelacao": 1, "outro": 1}
+    assert counts["day"] == {"2024-05-01": 3}
+
+    store.update_status(first, "Aceite")
+    assert store.counters()["status"] == {"Pendente": 2, "Aceite": 1}
+
+    store.delete(first)
+    counts = store.counters()
+    assert counts["total"] == 2
+    assert counts["status"].get("Aceite", 0) == 0
+    assert counts["service"].get("pintura", 0) == 0
+    assert store.reconcile_counters() == {}
+
+
+def test_add_with_same_id_replaces(store):
+    store.add(make_request(service="pintura"), doc_id="a")
+    store.add(make_request(service="ambos"), doc_id="a")
+    counts = store.counters()
+    assert counts["total"] == 1
+    assert counts["service"].get("pintura", 0) == 0
+    assert counts["service"]["ambos"] == 1
+
+
+def test_counters_since_omits_older_days(store):
+    store.add(make_request(0))
+    store.add(make_request(60 * 24 * 3))
+    assert store.counters(since="2024-05-02")["day"] == {"2024-05-04": 1}
+    assert store.counters(since="2024-05-02")["total"] == 2
+
+
+def test_bulk_update_status_counts_changed_only(store):
+    ids = [store.add(make_request(minute)) for minute in range(3)]
+    store.update_status(ids[0], "Aceite")
+    # Já aceite, inexistente e repetido não contam
+    assert store.bulk_update_status(ids + ["inexistente", ids[1]], "Aceite") == 2
+    assert store.bulk_update_status(ids, "Aceite") == 0
+    assert store.counters()["status"].get("Aceite") == 3
+
+
+def test_bulk_delete_counts_existing_only(store):
+    ids = [store.add(make_request(minute)) for minute in range(3)]
+    assert store.bulk_delete([ids[0], ids[0], "inexistente"]) == 1
+    assert store.delete(ids[0]) == 0
+    assert store.bulk_delete(ids) == 2
+    assert store.counters()["total"] == 0
+
+
+def test_delete_matching(store):
+    accepted = store.add(make_request(0, status="Aceite", service="pintura"))
+    store.add(make_request(1, status="Aceite", service="ambos"))
+    pending = store.add(make_request(2, status="Pendente", service="pintura"))
+    deleted = []
+    assert store.delete_matching(status="Aceite", service="pintura", on_deleted=deleted.extend) == 1
+    assert deleted == [accepted]
+    assert store.delete_matching(status="Aceite") == 1
+    assert [data["id"] for data in store.iter_all()] == [pending]
+    assert store.counters()["total"] == 1
+
+    calls = []
+    assert store.delete_matching(status="Aceite", on_deleted=calls.append) == 0
+    assert calls == []
+
+
+def test_list_page_cursors(store):
+    ids = [store.add(make_request(minute)) for minute in range(5)]
+    newest_first = ids[::-1]
+
+    page, next_cursor, prev_cursor = store.list_page(2)
+    assert [data["id"] for data in page] == newest_first[:2]
+    assert prev_cursor is None
+
+    page, next_cursor, prev_cursor = store.list_page(2, after=decode_cursor(next_cursor))
+    assert [data["id"] for data in page] == newest_first[2:4]
+    assert prev_cursor is not None
+
+    page, last_next, _ = store.list_page(2, after=decode_cursor(next_cursor))
+    assert [data["id"] for data in page] == newest_first[4:]
+    assert last_next is None
+
+    # Recuar a partir da segunda página devolve a primeira
+    page, _, before_first = store.list_page(2, before=decode_cursor(prev_cursor))
+    assert [data["id"] for data in page] == newest_first[:2]
+    assert before_first is None
+
+
+def test_list_page_with_same_created_at(store):
+    # Pedidos com o mesmo instante: o ID desempata e nenhum se repete ou perde
+    ids = [store.add(make_request(0), doc_id="doc-%d" % index) for index in range(5)]
+    seen, cursor = [], None
+    while True:
+        page, next_cursor, _ = store.list_page(2, after=cursor)
+        seen.extend(data["id"] for data in page)
+        if not next_cursor:
+            break
+        cursor = decode_cursor(next_cursor)
+    assert seen == sorted(ids, reverse=True)
+
+
+def test_list_page_filters(store):
+    store.add(make_request(0, status="Aceite", description="Remodelar a cozinha"))
+    match = store.add(make_request(1, status="Pendente", description="Remodelar a cozinha toda"))
+    store.add(make_request(2, status="Pendente", description="Pintar a fachada"))
+    filters = RequestFilters(status="Pendente", search="cozinha")
+    page, _, _ = store.list_page(10, filters=filters)
+    assert [data["id"] for data in page] == [match]
+
+
+def test_decode_cursor_rejects_invalid_tokens():
+    assert decode_cursor(None) is None
+    assert decode_cursor("não é base64") is None
+    assert decode_cursor("WzEsMl0=") is None  # [1, 2]
+
+
+def test_jsonl_store_reads_writes_from_other_instances(tmp_path):
+    path = str(tmp_path / "requests.jsonl")
+    writer, reader = JSONLRequestStore(path), JSONLRequestStore(path)
+    doc_id = writer.add(make_request())
+    assert reader.get(doc_id)["id"] == doc_id
+    assert reader.update_status(doc_id, "Aceite") == 1
+    assert writer.get(doc_id)["status"] == "Aceite"
+    assert writer.counters()["status"].get("Pendente", 0) == 0
+    assert writer.counters()["status"]["Aceite"] == 1
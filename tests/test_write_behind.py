@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+# Fila de escrita diferida: gravação em lote, reenvio de diários órfãos e
+# novas tentativas de lotes que falharam.
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from write_behind import WriteBehindQueue, WriteQueueFullError
+
+
+class RecordingCommit:
+    """Função de commit que regista os lotes e pode falhar as primeiras `failures` vezes."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.batches = []
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, items):
+        with self.lock:
+            self.calls += 1
+            if self.calls <= self.failures:
+                raise RuntimeError("Firestore indisponível")
+            self.batches.append(list(items))
+
+    @property
+    def saved(self):
+        with self.lock:
+            return {doc_id: data for batch in self.batches for doc_id, data in batch}
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            pytest.fail("Condição não verificada em %s s" % timeout)
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def make_queue(tmp_path):
+    queues = []
+
+    def make(commit, **options):
+        options.setdefault("flush_interval", 0.05)
+        write_queue = WriteBehindQueue(commit, str(tmp_path / "journal"), **options)
+        queues.append(write_queue)
+        return write_queue
+
+    yield make
+    for write_queue in queues:
+        write_queue.close(timeout=5)
+
+
+def test_submitted_requests_are_committed_in_batches(make_queue):
+    commit = RecordingCommit()
+    write_queue = make_queue(commit, batch_size=10)
+    for index in range(5):
+        write_queue.submit("doc-%d" % index, {"n": index})
+    wait_for(lambda: len(commit.saved) == 5)
+    assert all(len(batch) <= 10 for batch in commit.batches)
+    wait_for(lambda: os.path.getsize(write_queue._journal_path) == 0)
+    assert write_queue.depth() == 0
+
+
+def test_close_flushes_pending_requests(make_queue):
+    commit = RecordingCommit()
+    write_queue = make_queue(commit, flush_interval=10)
+    write_queue.submit("a", {"n": 1})
+    write_queue.close(timeout=5)
+    assert commit.saved == {"a": {"n": 1}}
+    with pytest.raises(WriteQueueFullError):
+        write_queue.submit("b", {"n": 2})
+
+
+def test_orphan_journal_is_replayed(make_queue, tmp_path):
+    journal_dir = tmp_path / "journal"
+    journal_dir.mkdir()
+    orphan = journal_dir / "12345-orphan.journal"
+    entries = [
+        {"op": "add", "id": "saved", "data": {"n": 1}},
+        {"op": "add", "id": "pending", "data": {"n": 2}},
+        {"op": "done", "ids": ["saved"]},
+        {"op": "add", "id": "also-pending", "data": {"n": 3}},
+    ]
+    # A última linha ficou a meio: o processo terminou durante a escrita
+    orphan.write_text("".join(json.dumps(entry) + "\n" for entry in entries) + '{"op": "add", "id"')
+
+    commit = RecordingCommit()
+    make_queue(commit).start()
+    wait_for(lambda: not orphan.exists())
+    assert commit.saved == {"pending": {"n": 2}, "also-pending": {"n": 3}}
+
+
+def test_orphan_journal_is_kept_when_replay_fails(make_queue, tmp_path):
+    journal_dir = tmp_path / "journal"
+    journal_dir.mkdir()
+    orphan = journal_dir / "12345-orphan.journal"
+    orphan.write_text(json.dumps({"op": "add", "id": "pending", "data": {"n": 1}}) + "\n")
+
+    commit = RecordingCommit(failures=1)
+    write_queue = make_queue(commit, max_retries=1)
+    write_queue.start()
+    wait_for(lambda: commit.calls == 1)
+    write_queue.close(timeout=5)
+    assert orphan.exists()
+
+    # O processo seguinte reenvia-o
+    commit = RecordingCommit()
+    make_queue(commit).start()
+    wait_for(lambda: not orphan.exists())
+    assert commit.saved == {"pending": {"n": 1}}
+
+
+def test_journal_of_live_queue_is_not_replayed(make_queue):
+    blocked = threading.Event()
+    first = RecordingCommit()
+
+    def slow_commit(items):
+        blocked.wait(5)
+        first(items)
+
+    live = make_queue(slow_commit, batch_size=1)
+    live.submit("live", {"n": 1})
+
+    other = RecordingCommit()
+    make_queue(other).start()
+    time.sleep(0.2)
+    assert other.saved == {}
+    blocked.set()
+    wait_for(lambda: first.saved == {"live": {"n": 1}})
+
+
+def test_failed_batch_is_retried_later(make_queue):
+    commit = RecordingCommit(failures=2)
+    write_queue = make_queue(commit, max_retries=1, retry_backoff_max=0.1)
+    write_queue.submit("a", {"n": 1})
+    wait_for(lambda: commit.calls >= 1)
+    # O lote falhado continua no diário até ser gravado
+    with open(write_queue._journal_path, encoding="utf-8") as journal:
+        assert '"id": "a"' in journal.read()
+    wait_for(lambda: commit.saved == {"a": {"n": 1}})
+    assert commit.calls == 3
+    wait_for(lambda: write_queue.depth() == 0)
+
+
+def test_full_queue_rejects_submissions(make_queue):
+    started, release = threading.Event(), threading.Event()
+    commit = RecordingCommit()
+
+    def blocking_commit(items):
+        started.set()
+        release.wait(5)
+        commit(items)
+
+    write_queue = make_queue(blocking_commit, max_size=1, batch_size=1, enqueue_timeout=0.01)
+    try:
+        write_queue.submit("a", {"n": 1})
+        assert started.wait(5)
+        write_queue.submit("b", {"n": 2})
+        with pytest.raises(WriteQueueFullError):
+            write_queue.submit("c", {"n": 3})
+    finally:
+        release.set()
+    wait_for(lambda: set(commit.saved) == {"a", "b"})
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+# Remodelações e Pinturas - Fila de escrita diferida (write-behind)
+#
+# Fila limitada com diário em disco e uma thread que grava os pedidos em lote
+# (ver a secção "Fila de Escrita Diferida" em app_v5, que a configura com a
+# função de gravação do store). Não depende do Flask nem do store: recebe a
+# função de commit, o que permite testá-la isoladamente.
+
+import os
+import glob
+import json
+import time
+import uuid
+import queue
+import logging
+import threading
+
+from stores import lock_file, json_default
+
+logger = logging.getLogger(__name__)
+
+
+class WriteQueueFullError(Exception):
+    """
+    A fila de escrita diferida está cheia e o pedido não pôde ser aceite.
+    """
+
+
+class WriteBehindQueue:
+    """
+    Fila limitada com diário em disco e uma thread que faz commits em lote.
+    - commit: função que recebe uma lista de (doc_id, dados) e os grava.
+    A thread e o diário são de cada processo: start() é chamado depois do fork
+    de cada worker do gunicorn (post_fork e os.register_at_fork) ou no primeiro
+    pedido, e reenvia logo os diários órfãos, sem esperar por uma submissão.
+    """
+
+    _STOP = object()
+
+    def __init__(self, commit, journal_dir, max_size=1000, batch_size=100,
+                 flush_interval=0.5, enqueue_timeout=2.0, max_retries=5,
+                 retry_backoff_max=300, compact_bytes=1 << 20):
+        self._commit = commit
+        self.journal_dir = journal_dir
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.max_retries = max_retries
+        self.retry_backoff_max = retry_backoff_max
+        self.compact_bytes = compact_bytes
+        self._start_lock = threading.Lock()
+        self._pid = None
+
+    def start(self):
+        """
+        Cria o diário e a thread deste processo (idempotente).
+        """
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            os.makedirs(self.journal_dir, exist_ok=True)
+            self._queue = queue.Queue(maxsize=self.max_size)
+            self._journal_lock = threading.Lock()
+            # Pedidos aceites mas ainda não gravados: doc_id -> dados
+            self._unsaved = {}
+            # Lotes que esgotaram as tentativas: voltam a ser tentados mais tarde
+            self._failed = []
+            self._retry_delay = 0
+            self._retry_at = 0
+            self._compact_at = self.compact_bytes
+            self._closed = False
+            # Nome único por processo: um PID reutilizado depois de um worker
+            # terminar não reabre (nem esvazia) o diário órfão do anterior
+            self._journal_path = os.path.join(self.journal_dir, "%d-%s.journal" % (os.getpid(), uuid.uuid4().hex))
+            self._journal = open(self._journal_path, "a", encoding="utf-8")
+            lock_file(self._journal, blocking=False)
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _append(self, entry):
+        # Chamado sempre com self._journal_lock adquirido
+        self._journal.write(json.dumps(entry, default=json_default) + "\n")
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def submit(self, doc_id, data):
+        """
+        Regista o pedido no diário e coloca-o na fila.
+        Lança WriteQueueFullError se a fila continuar cheia após o tempo de espera.
+        """
+        self.start()
+        if self._closed:
+            raise WriteQueueFullError("A fila de escrita está a encerrar.")
+        with self._journal_lock:
+            self._append({"op": "add", "id": doc_id, "data": data})
+            self._unsaved[doc_id] = data
+        try:
+            self._queue.put((doc_id, data), timeout=self.enqueue_timeout)
+        except queue.Full:
+            self._mark_done([doc_id])
+            raise WriteQueueFullError("A fila de escrita está cheia.")
+
+    def _mark_done(self, doc_ids):
+        with self._journal_lock:
+            self._append({"op": "done", "ids": doc_ids})
+            for doc_id in doc_ids:
+                self._unsaved.pop(doc_id, None)
+            if not self._unsaved:
+                # Nada por gravar: o diário pode ser esvaziado
+                self._journal.truncate(0)
+            elif self._journal.tell() >= self._compact_at:
+                self._compact()
+
+    def _compact(self):
+        """
+        Reescreve o diário só com os pedidos por gravar (chamado com
+        self._journal_lock adquirido), para que não cresça sem limite enquanto
+        houver lotes em falha. O ficheiro novo é bloqueado antes de substituir
+        o antigo, para que nunca pareça órfão a outro processo.
+        """
+        temp_path = self._journal_path + ".tmp"
+        journal = open(temp_path, "w", encoding="utf-8")
+        try:
+            lock_file(journal, blocking=False)
+            for doc_id, data in self._unsaved.items():
+                journal.write(json.dumps({"op": "add", "id": doc_id, "data": data}, default=json_default) + "\n")
+            journal.flush()
+            os.fsync(journal.fileno())
+            os.replace(temp_path, self._journal_path)
+        except BaseException:
+            journal.close()
+            raise
+        self._journal.close()
+        self._journal = journal
+        self._compact_at = max(self.compact_bytes, journal.tell() * 2)
+
+    def _commit_with_retry(self, items):
+        delay = 0.5
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                self._commit(items)
+                return True
+            except Exception:
+                logger.exception("Falha ao gravar %d pedidos (tentativa %d de %d)",
+                                 len(items), attempt, self.max_retries)
+                if attempt < self.max_retries:
+                    time.sleep(delay)
+                    delay = min(delay * 2, 30)
+        return False
+
+    def _commit_batch(self, batch):
+        """
+        Grava um lote; se esgotar as tentativas, guarda-o para voltar a tentar
+        com um intervalo crescente (até retry_backoff_max segundos).
+        """
+        if self._commit_with_retry(batch):
+            self._mark_done([doc_id for doc_id, _ in batch])
+            return True
+        self._failed.append(batch)
+        self._retry_delay = min(max(self._retry_delay * 2, 1), self.retry_backoff_max)
+        self._retry_at = time.monotonic() + self._retry_delay
+        logger.error("%d pedidos por gravar; nova tentativa dentro de %.0f s",
+                     sum(len(failed) for failed in self._failed), self._retry_delay)
+        return False
+
+    def _retry_failed(self):
+        failed, self._failed = self._failed, []
+        for position, batch in enumerate(failed):
+            if not self._commit_batch(batch):
+                self._failed.extend(failed[position + 1:])
+                return
+        self._retry_delay = 0
+
+    def _replay_orphans(self):
+        """
+        Reenvia os pedidos de diários deixados por processos que já terminaram.
+        """
+        for path in glob.glob(os.path.join(self.journal_dir, "*.journal")):
+            if path == self._journal_path:
+                continue
+            try:
+                journal = open(path, "r+", encoding="utf-8")
+            except FileNotFoundError:
+                continue  # Reenviado entretanto por outro processo
+            with journal:
+                try:
+                    lock_file(journal, blocking=False)
+                except OSError:
+                    continue  # Diário de um processo ainda vivo
+                if not os.path.exists(path):
+                    continue
+                pending = {}
+                for line in journal:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Linha incompleta (processo terminou a meio da escrita)
+                    if entry["op"] == "add":
+                        pending[entry["id"]] = entry["data"]
+                    else:
+                        for doc_id in entry["ids"]:
+                            pending.pop(doc_id, None)
+                items = list(pending.items())
+                for start in range(0, len(items), self.batch_size):
+                    if not self._commit_with_retry(items[start:start + self.batch_size]):
+                        break  # Mantém o diário para a próxima tentativa
+                else:
+                    os.remove(path)
+                    if items:
+                        logger.info("Reenviados %d pedidos do diário %s", len(items), path)
+
+    def _run(self):
+        self._replay_orphans()
+        stopping = False
+        while not stopping:
+            if self._failed and time.monotonic() >= self._retry_at:
+                self._retry_failed()
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            if item is self._STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit_batch(batch)
+        if self._failed:
+            # Última tentativa; o que falhar fica no diário e é reenviado
+            # por outro processo (ou no próximo arranque)
+            self._retry_failed()
+
+    def depth(self):
+        """Número de pedidos por gravar neste processo (None se a fila não foi iniciada)."""
+        if self._pid != os.getpid():
+            return None
+        return self._queue.qsize() + sum(len(batch) for batch in self._failed)
+
+    def close(self, timeout=30):
+        """
+        Esvazia a fila e termina a thread (chamado no encerramento do worker).
+        """
+        if self._pid != os.getpid() or self._closed:
+            return
+        self._closed = True
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)